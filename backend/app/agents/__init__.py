@@ -15,6 +15,8 @@ from .workflow import (
     finalizer_image_agent,
     create_story_graph,
     get_story_graph,
+    create_thread_config,
+    warmup_story_graph,
 )
 
 __all__ = [
@@ -34,5 +36,7 @@ __all__ = [
 
     "create_story_graph",
     "get_story_graph",
+    "create_thread_config",
+    "warmup_story_graph",
 ]
 
@@ -1,11 +1,13 @@
 """
 Conversation Layer (Outside Graph)
 """
-from .router import router_agent
+from .router import router_agent, update_memory_summary, worth_speculating
 from .chat import chat_agent
 
 __all__ = [
     "router_agent",
+    "update_memory_summary",
+    "worth_speculating",
     "chat_agent",
 ]
 
@@ -2,14 +2,95 @@
 Router Agent - Conversation management (outside Graph)
 """
 import logging
-from typing import Dict, Any
+import re
+from typing import Dict, Any, Optional
 
 from app.agents.state import StoryState
+from app.core.config import settings
+from app.core.metrics import metrics
 from app.services.ai_services import get_text_generator
 from app.utils import extract_json
 
 logger = logging.getLogger(__name__)
 
+INTENTS = ("story_generate", "chat", "regenerate")
+
+_classified = metrics.counter("router_classifications_total", "Router decisions by tier (local / llm) and intent")
+_local_hit_ratio = metrics.gauge("router_local_hit_ratio", "Share of router decisions made without an LLM call")
+
+# Any of these means the input may ask for a story, so it is never treated as plain chat
+_REQUEST_WORDS = re.compile(
+    r"\b(story|stories|tale|write|create|generate|make|tell|rewrite|change|modify|continue|replace)\b"
+    r"|故事|写|生成|创作|编|讲|改|换|继续|重新",
+    re.IGNORECASE,
+)
+_GREETING = re.compile(
+    r"^\s*((hi|hello|hey|thanks|thank you|good (morning|afternoon|evening|night)|bye)\b"
+    r"|你好|您好|嗨|哈喽|谢谢|早上好|晚上好|再见)",
+    re.IGNORECASE,
+)
+_QUESTION = re.compile(r"[?？]\s*$")
+_NEW_STORY = re.compile(r"\b(new|another|different) (story|tale)\b|新的?故事|另一个故事|换一个故事", re.IGNORECASE)
+# Edit verbs only count next to an explicit part of the story: "I can't change my
+# mind" or "what happens instead?" is left to the LLM
+_MODIFY = re.compile(
+    r"\b(change|modify|rewrite|continue|replace|make)\s+((the|this|that|its|your)\s+)?(\w+\s+)?"
+    r"(story|stories|tale|chapter|chapters|ending|beginning|character|characters|hero|heroine|title|plot)\b"
+    r"|改成|改为|修改|换成|重写|把.+改|继续(写|讲|编|这个故事|故事)",
+    re.IGNORECASE,
+)
+
+
+def _is_small_talk(user_input: str) -> bool:
+    """Greeting or question that doesn't ask for a story"""
+    if _REQUEST_WORDS.search(user_input):
+        return False
+    return bool(_GREETING.search(user_input) or _QUESTION.search(user_input))
+
+
+def worth_speculating(user_input: str, current_summary: Optional[str]) -> bool:
+    """True if routing this input will wait on the LLM and it may still be a story request"""
+    user_input = (user_input or "").strip()
+    if not user_input or _is_small_talk(user_input):
+        return False
+    return not settings.ROUTER_FAST_PATH or classify_locally(user_input, (current_summary or "").strip()) is None
+
+
+def classify_locally(user_input: str, current_summary: str) -> Optional[str]:
+    """Decide the intent from obvious surface cues, or None if the LLM must decide
+
+    Order matters: plain chat first, then a session without a summary (nothing
+    to modify yet, so any request is a new story), then explicit new-story or
+    edit phrasing against the current story.
+    """
+    if _is_small_talk(user_input):
+        return "chat"
+    if not current_summary:
+        return "story_generate"
+    if _QUESTION.search(user_input):
+        return None
+    if _NEW_STORY.search(user_input):
+        return "story_generate"
+    if _MODIFY.search(user_input):
+        return "regenerate"
+    return None
+
+
+def _local_summary(intent: str, user_input: str, current_summary: str) -> str:
+    """Fold the input into the summary without an LLM: requests are facts, chat is not"""
+    if intent == "chat":
+        return current_summary
+    if intent == "story_generate":
+        return user_input
+    return f"{current_summary}\n{user_input}" if current_summary else user_input
+
+
+def _record(tier: str, intent: str):
+    _classified.inc(tier=tier, intent=intent)
+    local = sum(_classified.value(tier="local", intent=i) for i in INTENTS)
+    total = local + sum(_classified.value(tier="llm", intent=i) for i in INTENTS)
+    _local_hit_ratio.set(local / total)
+
 
 async def router_agent(state: StoryState) -> Dict[str, Any]:
     user_input = state.get("theme", "").strip()
@@ -21,13 +102,23 @@ async def router_agent(state: StoryState) -> Dict[str, Any]:
             "memory_summary": current_summary
         }
     
+    if settings.ROUTER_FAST_PATH:
+        intent = classify_locally(user_input, current_summary)
+        if intent is not None:
+            logger.debug(f"Router fast path: {intent}")
+            _record("local", intent)
+            return {
+                "intent": intent,
+                "memory_summary": _local_summary(intent, user_input, current_summary)
+            }
+    
     prompt = f"""You are a router agent. Your PRIMARY goal is to ACCURATELY determine what the user wants to do based on their input.
 
     === Input ===
     User input: {user_input}
     Current summary: {current_summary or "(No previous summary)"}
 
-    === Task 1: Intent Classification ===
+    === Task: Intent Classification ===
     CRITICAL: You must ACCURATELY analyze the user's CURRENT input to determine their true intent.
     - Read the user input CAREFULLY and understand what they are actually asking for
     - Pay attention to keywords, context, and explicit requests
@@ -88,18 +179,10 @@ async def router_agent(state: StoryState) -> Dict[str, Any]:
     - Only choose "chat" if the user is clearly asking a question, having a conversation, or NOT requesting story generation/modification.
     - Be ACCURATE: If the user wants to create a story (even with minimal input), choose "story_generate". If they want to modify, choose "regenerate". If they're just chatting, choose "chat".
 
-    === Task 2: Summary Update ===
-    Based on current summary and user input, generate updated summary:
-    1. Extract new factual information NOT already in current summary
-    2. Add only truly new information
-    3. Keep the summary concise and under 500 words
-    4. If the input is only a question or generic chat, the summary may remain unchanged
-
     === Output Format ===
     Return ONLY JSON:
     {{
-        "intent": "story_generate" | "chat" | "regenerate",
-        "memory_summary": "updated summary based on current summary + new info from user input"
+        "intent": "story_generate" | "chat" | "regenerate"
     }}"""
     
     try:
@@ -107,22 +190,22 @@ async def router_agent(state: StoryState) -> Dict[str, Any]:
         response = await text_generator.generate(
             prompt=prompt,
             temperature=0.1,
-            max_tokens=2000,
+            max_tokens=50,
             response_format={"type": "json_object"}
         )
         result = extract_json(response)
         intent = result.get("intent", "chat")
-        summary = result.get("memory_summary", current_summary)
         
         # Validate intent, default to "chat" if invalid (safer default)
-        valid_intents = ["story_generate", "chat", "regenerate"]
-        if intent not in valid_intents:
+        if intent not in INTENTS:
             logger.warning(f"Invalid intent '{intent}', defaulting to 'chat'")
             intent = "chat"
         
+        _record("llm", intent)
+        # The summary is refreshed separately by update_memory_summary
         return {
             "intent": intent,
-            "memory_summary": summary
+            "memory_summary": current_summary
         }
     except Exception as e:
         logger.error(f"Router error: {e}")
@@ -130,3 +213,48 @@ async def router_agent(state: StoryState) -> Dict[str, Any]:
             "intent": "chat",
             "memory_summary": current_summary
         }
+
+
+async def update_memory_summary(user_input: str, current_summary: Optional[str]) -> str:
+    """Fold new facts from the user input into the memory summary
+
+    Split from intent classification so the (long) summary output never
+    delays routing; callers run it in the background.
+    """
+    user_input = (user_input or "").strip()
+    current_summary = (current_summary or "").strip()
+    if not user_input:
+        return current_summary
+    
+    prompt = f"""You maintain the long-term memory summary of a children's story conversation.
+
+    === Input ===
+    User input: {user_input}
+    Current summary: {current_summary or "(No previous summary)"}
+
+    === Task: Summary Update ===
+    Based on current summary and user input, generate updated summary:
+    1. Extract new factual information NOT already in current summary
+    2. Add only truly new information
+    3. Keep the summary concise and under 500 words
+    4. If the input is only a question or generic chat, the summary may remain unchanged
+
+    === Output Format ===
+    Return ONLY JSON:
+    {{
+        "memory_summary": "updated summary based on current summary + new info from user input"
+    }}"""
+    
+    try:
+        text_generator = get_text_generator()
+        response = await text_generator.generate(
+            prompt=prompt,
+            temperature=0.1,
+            max_tokens=2000,
+            response_format={"type": "json_object"}
+        )
+        summary = extract_json(response).get("memory_summary")
+        return summary.strip() if isinstance(summary, str) and summary.strip() else current_summary
+    except Exception as e:
+        logger.error(f"Summary update error: {e}")
+        return current_summary
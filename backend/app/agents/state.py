@@ -4,6 +4,8 @@ LangGraph state definition for story generation workflow
 import operator
 from typing import TypedDict, List, Optional, Dict, Any, Annotated
 
+from app.core.config import settings
+
 
 class StoryState(TypedDict):
     """ Conversation Layer """
@@ -13,6 +15,8 @@ class StoryState(TypedDict):
     # Router Agent
     intent: Optional[str]
     memory_summary: Optional[str]
+    # Summary the session had before this message (memory_summary already includes the message)
+    session_summary: Optional[str]
     
     """ Workflow Layer """
     # Planner Agent
@@ -26,10 +30,29 @@ class StoryState(TypedDict):
     chapters: Annotated[List[Dict[str, Any]], operator.add]
     completed_writers: Annotated[List[int], operator.add]
     completed_image_gens: Annotated[List[int], operator.add]
+    # Chapter ids whose text or image was reused from previous_story
+    reused_chapters: Annotated[List[int], operator.add]
     
     # Finalizer Agents
     finalized_text: Optional[Dict[str, Any]]
     finalized_images: Optional[Dict[str, Any]]
     
+    # Regenerate: outline and finalized chapters of the story being modified
+    previous_story: Optional[Dict[str, Any]]
+    # Planner output computed while the router was running (see SpeculativePlanner)
+    speculative_plan: Optional[Dict[str, Any]]
+    
     # System
-    session_id: str
\ No newline at end of file
+    session_id: str
+
+
+class ChapterTask(StoryState):
+    """Per-chapter input sent to writer / illustrator tasks on fan-out"""
+    chapter_id: int
+
+
+def chapter_ids(state: StoryState) -> List[int]:
+    """Chapter ids of the planned outline, in order"""
+    outline = state.get("story_outline") or {}
+    ids = sorted({ch["chapter_id"] for ch in outline.get("chapters", []) if "chapter_id" in ch})
+    return ids or list(range(1, settings.STORY_CHAPTER_COUNT + 1))
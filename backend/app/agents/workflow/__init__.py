@@ -2,10 +2,13 @@
 Workflow Layer (Inside Graph)
 """
 from .planner import planner_agent
-from .writer import writer_agent
+from .writer import writer_agent, current_chapter_stream
 from .illustrator import illustrator_agent
 from .finalizer import finalizer_text_agent, finalizer_image_agent
-from .graph import create_story_graph, get_story_graph
+from .barrier import add_barrier, add_fanout
+from .graph import create_story_graph, get_story_graph, create_thread_config, warmup_story_graph
+from .speculation import SpeculativePlanner
+from .prefetch import ChapterPrefetch, current_prefetch
 
 __all__ = [
     
@@ -19,5 +22,13 @@ __all__ = [
     # Story Graph
     "create_story_graph",
     "get_story_graph",
+    "create_thread_config",
+    "warmup_story_graph",
+    "add_barrier",
+    "add_fanout",
+    "SpeculativePlanner",
+    "ChapterPrefetch",
+    "current_prefetch",
+    "current_chapter_stream",
 ]
 
@@ -0,0 +1,47 @@
+"""
+Barrier - N-way join primitive for the story workflow
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Union
+
+from langgraph.graph import StateGraph, END
+from langgraph.types import Send
+
+from app.agents.state import StoryState
+
+
+def add_barrier(workflow: StateGraph, sources: Sequence[str], target: str):
+    """Run target exactly once, after every source node has finished
+
+    Backed by a LangGraph waiting edge: the join is tracked in a barrier
+    channel, so no polling node or extra superstep is needed per branch.
+    """
+    sources = list(sources)
+    if not sources:
+        raise ValueError(f"Barrier into {target} needs at least one source")
+    if len(sources) == 1:
+        workflow.add_edge(sources[0], target)
+    else:
+        workflow.add_edge(sources, target)
+
+
+def add_fanout(
+    workflow: StateGraph,
+    source: str,
+    nodes: Sequence[str],
+    tasks: Callable[[StoryState], Iterable[Dict[str, Any]]],
+    should_stop: Optional[Callable[[StoryState], bool]] = None,
+):
+    """Send one task per item to each node in the superstep after source, or end the run
+
+    Each task gets the current state merged with its item, so the number of
+    parallel tasks follows the data (e.g. one per chapter) instead of the graph.
+    """
+    nodes = list(nodes)
+
+    def route(state: StoryState) -> Union[str, List[Send]]:
+        if should_stop and should_stop(state):
+            return END
+        items = list(tasks(state))
+        return [Send(node, {**state, **item}) for node in nodes for item in items]
+
+    workflow.add_conditional_edges(source, route, [END, *nodes])
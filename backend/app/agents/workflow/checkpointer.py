@@ -0,0 +1,187 @@
+"""
+Checkpointer for the story workflow - bounded in-memory store
+
+Checkpoints are scratch state of a single run: each run gets its own thread
+(create_thread_config) and drops it when it ends (story.py _release_thread).
+Nothing is resumed from them; what outlives a run is the session state saved
+by session_store.
+"""
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Optional, Sequence, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _ThreadUsage:
+    """Memory accounting for a single checkpoint thread"""
+    size: int = 0
+    touched: float = field(default_factory=time.monotonic)
+    blob_keys: Set[tuple] = field(default_factory=set)
+    write_keys: Set[tuple] = field(default_factory=set)
+
+
+def _typed_size(value: Tuple[str, bytes]) -> int:
+    return len(value[0]) + len(value[1])
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """In-memory checkpointer with LRU/TTL eviction and a byte budget.
+
+    Threads are evicted whole: expired threads first, then least recently
+    used ones until the store fits in max_bytes and max_threads. The thread
+    being written is never evicted by its own write.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_bytes: int,
+        ttl_seconds: Optional[float] = None,
+        max_threads: Optional[int] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.total_bytes = 0
+        self.evictions = 0
+        self._usage: "OrderedDict[str, _ThreadUsage]" = OrderedDict()
+
+    def _touch(self, thread_id: str) -> _ThreadUsage:
+        usage = self._usage.get(thread_id)
+        if usage is None:
+            usage = self._usage[thread_id] = _ThreadUsage()
+        usage.touched = time.monotonic()
+        self._usage.move_to_end(thread_id)
+        return usage
+
+    def _is_expired(self, usage: _ThreadUsage, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - usage.touched > self.ttl_seconds
+
+    def _evict(self, protect: Optional[str] = None):
+        now = time.monotonic()
+        for thread_id, usage in list(self._usage.items()):
+            if thread_id != protect and self._is_expired(usage, now):
+                self._evict_thread(thread_id)
+
+        for thread_id in list(self._usage.keys()):
+            over_bytes = self.total_bytes > self.max_bytes
+            over_threads = self.max_threads is not None and len(self._usage) > self.max_threads
+            if not (over_bytes or over_threads):
+                break
+            if thread_id != protect:
+                self._evict_thread(thread_id)
+
+    def _evict_thread(self, thread_id: str):
+        self.delete_thread(thread_id)
+        self.evictions += 1
+        logger.debug(f"Evicted checkpoint thread {thread_id}")
+
+    def _check_expired(self, config: Optional[RunnableConfig]):
+        if not config:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        usage = self._usage.get(thread_id)
+        if usage is not None and self._is_expired(usage, time.monotonic()):
+            self._evict_thread(thread_id)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self._check_expired(config)
+        result = super().get_tuple(config)
+        if result is not None:
+            self._touch(config["configurable"]["thread_id"])
+        return result
+
+    def list(self, config: Optional[RunnableConfig], **kwargs: Any):
+        self._check_expired(config)
+        return super().list(config, **kwargs)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        result = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        usage = self._touch(thread_id)
+
+        added = 0
+        for k, v in new_versions.items():
+            key = (thread_id, checkpoint_ns, k, v)
+            if key not in usage.blob_keys:
+                usage.blob_keys.add(key)
+                added += _typed_size(self.blobs[key])
+        saved_checkpoint, saved_metadata, _ = self.storage[thread_id][checkpoint_ns][checkpoint["id"]]
+        added += _typed_size(saved_checkpoint) + _typed_size(saved_metadata)
+
+        usage.size += added
+        self.total_bytes += added
+        self._evict(protect=thread_id)
+        return result
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        outer_key = (thread_id, checkpoint_ns, config["configurable"]["checkpoint_id"])
+        before = self._writes_size(outer_key)
+        super().put_writes(config, writes, task_id, task_path)
+
+        usage = self._touch(thread_id)
+        usage.write_keys.add(outer_key)
+        added = self._writes_size(outer_key) - before
+        usage.size += added
+        self.total_bytes += added
+        self._evict(protect=thread_id)
+
+    def _writes_size(self, outer_key: tuple) -> int:
+        outer_writes = self.writes.get(outer_key)
+        if not outer_writes:
+            return 0
+        return sum(_typed_size(value) for _, _, value, _ in outer_writes.values())
+
+    def delete_thread(self, thread_id: str) -> None:
+        usage = self._usage.pop(thread_id, None)
+        if usage is None:
+            super().delete_thread(thread_id)
+            return
+        self.storage.pop(thread_id, None)
+        for key in usage.write_keys:
+            self.writes.pop(key, None)
+        for key in usage.blob_keys:
+            self.blobs.pop(key, None)
+        self.total_bytes -= usage.size
+
+
+def create_checkpointer() -> BaseCheckpointSaver:
+    """Create story workflow checkpointer from settings"""
+    return BoundedMemorySaver(
+        max_bytes=settings.CHECKPOINT_MAX_BYTES,
+        ttl_seconds=settings.CHECKPOINT_TTL_SECONDS,
+        max_threads=settings.CHECKPOINT_MAX_THREADS,
+    )
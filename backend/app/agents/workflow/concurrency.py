@@ -0,0 +1,29 @@
+"""
+Concurrency - Per-stage limits for fanned-out workflow tasks
+"""
+import asyncio
+import weakref
+from typing import Dict
+
+from app.core.config import settings
+
+# Semaphores are bound to the loop they are first used on
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+
+def _stage_limit(stage: str) -> int:
+    limits = {
+        "writer": settings.WRITER_MAX_CONCURRENCY,
+        "illustrator": settings.ILLUSTRATOR_MAX_CONCURRENCY,
+    }
+    if stage not in limits:
+        raise ValueError(f"Unknown workflow stage: {stage}")
+    return max(1, limits[stage])
+
+
+def stage_semaphore(stage: str) -> asyncio.Semaphore:
+    """Get the process-wide semaphore bounding concurrent tasks of a stage"""
+    per_loop = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    if stage not in per_loop:
+        per_loop[stage] = asyncio.Semaphore(_stage_limit(stage))
+    return per_loop[stage]
@@ -0,0 +1,63 @@
+"""
+Outline diff - Decides which chapters a regenerate has to redo
+"""
+from typing import Any, Dict, Optional
+
+from app.agents.state import StoryState
+
+TEXT_FIELDS = ("title", "summary")
+IMAGE_FIELDS = ("image_description",)
+
+
+def build_previous_story(saved_state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Snapshot of a finished story that a regenerate can reuse chapters from"""
+    outline = saved_state.get("story_outline")
+    finalized_text = saved_state.get("finalized_text") or {}
+    finalized_images = saved_state.get("finalized_images") or {}
+    if not outline or not (finalized_text.get("chapters") or finalized_images.get("chapters")):
+        return None
+    return {
+        "story_outline": outline,
+        "language": saved_state.get("language", "en"),
+        "text": {ch["chapter_id"]: ch for ch in finalized_text.get("chapters", []) if ch.get("content")},
+        "images": {ch["chapter_id"]: ch["image"] for ch in finalized_images.get("chapters", []) if ch.get("image")},
+    }
+
+
+def _lookup(mapping: Dict[Any, Any], chapter_id: int) -> Any:
+    # Keys become strings after a JSON round trip through Redis
+    return mapping.get(chapter_id, mapping.get(str(chapter_id)))
+
+
+def _outline_chapter(outline: Dict[str, Any], chapter_id: int) -> Optional[Dict[str, Any]]:
+    return next((ch for ch in outline.get("chapters", []) if ch.get("chapter_id") == chapter_id), None)
+
+
+def _unchanged(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]], fields) -> bool:
+    return old is not None and new is not None and all(old.get(f) == new.get(f) for f in fields)
+
+
+def reusable_text(state: StoryState, chapter_id: int) -> Optional[Dict[str, Any]]:
+    """Previous chapter text if the chapter's title and summary are unchanged"""
+    previous = state.get("previous_story")
+    if not previous or previous.get("language") != state.get("language"):
+        return None
+    new = _outline_chapter(state.get("story_outline") or {}, chapter_id)
+    old = _outline_chapter(previous["story_outline"], chapter_id)
+    text = _lookup(previous["text"], chapter_id)
+    if text is None or not _unchanged(old, new, TEXT_FIELDS):
+        return None
+    return {"chapter_id": chapter_id, "title": new["title"], "content": text["content"]}
+
+
+def reusable_image(state: StoryState, chapter_id: int) -> Optional[Dict[str, Any]]:
+    """Previous chapter image if the chapter's image_description is unchanged"""
+    previous = state.get("previous_story")
+    if not previous:
+        return None
+    new = _outline_chapter(state.get("story_outline") or {}, chapter_id)
+    old = _outline_chapter(previous["story_outline"], chapter_id)
+    image = _lookup(previous["images"], chapter_id)
+    if image is None or not _unchanged(old, new, IMAGE_FIELDS):
+        return None
+    return {"chapter_id": chapter_id, "image": image}
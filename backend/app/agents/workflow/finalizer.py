@@ -4,7 +4,7 @@ Finalizer Agents - Two separate agents for text and image finalization
 import logging
 from typing import Dict, Any
 
-from app.agents.state import StoryState
+from app.agents.state import StoryState, chapter_ids
 from app.services.ai_services import get_text_generator
 from app.utils import extract_json
 
@@ -12,7 +12,8 @@ logger = logging.getLogger(__name__)
 
 
 async def finalizer_text_agent(state: StoryState) -> Dict[str, Any]:
-    """Finalizes text content, returns text chapters in order (1-4)"""
+    """Finalizes text content, returns text chapters in outline order"""
+    ids = chapter_ids(state)
     chapters_list = []
     for chapter in state.get("chapters", []):
         if "content" in chapter:
@@ -25,7 +26,7 @@ async def finalizer_text_agent(state: StoryState) -> Dict[str, Any]:
     chapters_list.sort(key=lambda x: x["chapter_id"])
     
     ordered_chapters = []
-    for chapter_id in range(1, 5):
+    for chapter_id in ids:
         chapter = next((ch for ch in chapters_list if ch["chapter_id"] == chapter_id), None)
         if chapter:
             ordered_chapters.append(chapter)
@@ -43,7 +44,12 @@ async def finalizer_text_agent(state: StoryState) -> Dict[str, Any]:
     ])
     
     outline = state["story_outline"]
-    prompt = f"""You are a professional children's story editor. Review and optimize the following 4-chapter children's story in {state["language"]} language.
+    id_order = ", ".join(str(chapter_id) for chapter_id in ids)
+    chapters_format = ",\n".join(
+        f'        {{"chapter_id": {chapter_id}, "title": "Title", "content": "Optimized content"}}'
+        for chapter_id in ids
+    )
+    prompt = f"""You are a professional children's story editor. Review and optimize the following {len(ids)}-chapter children's story in {state["language"]} language.
 
 STORY CONTEXT:
 - Style: {outline["style"]}
@@ -61,23 +67,20 @@ OPTIMIZATION TASKS:
 4. Ensure smooth narrative progression
 5. Maintain consistency with the original style and characters
 
-Return JSON with optimized chapters in order (chapter_id 1, 2, 3, 4):
+Return JSON with optimized chapters in order (chapter_id {id_order}):
 {{
     "chapters": [
-        {{"chapter_id": 1, "title": "Title", "content": "Optimized content"}},
-        {{"chapter_id": 2, "title": "Title", "content": "Optimized content"}},
-        {{"chapter_id": 3, "title": "Title", "content": "Optimized content"}},
-        {{"chapter_id": 4, "title": "Title", "content": "Optimized content"}}
+{chapters_format}
     ]
 }}
 
-IMPORTANT: Only optimize text content, keep same structure. Return chapters in order: 1, 2, 3, 4. Return ONLY valid JSON."""
+IMPORTANT: Only optimize text content, keep same structure. Return chapters in order: {id_order}. Return ONLY valid JSON."""
 
     try:
         response_text = await get_text_generator().generate(
             prompt=prompt,
             temperature=0.7,
-            max_tokens=3000,
+            max_tokens=max(3000, 750 * len(ids)),
             response_format={"type": "json_object"}
         )
         
@@ -116,7 +119,7 @@ IMPORTANT: Only optimize text content, keep same structure. Return chapters in o
 
 
 async def finalizer_image_agent(state: StoryState) -> Dict[str, Any]:
-    """Finalizes images only, returns chapter_id and image in order (1-4)"""
+    """Finalizes images only, returns chapter_id and image in outline order"""
     images_list = []
     for chapter in state.get("chapters", []):
         if "image" in chapter:
@@ -129,7 +132,7 @@ async def finalizer_image_agent(state: StoryState) -> Dict[str, Any]:
     images_map = {img["chapter_id"]: img["image"] for img in images_list}
     
     image_only_chapters = []
-    for chapter_id in range(1, 5):
+    for chapter_id in chapter_ids(state):
         image_only_chapters.append({
             "chapter_id": chapter_id,
             "image": images_map.get(chapter_id, None)
@@ -2,120 +2,213 @@
 Story Graph - Workflow container for story generation
 """
 import logging
-from functools import partial
-from typing import Literal
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
 
 from langgraph.graph import StateGraph, END
 from langgraph.graph.state import CompiledStateGraph
-from langgraph.checkpoint.memory import MemorySaver
 
-from app.agents.state import StoryState
+from app.agents.state import StoryState, ChapterTask, chapter_ids
+from app.core.config import settings
 from .planner import planner_agent
-from .writer import writer_agent
+from .writer import writer_agent, batched_writer_agent
 from .illustrator import illustrator_agent
 from .finalizer import finalizer_text_agent, finalizer_image_agent
+from .checkpointer import create_checkpointer
+from .barrier import add_barrier, add_fanout
+from .concurrency import stage_semaphore
+from .diff import reusable_text, reusable_image
+from .prefetch import current_prefetch
 
 logger = logging.getLogger(__name__)
 
 
-def should_continue(state: StoryState) -> Literal["fanout", "end"]:
+def should_stop(state: StoryState) -> bool:
     """Planner decides if workflow should continue or stop"""
-    return "end" if state.get("needs_info", False) else "fanout"
+    return state.get("needs_info", False)
 
 
-def check_writers_completion(state: StoryState) -> Literal["finalize_text", "wait"]:
-    """Check if all writers are completed"""
-    completed_writers = state.get("completed_writers", [])
-    finalized_text = state.get("finalized_text")
+def chapter_tasks(state: StoryState) -> List[Dict[str, Any]]:
+    """One fan-out task per planned chapter"""
+    return [{"chapter_id": chapter_id} for chapter_id in chapter_ids(state)]
+
+
+async def planner_task(
+    state: StoryState, prefetch_stages: Sequence[str] = (), background_stages: Sequence[str] = ()
+) -> Dict[str, Any]:
+    """Planner, or the outline a speculative planner already produced for this run
+    
+    A streaming planner starts prefetch_stages for each chapter as soon as
+    the chapter is planned; background_stages start for every chapter once
+    the outline is final. The fan-out nodes then pick those runs up.
+    """
+    prefetch = current_prefetch.get()
     
-    unique_writers = set(completed_writers)
-    writers_done = len(unique_writers) == 4
+    def start(stages: Sequence[str], plan: Dict[str, Any], chapter_id: Any):
+        if plan.get("needs_info") or not isinstance(chapter_id, int):
+            return
+        task = {**state, "language": plan.get("language", "en"), "story_outline": plan.get("story_outline"), "chapter_id": chapter_id}
+        for stage in stages:
+            prefetch.start(stage, task, chapter_id, _STAGE_RUNS[stage](task))
     
-    if writers_done and not finalized_text:
-        return "finalize_text"
-    return "wait"
+    speculative_plan = state.get("speculative_plan")
+    if speculative_plan is not None:
+        plan = speculative_plan
+    elif prefetch is None or not prefetch_stages:
+        plan = await planner_agent(state)
+    else:
+        plan = await planner_agent(state, on_chapter=lambda partial, chapter: start(prefetch_stages, partial, chapter.get("chapter_id")))
+    
+    outline = plan.get("story_outline")
+    if background_stages and outline and not plan.get("needs_info"):
+        if prefetch is None:
+            logger.warning(
+                f"No ChapterPrefetch for this run, {', '.join(background_stages)} can't start early: "
+                "the pipelined graph runs sequentially"
+            )
+        else:
+            for chapter_id in chapter_ids({"story_outline": outline}):
+                start(background_stages, plan, chapter_id)
+    return plan
+
+
+async def _adopt_prefetched(stage: str, task: ChapterTask) -> Optional[Dict[str, Any]]:
+    prefetch = current_prefetch.get()
+    pending = prefetch.take(stage, task, task["chapter_id"]) if prefetch is not None else None
+    return await pending if pending is not None else None
+
+
+async def writer_task(task: ChapterTask) -> Dict[str, Any]:
+    """Writer for one chapter, or its run prefetched from the planner stream"""
+    result = await _adopt_prefetched("writer", task)
+    return result if result is not None else await _run_writer(task)
+
 
+async def illustrator_task(task: ChapterTask) -> Dict[str, Any]:
+    """Illustrator for one chapter, or its run prefetched from the planner stream"""
+    result = await _adopt_prefetched("illustrator", task)
+    return result if result is not None else await _run_illustrator(task)
 
-def check_illustrators_completion(state: StoryState) -> Literal["finalize_images", "wait"]:
-    """Check if all illustrators are completed"""
-    completed_image_gens = state.get("completed_image_gens", [])
-    finalized_images = state.get("finalized_images")
+
+async def _run_writer(task: ChapterTask) -> Dict[str, Any]:
+    """Writer for one chapter, bounded by WRITER_MAX_CONCURRENCY
     
-    unique_image_gens = set(completed_image_gens)
-    images_done = len(unique_image_gens) == 4
+    On regenerate, chapters whose title and summary are unchanged reuse the previous text.
+    With WRITER_MODE=batched the chapter is written in one call with its group.
+    """
+    chapter_id = task["chapter_id"]
+    reused = reusable_text(task, chapter_id)
+    if reused is not None:
+        return {"chapters": [reused], "completed_writers": [chapter_id], "reused_chapters": [chapter_id]}
+    if settings.WRITER_MODE == "batched":
+        # The shared call holds the writer semaphore itself
+        return await batched_writer_agent(task, chapter_id, writer_group(task, chapter_id))
+    async with stage_semaphore("writer"):
+        return await writer_agent(task, chapter_id=chapter_id)
+
+
+async def _run_illustrator(task: ChapterTask) -> Dict[str, Any]:
+    """Illustrator for one chapter, bounded by ILLUSTRATOR_MAX_CONCURRENCY
     
-    if images_done and not finalized_images:
-        return "finalize_images"
-    return "wait"
+    On regenerate, chapters whose image_description is unchanged reuse the previous image.
+    """
+    chapter_id = task["chapter_id"]
+    reused = reusable_image(task, chapter_id)
+    if reused is not None:
+        return {"chapters": [reused], "completed_image_gens": [chapter_id], "reused_chapters": [chapter_id]}
+    async with stage_semaphore("illustrator"):
+        return await illustrator_agent(task, chapter_id=chapter_id)
 
 
-def create_story_graph() -> CompiledStateGraph:
-    """Create and compile the LangGraph workflow"""
-    workflow = StateGraph(StoryState)
+def writer_group(state: StoryState, chapter_id: int) -> List[int]:
+    """Chapters written in the same batched call as chapter_id
     
-    workflow.add_node("planner", planner_agent)
-    workflow.add_node("writer_1", partial(writer_agent, chapter_id=1))
-    workflow.add_node("writer_2", partial(writer_agent, chapter_id=2))
-    workflow.add_node("writer_3", partial(writer_agent, chapter_id=3))
-    workflow.add_node("writer_4", partial(writer_agent, chapter_id=4))
-    workflow.add_node("illustrator_1", partial(illustrator_agent, chapter_id=1))
-    workflow.add_node("illustrator_2", partial(illustrator_agent, chapter_id=2))
-    workflow.add_node("illustrator_3", partial(illustrator_agent, chapter_id=3))
-    workflow.add_node("illustrator_4", partial(illustrator_agent, chapter_id=4))
+    Chapters still to write are split in order into groups of WRITER_BATCH_SIZE,
+    so one call's output stays bounded; reused chapters don't take a slot.
+    """
+    pending = [cid for cid in chapter_ids(state) if reusable_text(state, cid) is None]
+    size = max(settings.WRITER_BATCH_SIZE, 1)
+    for start in range(0, len(pending), size):
+        group = pending[start:start + size]
+        if chapter_id in group:
+            return group
+    return [chapter_id]
+
+
+_STAGE_RUNS = {"writer": _run_writer, "illustrator": _run_illustrator}
+
+
+def _add_agent_nodes(workflow: StateGraph, prefetch_stages: Sequence[str], background_stages: Sequence[str]):
+    async def planner(state: StoryState) -> Dict[str, Any]:
+        return await planner_task(state, prefetch_stages, background_stages)
+    
+    workflow.add_node("planner", planner)
+    workflow.add_node("writer", writer_task)
+    workflow.add_node("illustrator", illustrator_task)
     workflow.add_node("finalizer_text", finalizer_text_agent)
     workflow.add_node("finalizer_image", finalizer_image_agent)
-    workflow.add_node("fanout_writers", lambda s: s)
-    workflow.add_node("fanout_illustrators", lambda s: s)
-    workflow.add_node("check_writers_completion", lambda s: s)
-    workflow.add_node("check_illustrators_completion", lambda s: s)
-    
-    workflow.set_entry_point("planner")
-    
-    workflow.add_conditional_edges(
-        "planner",
-        should_continue,
-        {
-            "end": END,
-            "fanout": "fanout_writers"
-        }
-    )
-    
-    # Writers: parallel execution, then check completion
-    for i in range(1, 5):
-        workflow.add_edge("fanout_writers", f"writer_{i}")
-        workflow.add_edge(f"writer_{i}", "check_writers_completion")
-    
-    workflow.add_conditional_edges(
-        "check_writers_completion",
-        check_writers_completion,
-        {
-            "finalize_text": "finalizer_text",
-            "wait": "check_writers_completion",
-        }
-    )
+
+
+def _add_edges(workflow: StateGraph):
+    """planner -> writers -> finalizer_text -> illustrators -> finalizer_image"""
+    add_fanout(workflow, "planner", ["writer"], chapter_tasks, should_stop)
+    add_barrier(workflow, ["writer"], "finalizer_text")
     
     # After text finalized, start illustrators
-    workflow.add_edge("finalizer_text", "fanout_illustrators")
+    add_fanout(workflow, "finalizer_text", ["illustrator"], chapter_tasks)
+    add_barrier(workflow, ["illustrator"], "finalizer_image")
+
+
+def create_story_graph(topology: Optional[str] = None) -> CompiledStateGraph:
+    """Create and compile the LangGraph workflow
     
-    # Illustrators: parallel execution, then check completion
-    for i in range(1, 5):
-        workflow.add_edge("fanout_illustrators", f"illustrator_{i}")
-        workflow.add_edge(f"illustrator_{i}", "check_illustrators_completion")
+    topology: "sequential" (illustrators after text finalization) or
+    "pipelined" (illustrators start when the outline is ready), defaults to settings.
     
-    workflow.add_conditional_edges(
-        "check_illustrators_completion",
-        check_illustrators_completion,
-        {
-            "finalize_images": "finalizer_image",
-            "wait": "check_illustrators_completion",
-        }
-    )
+    Both share the same edges. In the pipelined graph the planner node starts
+    every chapter's illustrator in the background of the run's ChapterPrefetch,
+    and the illustrator fan-out after finalizer_text adopts those runs: image
+    work overlaps the text path without holding up finalizer_text, which a
+    writer / illustrator fan-out in the same superstep would. Without a
+    current ChapterPrefetch (see process_story_generation) it runs
+    sequentially and logs a warning.
+    """
+    topology = topology or settings.STORY_GRAPH_TOPOLOGY
+    if topology not in ("sequential", "pipelined"):
+        raise ValueError(f"Unsupported story graph topology: {topology}")
+    if settings.WRITER_MODE not in ("parallel", "batched"):
+        raise ValueError(f"Unsupported writer mode: {settings.WRITER_MODE}")
+    workflow = StateGraph(StoryState)
+    # Stages that start early can start from the planner stream; a batched
+    # writer needs the whole outline, so it waits for the planner
+    background_stages = ["illustrator"] if topology == "pipelined" else []
+    prefetch_stages = ["writer", *background_stages]
+    if settings.WRITER_MODE == "batched":
+        prefetch_stages.remove("writer")
+    _add_agent_nodes(workflow, prefetch_stages, background_stages)
+    workflow.set_entry_point("planner")
+    _add_edges(workflow)
     
     workflow.add_edge("finalizer_image", END)
     
-    checkpointer = MemorySaver()
+    checkpointer = create_checkpointer()
     return workflow.compile(checkpointer=checkpointer)
 
 
+@lru_cache()
 def get_story_graph() -> CompiledStateGraph:
+    """Get compiled story graph singleton (shared by all sessions)"""
     return create_story_graph()
+
+
+def create_thread_config(session_id: str) -> dict:
+    """Create run config with a per-run thread_id for checkpoint isolation"""
+    return {"configurable": {"thread_id": f"{session_id}:{uuid.uuid4().hex}"}}
+
+
+def warmup_story_graph() -> CompiledStateGraph:
+    """Compile the story graph ahead of the first request"""
+    graph = get_story_graph()
+    graph.get_graph()
+    return graph
@@ -1,18 +1,151 @@
 """
 StoryPlannerAgent - Plans story outline
 """
+import hashlib
+import json
 import logging
-from typing import Dict, Any
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Callable, Dict, Any, Optional, Set, Tuple
 
 from app.agents.state import StoryState
+from app.core.config import settings
 from app.services.ai_services import get_text_generator
-from app.utils import extract_json
+from app.services.cache import RedisLRUCache
+from app.utils import extract_json, JsonStreamParser
 
 logger = logging.getLogger(__name__)
 
+# Bump when the prompt or output format changes to invalidate cached outlines
+PLANNER_PROMPT_VERSION = "1"
 
-def _fill_defaults(data: Dict[str, Any]) -> Dict[str, Any]:
+_THEME_PREFIXES = (
+    "tell me a story about",
+    "write a story about",
+    "a story about",
+    "story about",
+    "a story of",
+)
+_ARTICLES = ("a ", "an ", "the ")
+
+# Chapter fields the planner must return for its outline to be cached
+CHAPTER_FIELDS = ("chapter_id", "title", "summary", "image_description")
+
+# Called with the plan parsed so far and the chapter that just completed
+OnChapter = Callable[[Dict[str, Any], Dict[str, Any]], None]
+
+
+def normalize_theme(theme: str) -> str:
+    """Normalize a theme for cache lookups: case, width, punctuation and filler words"""
+    text = unicodedata.normalize("NFKC", theme).casefold()
+    text = " ".join(re.sub(r"[^\w\s]", " ", text).split())
+    for prefix in _THEME_PREFIXES:
+        if text.startswith(prefix + " "):
+            text = text[len(prefix) + 1:]
+            break
+    for article in _ARTICLES:
+        if text.startswith(article):
+            text = text[len(article):]
+            break
+    return text
+
+
+def _shingles(text: str, size: int = 3) -> Set[str]:
+    compact = text.replace(" ", "_")
+    if len(compact) <= size:
+        return {compact}
+    return {compact[i:i + size] for i in range(len(compact) - size + 1)}
+
+
+def _similarity(a: str, b: str) -> float:
+    """Jaccard similarity of character shingles (works for CJK and latin scripts)"""
+    sa, sb = _shingles(a), _shingles(b)
+    return len(sa & sb) / len(sa | sb) if sa and sb else 0.0
+
+
+@lru_cache()
+def _planner_cache() -> RedisLRUCache:
+    return RedisLRUCache("planner", settings.PLANNER_CACHE_MAX_ENTRIES, settings.PLANNER_CACHE_TTL_SECONDS)
+
+
+def _cache_scope(state: StoryState) -> Optional[Tuple[str, str]]:
+    """(label prefix, normalized theme) if this request may use the cache"""
+    if not settings.PLANNER_CACHE_ENABLED:
+        return None
+    # Regenerate edits an existing outline; earlier turns make the prompt session specific.
+    # memory_summary can't tell: the router folds the theme itself into it
+    if state.get("intent") == "regenerate" or state.get("session_summary"):
+        return None
+    theme = normalize_theme(state.get("theme", ""))
+    if not theme:
+        return None
+    prefix = f"{PLANNER_PROMPT_VERSION}|{settings.STORY_CHAPTER_COUNT}|{state.get('language') or 'en'}|"
+    return prefix, theme
+
+
+def _cache_key(label: str) -> str:
+    return hashlib.sha256(label.encode("utf-8")).hexdigest()[:32]
+
+
+async def _cached_plan(state: StoryState) -> Optional[Dict[str, Any]]:
+    scope = _cache_scope(state)
+    if scope is None:
+        return None
+    prefix, theme = scope
+    cache = _planner_cache()
+    
+    cached = await cache.get(_cache_key(prefix + theme), record=False)
+    result = "hit"
+    if cached is None and settings.PLANNER_CACHE_FUZZY:
+        best_key, best_score = None, settings.PLANNER_CACHE_FUZZY_THRESHOLD
+        for key, label in (await cache.labels()).items():
+            if label.startswith(prefix):
+                score = _similarity(theme, label[len(prefix):])
+                if score >= best_score:
+                    best_key, best_score = key, score
+        if best_key is not None:
+            cached = await cache.get(best_key, record=False)
+            result = "fuzzy_hit"
+    
+    cache.record(result if cached is not None else "miss")
+    return json.loads(cached) if cached is not None else None
+
+
+async def _store_plan(state: StoryState, plan: Dict[str, Any]):
+    scope = _cache_scope(state)
+    if scope is None or plan.get("needs_info"):
+        return
+    label = scope[0] + scope[1]
+    await _planner_cache().set(_cache_key(label), json.dumps(plan, ensure_ascii=False), label=label)
+
+
+def _is_complete(data: Dict[str, Any], chapter_count: int) -> bool:
+    """Whether the LLM returned every outline field itself (nothing left for _fill_defaults)"""
+    outline = data.get("story_outline")
+    if data.get("needs_info") or not isinstance(outline, dict):
+        return False
+    if not all(outline.get(field) for field in ("style", "characters", "setting", "plot_summary")):
+        return False
+    chapters = outline.get("chapters")
+    return isinstance(chapters, list) and len(chapters) >= chapter_count and all(
+        isinstance(chapter, dict) and all(chapter.get(field) for field in CHAPTER_FIELDS)
+        for chapter in chapters[:chapter_count]
+    )
+
+
+def _chapters_format(chapter_count: int) -> str:
+    """Example chapter entries for the JSON format section of the prompt"""
+    return ",\n".join(
+        f'            {{"chapter_id": {i}, "title": "Title", "summary": "Summary", '
+        f'"image_description": "English description with explicit character type for image generation"}}'
+        for i in range(1, chapter_count + 1)
+    )
+
+
+def _fill_defaults(data: Dict[str, Any], chapter_count: Optional[int] = None) -> Dict[str, Any]:
     """Fill missing fields with defaults"""
+    chapter_count = chapter_count or settings.STORY_CHAPTER_COUNT
     if data.get("needs_info", False):
         # Convert suggestions to string if it's a list
         suggestions = data.get("suggestions", "")
@@ -28,7 +161,7 @@ def _fill_defaults(data: Dict[str, Any]) -> Dict[str, Any]:
     outline = data.get("story_outline", {})
     chapters = outline.get("chapters", [])
     
-    while len(chapters) < 4:
+    while len(chapters) < chapter_count:
         chapters.append({
             "chapter_id": len(chapters) + 1,
             "title": f"Chapter {len(chapters) + 1}",
@@ -44,18 +177,40 @@ def _fill_defaults(data: Dict[str, Any]) -> Dict[str, Any]:
             "characters": outline.get("characters", ["Main Character"]),
             "setting": outline.get("setting", "A magical place"),
             "plot_summary": outline.get("plot_summary", "An exciting adventure unfolds"),
-            "chapters": chapters[:4]
+            "chapters": chapters[:chapter_count]
         }
     }
 
 
-async def planner_agent(state: StoryState) -> Dict[str, Any]:
-    """StoryPlannerAgent - Generates story outline and detects language"""
+async def _stream_plan(prompt: str, max_tokens: int, on_chapter: Optional[OnChapter]) -> str:
+    """Stream the outline, reporting each chapter as soon as its object is complete"""
+    parser = JsonStreamParser(("story_outline", "chapters"))
+    async for text in get_text_generator().generate_stream(prompt=prompt, temperature=0.7, max_tokens=max_tokens):
+        for chapter in parser.feed(text):
+            if on_chapter is not None:
+                on_chapter(parser.snapshot(), chapter)
+    return parser.text
+
+
+async def planner_agent(state: StoryState, on_chapter: Optional[OnChapter] = None) -> Dict[str, Any]:
+    """StoryPlannerAgent - Generates story outline and detects language
+    
+    With PLANNER_STREAMING, on_chapter is called for each chapter while the
+    rest of the outline is still being generated.
+    """
     theme = state.get("theme", "")
     memory_summary = state.get("memory_summary", "")
     intent = state.get("intent", "story_generate")
     existing_outline = state.get("story_outline")
+    
+    cached_plan = await _cached_plan(state)
+    if cached_plan is not None:
+        logger.info("Planner outline served from cache")
+        return cached_plan
+    
     text_generator = get_text_generator()
+    chapter_count = settings.STORY_CHAPTER_COUNT
+    chapters_format = _chapters_format(chapter_count)
     
     context = f"Memory summary: {memory_summary}\n" if memory_summary else ""
     
@@ -82,6 +237,7 @@ Based on the user's request, MODIFY the existing story outline above:
 2. Modify elements based on user's feedback
 3. Maintain story coherence and consistency
 4. Detect the language from user's input (keep same language if not specified)
+5. Return exactly {chapter_count} chapters
 
 IMPORTANT RULES:
 - The "language" field MUST match the language of the user's input
@@ -110,15 +266,12 @@ Return JSON format:
         "setting": "setting description",
         "plot_summary": "overall plot",
         "chapters": [
-            {{"chapter_id": 1, "title": "Title", "summary": "Summary", "image_description": "English description with explicit character type for image generation"}},
-            {{"chapter_id": 2, "title": "Title", "summary": "Summary", "image_description": "English description with explicit character type for image generation"}},
-            {{"chapter_id": 3, "title": "Title", "summary": "Summary", "image_description": "English description with explicit character type for image generation"}},
-            {{"chapter_id": 4, "title": "Title", "summary": "Summary", "image_description": "English description with explicit character type for image generation"}}
+{chapters_format}
         ]
     }}
 }}"""
     else:
-        prompt = f"""Analyze the user's theme and create a complete 4-chapter children's story.
+        prompt = f"""Analyze the user's theme and create a complete {chapter_count}-chapter children's story.
 
 {context}User theme: {theme}
 
@@ -184,25 +337,31 @@ If information is COMPLETE (use the detected language for language field, titles
         "setting": "setting description",
         "plot_summary": "overall plot",
         "chapters": [
-            {{"chapter_id": 1, "title": "Title", "summary": "Summary", "image_description": "English description with explicit character type for image generation"}},
-            {{"chapter_id": 2, "title": "Title", "summary": "Summary", "image_description": "English description with explicit character type for image generation"}},
-            {{"chapter_id": 3, "title": "Title", "summary": "Summary", "image_description": "English description with explicit character type for image generation"}},
-            {{"chapter_id": 4, "title": "Title", "summary": "Summary", "image_description": "English description with explicit character type for image generation"}}
+{chapters_format}
         ]
     }}
 }}"""
 
     try:
-        response_text = await text_generator.generate(
-            prompt=prompt,
-            temperature=0.7,
-            max_tokens=2000,
-            response_format={"type": "json_object"}
-        )
+        max_tokens = max(2000, 400 * chapter_count)
+        if settings.PLANNER_STREAMING:
+            response_text = await _stream_plan(prompt, max_tokens, on_chapter)
+        else:
+            response_text = await text_generator.generate(
+                prompt=prompt,
+                temperature=0.7,
+                max_tokens=max_tokens,
+                response_format={"type": "json_object"}
+            )
         
         response_json = extract_json(response_text)
         if not response_json: logger.warning("PlannerAgent received empty JSON, using defaults.")
-        return _fill_defaults(response_json)
+        # Padded outlines (truncated or partial responses) are not shared through the cache
+        complete = _is_complete(response_json, chapter_count)
+        plan = _fill_defaults(response_json, chapter_count)
+        if complete:
+            await _store_plan(state, plan)
+        return plan
         
     except Exception as e:
         logger.error(f"Planner error: {e}")
@@ -216,7 +375,7 @@ If information is COMPLETE (use the detected language for language field, titles
                 "plot_summary": f"A story about {theme[:50]}",
                 "chapters": [
                     {"chapter_id": i, "title": f"Chapter {i}", "summary": "Story begins...", "image_description": "A scene from the story"}
-                    for i in range(1, 5)
+                    for i in range(1, chapter_count + 1)
                 ]
             }
         }
@@ -0,0 +1,72 @@
+"""
+Prefetch - writer / illustrator runs started while the planner is still streaming
+"""
+import asyncio
+import contextvars
+import logging
+from typing import Any, Awaitable, Dict, Optional, Tuple
+
+from app.agents.state import StoryState
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Outline fields a chapter task depends on besides its own chapter entry
+CONTEXT_FIELDS = ("style", "characters", "setting", "plot_summary")
+
+_prefetches = metrics.counter("chapter_prefetch_total", "Chapter tasks started from the planner stream by outcome")
+
+
+def chapter_inputs(state: StoryState, chapter_id: int) -> Optional[Tuple[Any, ...]]:
+    """What a chapter's writer / illustrator output depends on, or None if not planned yet"""
+    outline = state.get("story_outline") or {}
+    chapter = next((ch for ch in outline.get("chapters", []) if ch.get("chapter_id") == chapter_id), None)
+    if chapter is None or any(field not in outline for field in CONTEXT_FIELDS):
+        return None
+    return (state.get("language"), tuple(repr(outline[field]) for field in CONTEXT_FIELDS), repr(chapter))
+
+
+class ChapterPrefetch:
+    """Chapter tasks of one run, started before the planner node returns
+
+    The fan-out node for a chapter adopts the prefetched task if the final
+    outline gives the chapter the same inputs, and runs it afresh otherwise.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Tuple[str, int], Tuple[Tuple[Any, ...], asyncio.Task]] = {}
+
+    def start(self, stage: str, state: StoryState, chapter_id: int, run: Awaitable[Dict[str, Any]]):
+        inputs = chapter_inputs(state, chapter_id)
+        if inputs is None or (stage, chapter_id) in self._tasks:
+            run.close()
+            return
+        logger.debug(f"Prefetching {stage} for chapter {chapter_id}")
+        self._tasks[(stage, chapter_id)] = (inputs, asyncio.create_task(run))
+
+    def take(self, stage: str, state: StoryState, chapter_id: int) -> Optional["asyncio.Task[Dict[str, Any]]"]:
+        """The prefetched task for this chapter if its inputs still match, else None"""
+        entry = self._tasks.pop((stage, chapter_id), None)
+        if entry is None:
+            return None
+        inputs, task = entry
+        if inputs != chapter_inputs(state, chapter_id):
+            _prefetches.inc(stage=stage, result="stale")
+            task.cancel()
+            return None
+        _prefetches.inc(stage=stage, result="adopted")
+        return task
+
+    def cancel(self):
+        """Drop prefetched tasks no fan-out node adopted (needs_info, failed run, cancellation)"""
+        for (stage, _), (_, task) in self._tasks.items():
+            _prefetches.inc(stage=stage, result="unused")
+            task.cancel()
+        self._tasks.clear()
+
+
+# Prefetch registry of the run the current task belongs to; set per run and
+# inherited by the graph's node tasks
+current_prefetch: contextvars.ContextVar[Optional[ChapterPrefetch]] = contextvars.ContextVar(
+    "current_prefetch", default=None
+)
@@ -0,0 +1,55 @@
+"""
+Speculation - Planner started alongside the router on a guessed intent
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from app.agents.state import StoryState
+from app.core.metrics import metrics
+from .planner import planner_agent
+
+logger = logging.getLogger(__name__)
+
+_speculations = metrics.counter("speculative_planner_total", "Speculative planner runs by outcome (hit / miss)")
+_saved_seconds = metrics.histogram("speculative_planner_saved_seconds", "Planner time overlapped with routing")
+_wasted_seconds = metrics.histogram("speculative_planner_wasted_seconds", "Planner time spent on discarded speculation")
+
+
+class SpeculativePlanner:
+    """Runs the planner for a guessed intent while the router is still deciding
+
+    resolve() keeps the run if the router agrees with the guess and cancels
+    it otherwise; the graph's planner node then uses the kept result.
+    """
+
+    def __init__(self, state: StoryState):
+        self.intent = state.get("intent")
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.task: "asyncio.Task[Dict[str, Any]]" = asyncio.create_task(self._run(state))
+
+    async def _run(self, state: StoryState) -> Dict[str, Any]:
+        try:
+            return await planner_agent(state)
+        finally:
+            self.finished = time.monotonic()
+
+    def _elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def resolve(self, intent: str) -> Optional["asyncio.Task[Dict[str, Any]]"]:
+        """Return the planner task if the guess was right, else cancel it"""
+        if intent == self.intent:
+            _speculations.inc(result="hit")
+            _saved_seconds.observe(self._elapsed())
+            return self.task
+        logger.debug(f"Speculative planner missed: guessed {self.intent}, router chose {intent}")
+        _speculations.inc(result="miss")
+        _wasted_seconds.observe(self._elapsed())
+        self.cancel()
+        return None
+
+    def cancel(self):
+        self.task.cancel()
@@ -1,16 +1,91 @@
 """
 ChapterWriterAgent - Generates chapter text content
 """
+import asyncio
+import contextvars
+import hashlib
+import json
 import logging
-from typing import Dict, Any
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Protocol, Tuple
 
 from app.agents.state import StoryState
+from app.core.config import settings
 from app.services.ai_services import get_text_generator
-from app.utils import extract_json
+from app.utils import extract_json, JsonStreamParser
+from .concurrency import stage_semaphore
 
 logger = logging.getLogger(__name__)
 
 
+class ChapterStream(Protocol):
+    """Receives one chapter's tokens as they are generated"""
+    
+    def push(self, text: str) -> None: ...
+    
+    def aclose(self) -> Awaitable[None]: ...
+
+
+# Opens the stream for (session_id, chapter_id); set per run by the API layer
+# (story.py forwards tokens as chapter_delta events). Unset, tokens stay local.
+current_chapter_stream: contextvars.ContextVar[Optional[Callable[[str, int], ChapterStream]]] = contextvars.ContextVar(
+    "current_chapter_stream", default=None
+)
+
+
+JSON_OUTPUT_FORMAT = """
+Return JSON format:
+{
+    "content": "The complete chapter text - pure story narrative only, no extra information"
+}"""
+
+STREAM_OUTPUT_FORMAT = """
+Return ONLY the chapter text as plain prose - no JSON, no markdown, no title."""
+
+WRITING_GUIDELINES = """WRITING GUIDELINES:
+1. Write ONLY the story content - no meta-commentary, no notes, no explanations
+2. Use vivid, descriptive language that engages children's imagination
+3. Show, don't tell - use actions and dialogue to convey emotions and events
+4. Maintain consistency with the established characters, setting, and style
+5. Use simple but rich vocabulary appropriate for children
+6. Include sensory details (sights, sounds, smells) to make scenes come alive"""
+
+
+def _story_context(outline: Dict[str, Any]) -> str:
+    return f"""STORY CONTEXT:
+- Style: {outline["style"]}
+- Main Characters: {', '.join(outline["characters"])}
+- Setting: {outline["setting"]}
+- Overall Plot: {outline["plot_summary"]}"""
+
+
+async def _stream_chapter(prompt: str, session_id: str, chapter_id: int) -> Dict[str, Any]:
+    """Stream chapter text, forwarding tokens to the run's chapter stream as they arrive
+    
+    If the stream fails midway, the text already streamed is kept, so the
+    chapter matches what the client has received.
+    """
+    open_stream = current_chapter_stream.get()
+    stream = open_stream(session_id, chapter_id) if open_stream is not None else None
+    parts = []
+    try:
+        async for text in get_text_generator().generate_stream(
+            prompt=prompt + STREAM_OUTPUT_FORMAT,
+            temperature=0.8,
+            max_tokens=500,
+        ):
+            parts.append(text)
+            if stream is not None:
+                stream.push(text)
+    except Exception as e:
+        if not parts:
+            raise
+        logger.warning(f"Chapter {chapter_id} stream failed midway, keeping the streamed text: {e}")
+    finally:
+        if stream is not None:
+            await stream.aclose()
+    return {"content": "".join(parts)}
+
+
 def _fill_defaults(data: Dict[str, Any], chapter_id: int, chapter_outline: Dict[str, Any]) -> Dict[str, Any]:
     """Fill missing output fields with defaults (input fields already filled by planner)"""
     content = data.get("content", "")
@@ -39,11 +114,7 @@ async def writer_agent(state: StoryState, chapter_id: int) -> Dict[str, Any]:
     
     prompt = f"""You are a professional children's story writer. Write Chapter {chapter_id} of a children's story in {language} language.
 
-STORY CONTEXT:
-- Style: {outline["style"]}
-- Main Characters: {', '.join(outline["characters"])}
-- Setting: {outline["setting"]}
-- Overall Plot: {outline["plot_summary"]}
+{_story_context(outline)}
 
 CHAPTER REQUIREMENTS:
 - Title: {chapter["title"]}
@@ -51,13 +122,7 @@ CHAPTER REQUIREMENTS:
 - Length: 200-300 words
 - Target Audience: Children (age-appropriate language and themes)
 
-WRITING GUIDELINES:
-1. Write ONLY the story content - no meta-commentary, no notes, no explanations
-2. Use vivid, descriptive language that engages children's imagination
-3. Show, don't tell - use actions and dialogue to convey emotions and events
-4. Maintain consistency with the established characters, setting, and style
-5. Use simple but rich vocabulary appropriate for children
-6. Include sensory details (sights, sounds, smells) to make scenes come alive
+{WRITING_GUIDELINES}
 
 CRITICAL RULES:
 - DO NOT include any text outside the story narrative
@@ -65,21 +130,19 @@ CRITICAL RULES:
 - DO NOT mention "Chapter {chapter_id}" or any chapter numbers in the text
 - DO NOT include meta-information about the story
 - ONLY write the actual story content that children will read
-
-Return JSON format:
-{{
-    "content": "The complete chapter text - pure story narrative only, no extra information"
-}}"""
+"""
 
     try:
-        response_text = await get_text_generator().generate(
-            prompt=prompt,
-            temperature=0.8,
-            max_tokens=500,
-            response_format={"type": "json_object"}
-        )
-        
-        response_json = extract_json(response_text)
+        if settings.WRITER_STREAMING:
+            response_json = await _stream_chapter(prompt, state["session_id"], chapter_id)
+        else:
+            response_text = await get_text_generator().generate(
+                prompt=prompt + JSON_OUTPUT_FORMAT,
+                temperature=0.8,
+                max_tokens=500,
+                response_format={"type": "json_object"}
+            )
+            response_json = extract_json(response_text)
         if not response_json:
             logger.warning(f"WriterAgent received empty JSON for chapter {chapter_id}, using defaults")
         
@@ -97,3 +160,125 @@ Return JSON format:
             "completed_writers": [chapter_id]
         }
 
+
+def _batch_prompt(outline: Dict[str, Any], language: str, chapters: List[Dict[str, Any]]) -> str:
+    """One prompt for several chapters: story context and guidelines are sent once"""
+    ids = ", ".join(str(chapter["chapter_id"]) for chapter in chapters)
+    requirements = "\n".join(
+        f"Chapter {chapter['chapter_id']}:\n- Title: {chapter['title']}\n- Summary: {chapter['summary']}"
+        for chapter in chapters
+    )
+    chapters_format = ",\n".join(
+        f'        {{"chapter_id": {chapter["chapter_id"]}, "content": "The complete chapter text"}}'
+        for chapter in chapters
+    )
+    return f"""You are a professional children's story writer. Write Chapters {ids} of a children's story in {language} language.
+
+{_story_context(outline)}
+
+CHAPTER REQUIREMENTS:
+{requirements}
+- Length: 200-300 words per chapter
+- Target Audience: Children (age-appropriate language and themes)
+
+{WRITING_GUIDELINES}
+
+CRITICAL RULES:
+- DO NOT include any text outside the story narrative in "content"
+- DO NOT add comments, notes, or explanations
+- DO NOT mention chapter numbers in the chapter text
+- DO NOT include meta-information about the story
+- Write the chapters in order, finishing each before starting the next
+
+Return JSON format:
+{{
+    "chapters": [
+{chapters_format}
+    ]
+}}"""
+
+
+class _WriterBatch:
+    """One LLM call writing a group of chapters, shared by their writer tasks
+
+    Chapters are parsed out of the stream as each one's JSON object closes,
+    so the first chapter's writer returns while later ones are still being
+    written. If every waiting writer is cancelled, the call is cancelled too.
+    """
+
+    def __init__(self, state: StoryState, chapters: List[Dict[str, Any]]):
+        loop = asyncio.get_running_loop()
+        self.results: Dict[int, asyncio.Future] = {chapter["chapter_id"]: loop.create_future() for chapter in chapters}
+        self.waiters = 0
+        self.task = asyncio.create_task(self._run(state, chapters))
+
+    async def _run(self, state: StoryState, chapters: List[Dict[str, Any]]):
+        try:
+            async with stage_semaphore("writer"):
+                parser = JsonStreamParser(("chapters",))
+                async for text in get_text_generator().generate_stream(
+                    prompt=_batch_prompt(state["story_outline"], state["language"], chapters),
+                    temperature=0.8,
+                    max_tokens=500 * len(chapters),
+                ):
+                    for data in parser.feed(text):
+                        result = self.results.get(data.get("chapter_id"))
+                        if result is not None and not result.done():
+                            result.set_result(data)
+        except Exception as e:
+            logger.error(f"Failed to generate chapters {sorted(self.results)}: {e}")
+        finally:
+            # Chapters the response didn't cover fall back to defaults
+            for result in self.results.values():
+                if not result.done():
+                    result.set_result({})
+
+
+_batches: Dict[Tuple[str, Tuple[int, ...], str], _WriterBatch] = {}
+
+
+def _batch_key(state: StoryState, group: List[int]) -> Tuple[str, Tuple[int, ...], str]:
+    """Writers of one group in one run share a call: session, group and a hash of outline and language"""
+    content = json.dumps([state["story_outline"], state["language"]], sort_keys=True, default=str)
+    return state["session_id"], tuple(group), hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _forget(key: Tuple[str, Tuple[int, ...], str], batch: _WriterBatch):
+    if _batches.get(key) is batch:
+        del _batches[key]
+
+
+async def batched_writer_agent(state: StoryState, chapter_id: int, group: List[int]) -> Dict[str, Any]:
+    """Chapter text from one call that writes the chapter's whole group
+
+    group is the same list of chapter ids for every chapter in it; the first
+    writer of the group starts the call and the others wait for their part.
+    """
+    chapters = {ch["chapter_id"]: ch for ch in state["story_outline"]["chapters"]}
+    if chapter_id not in chapters:
+        logger.warning(f"Chapter {chapter_id} not found")
+        return {"chapters": [], "completed_writers": []}
+    
+    key = _batch_key(state, group)
+    batch = _batches.get(key)
+    if batch is None:
+        batch = _batches[key] = _WriterBatch(state, [chapters[i] for i in group if i in chapters])
+        # The entry goes with the call, however it ends
+        batch.task.add_done_callback(lambda _: _forget(key, batch))
+    batch.waiters += 1
+    try:
+        data = await asyncio.shield(batch.results[chapter_id])
+    except asyncio.CancelledError:
+        if batch.waiters == 1:
+            _forget(key, batch)
+            batch.task.cancel()
+        raise
+    finally:
+        batch.waiters -= 1
+    
+    if not data:
+        logger.warning(f"WriterAgent batch returned nothing for chapter {chapter_id}, using defaults")
+    return {
+        "chapters": [_fill_defaults(data, chapter_id, chapters[chapter_id])],
+        "completed_writers": [chapter_id]
+    }
@@ -0,0 +1,160 @@
+"""
+Broadcast backends - deliver session events to sockets on any worker
+"""
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, Dict[str, Any]], Awaitable[None]]
+Control = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class LocalBroadcast:
+    """Single-process backend: events go straight to this worker's sockets"""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+        self._control: Optional[Control] = None
+
+    def bind(self, deliver: Deliver, control: Control):
+        self._deliver = deliver
+        self._control = control
+
+    async def publish(self, session_id: str, message: Dict[str, Any]):
+        await self._deliver(session_id, message)
+
+    async def publish_control(self, message: Dict[str, Any]):
+        """Tell other workers about a session (nothing to tell in a single process)"""
+
+    async def subscribe(self, session_id: str):
+        """Start receiving a session's events on this worker"""
+
+    def unsubscribe(self, session_id: str):
+        """Stop receiving a session's events on this worker"""
+
+    async def has_subscribers(self, session_id: str) -> bool:
+        """Whether any other worker has a socket for the session"""
+        return False
+
+    async def close(self):
+        pass
+
+
+class RedisBroadcast(LocalBroadcast):
+    """Relays events between workers over Redis pub/sub
+
+    Each session has its own channel; a worker subscribes while it holds at
+    least one socket of that session, so it only receives events it can
+    deliver. A shared control channel carries cross-worker requests such as
+    cancelling a session's pipeline.
+    """
+
+    def __init__(self, prefix: str = "ws"):
+        super().__init__()
+        self.prefix = prefix
+        self.control_channel = f"{prefix}:control"
+        # Identifies this worker on the control channel so it can ignore its own messages
+        self.worker_id = uuid.uuid4().hex
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def channel(self, session_id: str) -> str:
+        return f"{self.prefix}:session:{session_id}"
+
+    async def _ensure_listener(self):
+        async with self._lock:
+            if self._pubsub is None:
+                self._pubsub = get_redis().client.pubsub(ignore_subscribe_messages=True)
+                await self._pubsub.subscribe(self.control_channel)
+                self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    await self._dispatch(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Broadcast listener error, resubscribing: {e}")
+                await asyncio.sleep(1.0)
+
+    async def _dispatch(self, message: Dict[str, Any]):
+        if message.get("type") != "message":
+            return
+        try:
+            payload = json.loads(message["data"])
+        except (TypeError, ValueError):
+            logger.warning(f"Dropping malformed broadcast on {message.get('channel')}")
+            return
+        channel = message["channel"]
+        if channel == self.control_channel:
+            if payload.get("origin") != self.worker_id:
+                await self._control(payload)
+        else:
+            await self._deliver(channel[len(self.channel("")):], payload)
+
+    async def publish(self, session_id: str, message: Dict[str, Any]):
+        try:
+            await get_redis().client.publish(self.channel(session_id), json.dumps(message, ensure_ascii=False))
+        except Exception as e:
+            # Better to reach this worker's sockets than nobody
+            logger.error(f"Broadcast publish failed, delivering locally: {e}")
+            await self._deliver(session_id, message)
+
+    async def publish_control(self, message: Dict[str, Any]):
+        try:
+            await get_redis().client.publish(
+                self.control_channel, json.dumps({**message, "origin": self.worker_id}, ensure_ascii=False)
+            )
+        except Exception as e:
+            logger.error(f"Broadcast control publish failed: {e}")
+
+    async def subscribe(self, session_id: str):
+        await self._ensure_listener()
+        await self._pubsub.subscribe(self.channel(session_id))
+
+    def unsubscribe(self, session_id: str):
+        if self._pubsub is not None:
+            asyncio.get_running_loop().create_task(self._unsubscribe(session_id))
+
+    async def _unsubscribe(self, session_id: str):
+        try:
+            await self._pubsub.unsubscribe(self.channel(session_id))
+        except Exception as e:
+            logger.warning(f"Broadcast unsubscribe failed for {session_id}: {e}")
+
+    async def has_subscribers(self, session_id: str) -> bool:
+        try:
+            counts = await get_redis().client.pubsub_numsub(self.channel(session_id))
+        except Exception as e:
+            logger.warning(f"Broadcast presence check failed for {session_id}: {e}")
+            return False
+        return any(count > 0 for _, count in counts)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+
+def create_broadcast() -> LocalBroadcast:
+    """Create WebSocket broadcast backend from settings"""
+    backend = settings.WS_BROADCAST_BACKEND
+    if backend == "redis":
+        return RedisBroadcast()
+    if backend == "local":
+        return LocalBroadcast()
+    raise ValueError(f"Unsupported broadcast backend: {backend}")
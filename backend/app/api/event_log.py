@@ -0,0 +1,82 @@
+"""
+Event log - per-session Redis Stream of sent events for reconnect replay
+"""
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+# High-volume or connection-local events that a reconnecting client doesn't need
+UNLOGGED_EVENTS = {"chapter_delta", "session_ready"}
+
+_replayed = metrics.counter("ws_replayed_events_total", "Events replayed to reconnecting sockets")
+
+
+class EventLog:
+    """Capped, expiring log of one session's events (current run only)
+
+    Each event is stored with its event_id; a client reconnecting with the
+    last event_id it saw gets every event after it. A new run resets the log,
+    so an unknown id (expired, trimmed or from an older run) replays the
+    whole current run.
+    """
+
+    def __init__(self, max_len: Optional[int] = None, ttl_seconds: Optional[int] = None):
+        self._max_len = max_len
+        self._ttl_seconds = ttl_seconds
+
+    @property
+    def max_len(self) -> int:
+        return self._max_len or settings.EVENT_LOG_MAX_LEN
+
+    @property
+    def ttl_seconds(self) -> int:
+        return self._ttl_seconds or settings.EVENT_LOG_TTL_SECONDS
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"events:{session_id}"
+
+    async def append(self, session_id: str, message: Dict[str, Any]):
+        if not settings.EVENT_LOG_ENABLED or message.get("type") in UNLOGGED_EVENTS:
+            return
+        key = self._key(session_id)
+        try:
+            async with get_redis().client.pipeline(transaction=False) as pipe:
+                pipe.xadd(
+                    key,
+                    {"event_id": message.get("event_id", ""), "message": json.dumps(message, ensure_ascii=False)},
+                    maxlen=self.max_len,
+                    approximate=True,
+                )
+                pipe.expire(key, self.ttl_seconds)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Event log append failed for {session_id}: {e}")
+
+    async def read_after(self, session_id: str, last_event_id: Optional[str]) -> List[Dict[str, Any]]:
+        """Events logged after last_event_id, or the whole log if the id is unknown"""
+        try:
+            entries = await get_redis().client.xrange(self._key(session_id))
+        except Exception as e:
+            logger.warning(f"Event log read failed for {session_id}: {e}")
+            return []
+        event_ids = [fields.get("event_id") for _, fields in entries]
+        start = event_ids.index(last_event_id) + 1 if last_event_id in event_ids else 0
+        messages = [json.loads(fields["message"]) for _, fields in entries[start:]]
+        _replayed.inc(len(messages))
+        return messages
+
+    async def reset(self, session_id: str):
+        """Drop the previous run's events when a new run starts"""
+        if not settings.EVENT_LOG_ENABLED:
+            return
+        try:
+            await get_redis().client.delete(self._key(session_id))
+        except Exception as e:
+            logger.warning(f"Event log reset failed for {session_id}: {e}")
@@ -0,0 +1,240 @@
+"""
+Session store - saved session state as a Redis hash, written field by field
+"""
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from redis.exceptions import ResponseError
+
+from app.core.metrics import metrics
+from app.core.redis import get_redis
+from app.utils.codec import Codec, create_codec
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL_SECONDS = 24 * 3600
+
+# Hash field holding strings shared between fields, and the marker that refers to one
+SHARED_FIELD = "_shared"
+SHARED_REF = "$s"
+# Shorter strings cost less than a reference to them
+MIN_SHARED_LENGTH = 64
+
+_writes = metrics.counter(
+    "session_store_writes_total", "Session state writes by mode (full / partial / missed partial / skipped)"
+)
+_bytes = metrics.counter("session_store_bytes_total", "Session state bytes moved to and from Redis by op")
+_write_bytes = metrics.histogram(
+    "session_store_write_bytes", "Bytes sent per session state write",
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+
+
+def _walk(value: Any, visit):
+    """Rebuild value with visit applied to every string"""
+    if isinstance(value, str):
+        return visit(value)
+    if isinstance(value, dict):
+        if len(value) == 1 and SHARED_REF in value:
+            return visit(value)
+        return {k: _walk(v, visit) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_walk(v, visit) for v in value]
+    return value
+
+
+def share_strings(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Store long strings that appear in several fields once
+
+    Chapter text and image data show up in chapters as well as in
+    finalized_text / finalized_images; each copy after the first becomes a
+    reference into SHARED_FIELD. References are content hashes, so fields
+    whose strings didn't change encode the same as before.
+    """
+    owners: Dict[str, set] = {}
+    for name, value in state.items():
+        def collect(text, name=name):
+            if isinstance(text, str) and len(text) >= MIN_SHARED_LENGTH:
+                owners.setdefault(text, set()).add(name)
+            return text
+        _walk(value, collect)
+    shared = {
+        hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest(): text
+        for text, names in owners.items() if len(names) > 1
+    }
+    if not shared:
+        return state
+    refs = {text: ref for ref, text in shared.items()}
+    result = {
+        name: _walk(value, lambda text: {SHARED_REF: refs[text]} if isinstance(text, str) and text in refs else text)
+        for name, value in state.items()
+    }
+    result[SHARED_FIELD] = shared
+    return result
+
+
+def resolve_strings(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Undo share_strings"""
+    shared = state.pop(SHARED_FIELD, None)
+    if not shared:
+        return state
+    return {
+        name: _walk(value, lambda item: shared.get(item[SHARED_REF], "") if isinstance(item, dict) else item)
+        for name, value in state.items()
+    }
+
+
+class SessionStore:
+    """Keeps each session as a hash of codec-encoded fields
+
+    The store remembers what it last wrote or read for recently used
+    sessions and only sends fields that changed since (plus HDEL for fields
+    that went away). A session it has no record of, whose key expired, or
+    that is still stored in the old single JSON string gets a full rewrite.
+    Plain JSON values from before the codec header are still readable.
+    """
+
+    # Sessions whose last written fields are remembered for diffing
+    MAX_TRACKED_SESSIONS = 1024
+
+    def __init__(self, ttl_seconds: int = SESSION_TTL_SECONDS, codec: Optional[Codec] = None):
+        self.ttl_seconds = ttl_seconds
+        self._codec = codec
+        self._written: "OrderedDict[str, Dict[str, bytes]]" = OrderedDict()
+        self._session_bytes: Dict[str, int] = {}
+
+    @property
+    def codec(self) -> Codec:
+        if self._codec is None:
+            self._codec = create_codec()
+        return self._codec
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"session:{session_id}"
+
+    def _remember(self, session_id: str, fields: Dict[str, bytes]):
+        self._written[session_id] = fields
+        self._written.move_to_end(session_id)
+        while len(self._written) > self.MAX_TRACKED_SESSIONS:
+            evicted, _ = self._written.popitem(last=False)
+            self._session_bytes.pop(evicted, None)
+
+    def _account(self, session_id: str, mode: str, sent: int):
+        _writes.inc(mode=mode)
+        _bytes.inc(sent, op="write")
+        _write_bytes.observe(sent, mode=mode)
+        total = self._session_bytes[session_id] = self._session_bytes.get(session_id, 0) + sent
+        logger.debug(f"Session {session_id}: {mode} write of {sent} bytes, {total} bytes written so far")
+
+    def bytes_written(self, session_id: str) -> int:
+        """Bytes this worker has written for a session while it was tracked"""
+        return self._session_bytes.get(session_id, 0)
+
+    async def load(self, session_id: str) -> Dict[str, Any]:
+        client = get_redis().binary_client
+        key = self._key(session_id)
+        try:
+            raw = await client.hgetall(key)
+        except ResponseError:
+            # Written before the hash layout; the next save converts it
+            data = await client.get(key)
+            self._written.pop(session_id, None)
+            if not data:
+                return {}
+            _bytes.inc(len(data), op="read")
+            return self.codec.decode(data)
+        if not raw:
+            # No session yet: nothing to diff against, so the first save is a full write
+            self._written.pop(session_id, None)
+            return {}
+        fields = {name.decode("utf-8"): value for name, value in raw.items()}
+        _bytes.inc(sum(len(v) for v in fields.values()), op="read")
+        self._remember(session_id, fields)
+        return resolve_strings({name: self.codec.decode(value) for name, value in fields.items()})
+
+    async def save(self, session_id: str, state: Dict[str, Any]):
+        """Persist state, sending only the fields that changed"""
+        encoded = self._encode(share_strings(state))
+        previous = self._written.get(session_id)
+        if previous is None:
+            await self._write_full(session_id, encoded)
+            return
+        changed = {name: value for name, value in encoded.items() if previous.get(name) != value}
+        removed = [name for name in previous if name not in encoded]
+        if not changed and not removed:
+            _writes.inc(mode="skipped")
+            self._written.move_to_end(session_id)
+            return
+        try:
+            written = await self._write_partial(session_id, changed, removed)
+        except ResponseError:
+            written = False
+        if not written:
+            await self._write_full(session_id, encoded)
+            return
+        self._remember(session_id, encoded)
+
+    async def update_fields(self, session_id: str, fields: Dict[str, Any]) -> bool:
+        """Set a few fields of an existing session; False if there is none"""
+        encoded = self._encode(fields)
+        try:
+            written = await self._write_partial(session_id, encoded, [])
+        except ResponseError:
+            # Old single-string layout: convert it along with the update
+            state = await self.load(session_id)
+            state.update(fields)
+            await self._write_full(session_id, self._encode(share_strings(state)))
+            return True
+        if not written:
+            # Nothing saved (yet); drop the fields this write created
+            await get_redis().binary_client.delete(self._key(session_id))
+            self._written.pop(session_id, None)
+            return False
+        previous = self._written.get(session_id)
+        if previous is not None:
+            self._remember(session_id, {**previous, **encoded})
+        return True
+
+    def _encode(self, state: Dict[str, Any]) -> Dict[str, bytes]:
+        return {name: self.codec.encode(value) for name, value in state.items()}
+
+    async def _write_partial(self, session_id: str, changed: Dict[str, bytes], removed: list) -> bool:
+        """HSET / HDEL in one transaction; False if the key did not exist
+
+        EXPIRE runs first, so its result tells whether the hash existed
+        before this write; a write to a missing key leaves only the changed
+        fields behind and must be redone in full. Raises ResponseError if the
+        key holds the old string layout. The bytes are sent either way and
+        are accounted for either way.
+        """
+        key = self._key(session_id)
+        written = False
+        try:
+            async with get_redis().binary_client.pipeline(transaction=True) as pipe:
+                pipe.expire(key, self.ttl_seconds)
+                if changed:
+                    pipe.hset(key, mapping=changed)
+                if removed:
+                    pipe.hdel(key, *removed)
+                results = await pipe.execute()
+            written = bool(results[0])
+            return written
+        finally:
+            self._account(session_id, "partial" if written else "partial_missed", sum(len(v) for v in changed.values()))
+
+    async def _write_full(self, session_id: str, encoded: Dict[str, bytes]):
+        key = self._key(session_id)
+        async with get_redis().binary_client.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if encoded:
+                pipe.hset(key, mapping=encoded)
+                pipe.expire(key, self.ttl_seconds)
+            await pipe.execute()
+        self._remember(session_id, encoded)
+        self._account(session_id, "full", sum(len(v) for v in encoded.values()))
+
+
+session_store = SessionStore()
@@ -1,24 +1,47 @@
 """
 Story generation message handling for WebSocket
 """
-import json
+import asyncio
 import logging
-from typing import Dict, Any
+import weakref
+from typing import Dict, Any, Optional
 
-from app.agents.state import StoryState
-from app.agents.conversation import router_agent
-from app.agents.workflow import get_story_graph
-from app.core.redis import get_redis
-from app.api.websocket import manager, create_ws_message
+from app.agents.state import StoryState, chapter_ids
+from app.agents.conversation import router_agent, update_memory_summary, worth_speculating
+from app.agents.workflow import (
+    get_story_graph, create_thread_config, SpeculativePlanner, ChapterPrefetch, current_prefetch,
+    current_chapter_stream,
+)
+from app.agents.workflow.diff import build_previous_story
+from app.core.config import settings
+from app.api.session_store import session_store
+from app.api.websocket import manager, create_ws_message, DeltaEmitter
+from app.services.ai_services.limiter import current_session
 
 logger = logging.getLogger(__name__)
 
+# Per-run workflow fields that are not persisted with the session
+TRANSIENT_STATE_KEYS = {"previous_story", "reused_chapters", "speculative_plan", "session_summary"}
+
+# Serializes writes of one session so a field update never interleaves with a full save
+_session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+# Strong references to fire-and-forget tasks until they finish
+_background_tasks: set = set()
+
+
+def _session_lock(session_id: str) -> asyncio.Lock:
+    lock = _session_locks.get(session_id)
+    if lock is None:
+        lock = _session_locks[session_id] = asyncio.Lock()
+    return lock
+
 
 def create_initial_state(theme: str, session_id: str) -> StoryState:
     """Create initial state for story generation"""
     return {
         "theme": theme,
         "memory_summary": None,
+        "session_summary": None,
         "intent": None,
         "language": "en",
         "story_outline": None,
@@ -28,8 +51,11 @@ def create_initial_state(theme: str, session_id: str) -> StoryState:
         "chapters": [],
         "completed_writers": [],
         "completed_image_gens": [],
+        "reused_chapters": [],
         "finalized_text": None,
         "finalized_images": None,
+        "previous_story": None,
+        "speculative_plan": None,
         "session_id": session_id,
     }
 
@@ -37,31 +63,72 @@ def create_initial_state(theme: str, session_id: str) -> StoryState:
 async def load_state_from_redis(session_id: str) -> Dict[str, Any]:
     """Load state from Redis"""
     try:
-        redis = get_redis()
-        data = await redis.client.get(f"session:{session_id}")
-        return json.loads(data) if data else {}
+        return await session_store.load(session_id)
     except Exception as e:
         logger.error(f"Error loading state from Redis: {e}")
         return {}
 
 
-async def save_state_to_redis(session_id: str, state: Dict[str, Any]):
-    """Save state to Redis"""
+async def save_state_to_redis(session_id: str, state: Dict[str, Any], summary_task: Optional[asyncio.Task] = None):
+    """Save state to Redis (only the fields that changed since the last save)
+
+    A run passes its background summary task. The task is checked under the
+    session lock: a summary written before this save got the lock is finished
+    by then and carried over; one written after it lands on top of the save.
+    """
+    async with _session_lock(session_id):
+        _apply_summary(state, summary_task)
+        await _write_state(session_id, state)
+
+
+async def _write_state(session_id: str, state: Dict[str, Any]):
     try:
-        redis = get_redis()
         serializable_state = {
             k: v for k, v in state.items() 
             if v is not None and isinstance(v, (dict, list, str, int, float, bool))
+            and k not in TRANSIENT_STATE_KEYS
         }
-        await redis.client.setex(
-            f"session:{session_id}",
-            86400,
-            json.dumps(serializable_state, ensure_ascii=False)
-        )
+        await session_store.save(session_id, serializable_state)
     except Exception as e:
         logger.error(f"Error saving state to Redis: {e}")
 
 
+async def update_state_fields(session_id: str, **fields):
+    """Update a few fields of the saved session, if there is one"""
+    async with _session_lock(session_id):
+        try:
+            await session_store.update_fields(session_id, fields)
+        except Exception as e:
+            logger.error(f"Error updating state in Redis: {e}")
+
+
+async def refresh_memory_summary(session_id: str, theme: str, current_summary: Optional[str]) -> str:
+    """Update the memory summary off the critical path and persist it if it changed
+
+    Nothing may be awaited after the write: the task must be done by the time
+    a save waiting on the session lock runs (see save_state_to_redis).
+    """
+    summary = await update_memory_summary(theme, current_summary)
+    if summary and summary != (current_summary or "").strip():
+        await update_state_fields(session_id, memory_summary=summary)
+    return summary
+
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def _apply_summary(state: Dict[str, Any], summary_task: Optional[asyncio.Task]):
+    """Carry a finished background summary into a state about to be saved"""
+    if summary_task is not None and summary_task.done() and not summary_task.cancelled() \
+            and summary_task.exception() is None and summary_task.result():
+        state["memory_summary"] = summary_task.result()
+
+
+
 async def process_chat_request(session_id: str, state: StoryState):
     """Process chat request"""
     from app.agents.conversation import chat_agent
@@ -101,21 +168,53 @@ async def process_chat_request(session_id: str, state: StoryState):
         )
 
 
-async def process_story_generation(session_id: str, state: StoryState):
-    """Process story generation request"""
+def _chapter_completed(agent: str, chapter_id: int, reused: list) -> dict:
+    data = {"agent": f"{agent}_{chapter_id}", "status": "completed", "chapter_id": chapter_id}
+    if chapter_id in reused:
+        data["reused"] = True
+    return data
+
+
+async def process_story_generation(
+    session_id: str,
+    state: StoryState,
+    summary_task: Optional[asyncio.Task] = None,
+    planner_task: Optional[asyncio.Task] = None,
+):
+    """Process story generation request
+
+    summary_task is the background memory summary update started with the
+    run; saves made after it finished keep its result. planner_task is a
+    confirmed speculative planner run whose outline replaces the planner call.
+    """
+    graph = None
+    config = None
+    # Chapter tasks a streaming planner starts early belong to this run only
+    prefetch = ChapterPrefetch()
+    prefetch_token = current_prefetch.set(prefetch)
+    # Writers stream chapter tokens to the session's sockets
+    stream_token = current_chapter_stream.set(DeltaEmitter)
     try:
         await manager.send_to_session(
             create_ws_message("agent_started", session_id, {"agent": "planner", "status": "running"}),
             session_id
         )
         
+        if planner_task is not None:
+            try:
+                state["speculative_plan"] = await planner_task
+            except Exception as e:
+                logger.warning(f"Speculative planner failed, planning again: {e}")
+        
         graph = get_story_graph()
-        config = {"configurable": {"thread_id": session_id}}
+        config = create_thread_config(session_id)
         final_state = state.copy()
         writer_started_sent = False
         writer_completed_count = 0
         illustrator_started_sent = False
         illustrator_completed_count = 0
+        chapter_count = settings.STORY_CHAPTER_COUNT
+        pipelined = settings.STORY_GRAPH_TOPOLOGY == "pipelined"
         
         async for event in graph.astream(state, config):
             for node_name, node_output in event.items():
@@ -149,9 +248,10 @@ async def process_story_generation(session_id: str, state: StoryState):
                             create_ws_message("pipeline_completed", session_id, {"status": "needs_info"}),
                             session_id
                         )
-                        await save_state_to_redis(session_id, final_state)
+                        await save_state_to_redis(session_id, final_state, summary_task)
                         return  # Stop processing, workflow will end
                     
+                    chapter_count = len(chapter_ids(final_state))
                     await manager.send_to_session(
                         create_ws_message("agent_completed", session_id, {"agent": "planner", "status": "completed"}),
                         session_id
@@ -162,16 +262,24 @@ async def process_story_generation(session_id: str, state: StoryState):
                             session_id
                         )
                         writer_started_sent = True
+                    # Pipelined graph starts illustrators together with writers
+                    if pipelined and not illustrator_started_sent:
+                        await manager.send_to_session(
+                            create_ws_message("agent_started", session_id, {"agent": "illustrator", "status": "running"}),
+                            session_id
+                        )
+                        illustrator_started_sent = True
                 
-                elif node_name.startswith("writer_"):
-                    chapter_id = int(node_name.split("_")[1])
-                    if node_output and isinstance(node_output, dict) and "completed_writers" in node_output:
+                elif node_name == "writer":
+                    completed = node_output.get("completed_writers", []) if isinstance(node_output, dict) else []
+                    reused = node_output.get("reused_chapters", []) if isinstance(node_output, dict) else []
+                    for chapter_id in completed:
                         writer_completed_count += 1
                         await manager.send_to_session(
-                            create_ws_message("agent_completed", session_id, {"agent": f"writer_{chapter_id}", "status": "completed", "chapter_id": chapter_id}),
+                            create_ws_message("agent_completed", session_id, _chapter_completed("writer", chapter_id, reused)),
                             session_id
                         )
-                        if writer_completed_count == 4:
+                        if writer_completed_count == chapter_count:
                             await manager.send_to_session(
                                 create_ws_message("agent_completed", session_id, {"agent": "writer", "status": "completed"}),
                                 session_id
@@ -194,15 +302,16 @@ async def process_story_generation(session_id: str, state: StoryState):
                         )
                         illustrator_started_sent = True
                 
-                elif node_name.startswith("illustrator_"):
-                    chapter_id = int(node_name.split("_")[1])
-                    if node_output and isinstance(node_output, dict) and "completed_image_gens" in node_output:
+                elif node_name == "illustrator":
+                    completed = node_output.get("completed_image_gens", []) if isinstance(node_output, dict) else []
+                    reused = node_output.get("reused_chapters", []) if isinstance(node_output, dict) else []
+                    for chapter_id in completed:
                         illustrator_completed_count += 1
                         await manager.send_to_session(
-                            create_ws_message("agent_completed", session_id, {"agent": f"illustrator_{chapter_id}", "status": "completed", "chapter_id": chapter_id}),
+                            create_ws_message("agent_completed", session_id, _chapter_completed("illustrator", chapter_id, reused)),
                             session_id
                         )
-                        if illustrator_completed_count == 4:
+                        if illustrator_completed_count == chapter_count:
                             await manager.send_to_session(
                                 create_ws_message("agent_completed", session_id, {"agent": "illustrator", "status": "completed"}),
                                 session_id
@@ -217,7 +326,7 @@ async def process_story_generation(session_id: str, state: StoryState):
                             session_id
                         )
                         logger.info(f"finalizer_image event sent with {len(chapters)} chapters")
-                    await save_state_to_redis(session_id, final_state)
+                    await save_state_to_redis(session_id, final_state, summary_task)
         
         await manager.send_to_session(
             create_ws_message("pipeline_completed", session_id, {"status": "completed"}),
@@ -229,6 +338,20 @@ async def process_story_generation(session_id: str, state: StoryState):
             create_ws_message("error", session_id, {"agent": "story_generation", "error": str(e)}),
             session_id
         )
+    finally:
+        prefetch.cancel()
+        current_prefetch.reset(prefetch_token)
+        current_chapter_stream.reset(stream_token)
+        if graph is not None:
+            await _release_thread(graph, config)
+
+
+async def _release_thread(graph, config: Dict[str, Any]):
+    """Drop checkpoints of a finished run from the shared graph checkpointer"""
+    try:
+        await graph.checkpointer.adelete_thread(config["configurable"]["thread_id"])
+    except Exception as e:
+        logger.warning(f"Error releasing graph thread: {e}")
 
 
 def _restore_state(saved_state: Dict[str, Any], theme: str, session_id: str) -> StoryState:
@@ -263,6 +386,7 @@ def _prepare_story_state(
     base_state = {
         "theme": theme,
         "memory_summary": saved_state.get("memory_summary") if saved_state else None,
+        "session_summary": saved_state.get("memory_summary") if saved_state else None,
         "session_id": session_id,
         "intent": None,
         "needs_info": False,
@@ -271,14 +395,19 @@ def _prepare_story_state(
         "chapters": [],
         "completed_writers": [],
         "completed_image_gens": [],
+        "reused_chapters": [],
         "finalized_text": None,
         "finalized_images": None,
+        "previous_story": None,
+        "speculative_plan": None,
     }
     
     if intent == "regenerate" and saved_state and saved_state.get("story_outline"):
         base_state.update({
             "story_outline": saved_state.get("story_outline"),
             "language": saved_state.get("language", "en"),
+            # Unchanged chapters are reused instead of regenerated
+            "previous_story": build_previous_story(saved_state),
         })
     else:
         base_state.update({
@@ -289,10 +418,28 @@ def _prepare_story_state(
     return base_state
 
 
+def _start_speculation(saved_state: Dict[str, Any], theme: str, session_id: str) -> Optional[SpeculativePlanner]:
+    """Start the planner before routing when the router will need its LLM call
+
+    The guess is regenerate for a session that already has a story, else a new story.
+    """
+    summary = saved_state.get("memory_summary") if saved_state else None
+    if not settings.SPECULATIVE_PLANNER or not worth_speculating(theme, summary):
+        return None
+    intent = "regenerate" if saved_state and saved_state.get("story_outline") else "story_generate"
+    state = _prepare_story_state(saved_state, theme, session_id, intent)
+    state.update({"intent": intent, "memory_summary": (summary or "").strip()})
+    return SpeculativePlanner(state)
+
+
 async def handle_websocket_message(session_id: str, theme: str):
     """Handle message from WebSocket"""
+    # Provider calls made on behalf of this message queue fairly under this session
+    session_token = current_session.set(session_id)
+    speculation = None
     try:
         saved_state = await load_state_from_redis(session_id)
+        speculation = _start_speculation(saved_state, theme, session_id)
         
         router_result = await router_agent({
             "theme": theme,
@@ -301,12 +448,19 @@ async def handle_websocket_message(session_id: str, theme: str):
         })
         
         intent = router_result.get("intent", "story_generate")
+        planner_task = speculation.resolve(intent) if speculation else None
         
         if intent in ["story_generate", "regenerate"]:
             state = _prepare_story_state(saved_state, theme, session_id, intent)
             state.update(router_result)
             await save_state_to_redis(session_id, state)
-            await process_story_generation(session_id, state)
+            # The summary is only needed by later turns; don't hold the pipeline for it
+            summary_task = _spawn(refresh_memory_summary(
+                session_id, theme, saved_state.get("memory_summary") if saved_state else None
+            ))
+            await process_story_generation(
+                session_id, state, summary_task=summary_task, planner_task=planner_task
+            )
         elif intent == "chat":
             state = _restore_state(saved_state, theme, session_id)
             state.update(router_result)
@@ -323,3 +477,8 @@ async def handle_websocket_message(session_id: str, theme: str):
             create_ws_message("error", session_id, {"error": str(e)}),
             session_id
         )
+    finally:
+        # No-op once adopted by the pipeline; stops it on errors and cancellation
+        if speculation is not None:
+            speculation.cancel()
+        current_session.reset(session_token)
@@ -2,56 +2,334 @@
 WebSocket endpoints for real-time story generation updates
 """
 import json
+import time
 import uuid
+import asyncio
 import logging
-from typing import Dict, Set
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
 from datetime import datetime
 
 from fastapi import WebSocket, WebSocketDisconnect
 from fastapi.routing import APIRouter
 
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.api.broadcast import LocalBroadcast, create_broadcast
+from app.api.event_log import EventLog, UNLOGGED_EVENTS
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+_dropped_events = metrics.counter("ws_dropped_events_total", "Outbound events dropped or merged for lagging sockets")
+_slow_disconnects = metrics.counter("ws_slow_consumer_disconnects_total", "Sockets closed for falling too far behind")
+
+
+class ConnectionWriter:
+    """Bounded outbound queue drained by one writer task per socket
+    
+    put() never waits, so a slow client can't stall other tabs or the
+    pipeline. Queued chapter_delta events of the same chapter are merged;
+    once the queue fills, pending deltas are dropped and that chapter
+    stops streaming to this socket (its text still arrives with
+    finalizer_text). A socket whose queue is still full, or whose send
+    exceeds the timeout, is closed.
+    """
+    
+    def __init__(
+        self,
+        websocket: WebSocket,
+        connection_id: str,
+        on_slow: Callable[[], None],
+        max_queue: Optional[int] = None,
+        send_timeout: Optional[float] = None,
+        replay_pending: bool = False,
+    ):
+        self.websocket = websocket
+        self.connection_id = connection_id
+        self.on_slow = on_slow
+        self.max_queue = max_queue or settings.WS_SEND_QUEUE_SIZE
+        self.send_timeout = send_timeout or settings.WS_SEND_TIMEOUT_SECONDS
+        self.queue: Deque[dict] = deque()
+        self.closed = False
+        self._muted_chapters: Set[Any] = set()
+        # Logged event ids queued before a pending replay (None once replayed, or
+        # without one), then replayed ids still expected live (see replay)
+        self._seen: Optional[Set[str]] = set() if replay_pending else None
+        self._replayed: Set[str] = set()
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task = asyncio.create_task(self._run())
+    
+    def put(self, message: dict):
+        if self.closed:
+            return
+        event_id = message.get("event_id")
+        if event_id in self._replayed:
+            self._replayed.discard(event_id)
+            return
+        if self._seen is not None and message.get("type") not in UNLOGGED_EVENTS:
+            self._seen.add(event_id)
+        if message.get("type") == "chapter_delta":
+            chapter_id = message["data"].get("chapter_id")
+            if chapter_id in self._muted_chapters:
+                _dropped_events.inc(reason="muted")
+                return
+            if self._merge_into_tail(message):
+                return
+        if len(self.queue) >= self.max_queue:
+            self._shed_deltas()
+            if len(self.queue) >= self.max_queue:
+                self._slow("queue full")
+                return
+        self.queue.append(message)
+        self._idle.clear()
+        self._ready.set()
+    
+    def replay(self, messages: List[dict]):
+        """Queue missed events ahead of live ones
+        
+        Events already queued live are skipped, and replayed events that
+        are still on their way live are dropped when they arrive.
+        """
+        missed = [m for m in messages if m.get("event_id") not in (self._seen or ())]
+        missed = missed[-(self.max_queue // 2):]
+        self._seen = None
+        self._replayed = {m.get("event_id") for m in missed}
+        if missed and not self.closed:
+            self.queue.extendleft(reversed(missed))
+            self._idle.clear()
+            self._ready.set()
+    
+    def _merge_into_tail(self, message: dict) -> bool:
+        tail = self.queue[-1] if self.queue else None
+        if tail is None or tail.get("type") != "chapter_delta" \
+                or tail["data"].get("chapter_id") != message["data"].get("chapter_id"):
+            return False
+        # Messages are shared between sockets, so replace the tail instead of mutating it
+        self.queue[-1] = {**tail, "data": {**tail["data"], "delta": tail["data"]["delta"] + message["data"]["delta"]}}
+        _dropped_events.inc(reason="merged")
+        return True
+    
+    def _shed_deltas(self):
+        kept: Deque[dict] = deque()
+        for queued in self.queue:
+            if queued.get("type") == "chapter_delta":
+                self._muted_chapters.add(queued["data"].get("chapter_id"))
+                _dropped_events.inc(reason="lagging")
+            else:
+                kept.append(queued)
+        if len(kept) < len(self.queue):
+            logger.warning(f"Connection {self.connection_id} is lagging, dropped streamed deltas")
+        self.queue = kept
+    
+    def _slow(self, reason: str):
+        logger.warning(f"Closing slow connection {self.connection_id}: {reason}")
+        _slow_disconnects.inc(reason=reason)
+        self.close()
+        self.on_slow()
+        asyncio.get_running_loop().create_task(self._close_socket())
+    
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=1013)
+        except Exception:
+            pass
+    
+    async def _run(self):
+        while True:
+            while not self.queue:
+                self._idle.set()
+                self._ready.clear()
+                await self._ready.wait()
+            message = self.queue.popleft()
+            try:
+                await asyncio.wait_for(self.websocket.send_json(message), self.send_timeout)
+            except asyncio.TimeoutError:
+                self._slow("send timeout")
+                return
+            except Exception as e:
+                logger.error(f"Error sending message to {self.connection_id}: {e}")
+    
+    async def flush(self):
+        """Wait until everything queued so far has been sent"""
+        if not self.closed:
+            await self._idle.wait()
+    
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        self._idle.set()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+
 
 class ConnectionManager:
-    """Manages WebSocket connections"""
+    """Manages WebSocket connections
     
-    def __init__(self):
+    Sockets are local to this worker; events go through the broadcast
+    backend, which hands them to whichever workers hold the session's sockets.
+    """
+    
+    def __init__(self, broadcast: Optional[LocalBroadcast] = None):
         self.active_connections: Dict[str, WebSocket] = {}
         self.session_connections: Dict[str, Set[str]] = {}
+        self.writers: Dict[str, ConnectionWriter] = {}
+        self.events = EventLog()
+        self._broadcast = broadcast
+        self.control_handler: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
     
-    async def connect(self, websocket: WebSocket, connection_id: str, session_id: str):
+    @property
+    def broadcast(self) -> LocalBroadcast:
+        if self._broadcast is None:
+            self._broadcast = create_broadcast()
+            self._broadcast.bind(self._deliver_local, self._on_control)
+        return self._broadcast
+    
+    async def connect(self, websocket: WebSocket, connection_id: str, session_id: str, replay_pending: bool = False):
+        """Register a socket; replay_pending if replay() will follow for it"""
         await websocket.accept()
         self.active_connections[connection_id] = websocket
+        self.writers[connection_id] = ConnectionWriter(
+            websocket, connection_id, on_slow=lambda: self.disconnect(connection_id, session_id),
+            replay_pending=replay_pending,
+        )
         
         if session_id not in self.session_connections:
             self.session_connections[session_id] = set()
+            await self.broadcast.subscribe(session_id)
         self.session_connections[session_id].add(connection_id)
     
     def disconnect(self, connection_id: str, session_id: str):
         if connection_id in self.active_connections:
             del self.active_connections[connection_id]
+        writer = self.writers.pop(connection_id, None)
+        if writer is not None:
+            writer.close()
         
         if session_id in self.session_connections:
             self.session_connections[session_id].discard(connection_id)
             if not self.session_connections[session_id]:
                 del self.session_connections[session_id]
+                self.broadcast.unsubscribe(session_id)
+    
+    async def is_connected(self, session_id: str) -> bool:
+        """Whether the session has a socket on this or any other worker"""
+        return session_id in self.session_connections or await self.broadcast.has_subscribers(session_id)
     
     async def send_to_session(self, message: dict, session_id: str):
-        if session_id in self.session_connections:
-            for connection_id in list(self.session_connections[session_id]):
-                if connection_id in self.active_connections:
-                    try:
-                        await self.active_connections[connection_id].send_json(message)
-                    except Exception as e:
-                        logger.error(f"Error sending message to {connection_id}: {e}")
+        # Log before publishing so a socket that reconnects in between finds it in the replay
+        await self.events.append(session_id, message)
+        await self.broadcast.publish(session_id, message)
+    
+    async def replay(self, connection_id: str, session_id: str, last_event_id: Optional[str]):
+        """Resend the events a reconnecting socket missed since last_event_id"""
+        writer = self.writers.get(connection_id)
+        if writer is not None:
+            writer.replay(await self.events.read_after(session_id, last_event_id))
+    
+    async def flush(self, session_id: str):
+        """Wait until this worker's sockets of the session have sent everything queued"""
+        for connection_id in list(self.session_connections.get(session_id, ())):
+            writer = self.writers.get(connection_id)
+            if writer is not None:
+                await writer.flush()
+    
+    async def _on_control(self, message: Dict[str, Any]):
+        if self.control_handler is not None:
+            await self.control_handler(message)
+    
+    async def close(self):
+        await self.broadcast.close()
+    
+    async def _deliver_local(self, session_id: str, message: dict):
+        """Enqueue on every local socket of the session; never waits for the network"""
+        for connection_id in list(self.session_connections.get(session_id, ())):
+            writer = self.writers.get(connection_id)
+            if writer is not None:
+                writer.put(message)
 
 
 manager = ConnectionManager()
 
 
+class SessionTasks:
+    """Runs at most one message pipeline per session as a tracked task
+
+    A newer message supersedes (cancels) the running one, and a pipeline
+    left without any connected socket is cancelled after a grace period.
+    Cancellation propagates into the graph and in-flight provider calls.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def running(self, session_id: str) -> bool:
+        task = self.tasks.get(session_id)
+        return task is not None and not task.done()
+
+    async def start(self, session_id: str, pipeline: Awaitable) -> asyncio.Task:
+        """Cancel the session's running pipeline, wait for it to unwind, then start this one"""
+        if await self.cancel(session_id, reason="superseded"):
+            await manager.send_to_session(
+                create_ws_message("pipeline_completed", session_id, {"status": "cancelled", "reason": "superseded"}),
+                session_id
+            )
+        # Replay on reconnect only covers the current run
+        await manager.events.reset(session_id)
+        task = asyncio.create_task(pipeline)
+        self.tasks[session_id] = task
+        task.add_done_callback(lambda done: self._forget(session_id, done))
+        return task
+
+    def _forget(self, session_id: str, task: asyncio.Task):
+        if self.tasks.get(session_id) is task:
+            del self.tasks[session_id]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Pipeline for session {session_id} failed: {task.exception()}")
+
+    async def cancel(self, session_id: str, reason: Optional[str] = None) -> bool:
+        """Cancel the running pipeline of a session; True if there was one here
+        
+        With a reason, other workers are asked to cancel theirs too (the
+        session may have reconnected to a different worker).
+        """
+        if reason is not None:
+            await manager.broadcast.publish_control({"action": "cancel", "session_id": session_id, "reason": reason})
+        task = self.tasks.get(session_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        # Let it unwind (checkpoint cleanup, final saves) before anything else touches the session
+        await asyncio.wait({task})
+        return True
+
+    async def cancel_if_abandoned(self, session_id: str, grace: Optional[float] = None):
+        """Cancel the pipeline if no socket of the session reconnects within the grace period"""
+        if not self.running(session_id):
+            return
+        await asyncio.sleep(settings.SESSION_CANCEL_GRACE_SECONDS if grace is None else grace)
+        if not await manager.is_connected(session_id) and await self.cancel(session_id):
+            logger.info(f"Cancelled pipeline of disconnected session {session_id}")
+
+    async def handle_control(self, message: Dict[str, Any]):
+        """Apply a cancel request published by another worker"""
+        if message.get("action") != "cancel":
+            return
+        session_id = message.get("session_id", "")
+        if await self.cancel(session_id) and message.get("reason") == "user":
+            await manager.send_to_session(
+                create_ws_message("pipeline_completed", session_id, {"status": "cancelled", "reason": "user"}),
+                session_id
+            )
+
+
+session_tasks = SessionTasks()
+manager.control_handler = session_tasks.handle_control
+
+
 def create_ws_message(event_type: str, session_id: str, data: dict) -> dict:
     return {
         "event_id": str(uuid.uuid4()),
@@ -62,12 +340,68 @@ def create_ws_message(event_type: str, session_id: str, data: dict) -> dict:
     }
 
 
+class DeltaEmitter:
+    """Forwards streamed chapter tokens as chapter_delta events.
+
+    Keeps at most one send in flight per chapter; tokens that arrive while a
+    send is pending are coalesced into the next delta, so a slow socket never
+    stalls the producing LLM stream.
+    """
+
+    def __init__(self, session_id: str, chapter_id: int, min_interval: float = 0.05, min_chars: int = 24):
+        self.session_id = session_id
+        self.chapter_id = chapter_id
+        self.min_interval = min_interval
+        self.min_chars = min_chars
+        self.index = 0
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        self._last_flush = 0.0
+        self._sending: Optional[asyncio.Task] = None
+
+    def push(self, text: str):
+        self._buffer.append(text)
+        self._buffered_chars += len(text)
+        if self._sending is not None and not self._sending.done():
+            return
+        due = time.monotonic() - self._last_flush >= self.min_interval
+        if due or self._buffered_chars >= self.min_chars:
+            self._sending = asyncio.create_task(self._send(self._take()))
+
+    def _take(self) -> str:
+        text = "".join(self._buffer)
+        self._buffer.clear()
+        self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+        return text
+
+    async def _send(self, delta: str):
+        message = create_ws_message("chapter_delta", self.session_id, {
+            "chapter_id": self.chapter_id,
+            "index": self.index,
+            "delta": delta,
+        })
+        self.index += 1
+        await manager.send_to_session(message, self.session_id)
+
+    async def aclose(self):
+        """Wait for the pending send and flush remaining tokens"""
+        if self._sending is not None:
+            await self._sending
+        if self._buffer:
+            await self._send(self._take())
+
+
 @router.websocket("/ws/{session_id}")
-async def websocket_endpoint(websocket: WebSocket, session_id: str):
+async def websocket_endpoint(websocket: WebSocket, session_id: str, last_event_id: Optional[str] = None):
     connection_id = str(uuid.uuid4())
     
     try:
-        await manager.connect(websocket, connection_id, session_id)
+        await manager.connect(websocket, connection_id, session_id, replay_pending=last_event_id is not None)
+        
+        # A reconnecting client passes the last event it saw and gets what it missed
+        if last_event_id is not None:
+            await manager.replay(connection_id, session_id, last_event_id)
         
         await manager.send_to_session(
             create_ws_message("session_ready", session_id, {"session_id": session_id}),
@@ -84,7 +418,14 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                 
                 if message_type == "message" and theme:
                     from app.api.story import handle_websocket_message
-                    await handle_websocket_message(session_id, theme)
+                    # Run in the background so this loop can still receive a cancel or correction
+                    await session_tasks.start(session_id, handle_websocket_message(session_id, theme))
+                elif message_type == "cancel":
+                    if await session_tasks.cancel(session_id, reason="user"):
+                        await manager.send_to_session(
+                            create_ws_message("pipeline_completed", session_id, {"status": "cancelled", "reason": "user"}),
+                            session_id
+                        )
                 else:
                     logger.warning(f"Invalid message format: {message}")
             except json.JSONDecodeError:
@@ -101,3 +442,6 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         manager.disconnect(connection_id, session_id)
+    
+    if session_id not in manager.session_connections:
+        await session_tasks.cancel_if_abandoned(session_id)
@@ -50,15 +50,97 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: Optional[str] = None
     OPENAI_MODEL: str = "gpt-4o-mini"
 
+    # Provider admission control (per process); rpm / tpm of 0 disable pacing
+    NOVA_MAX_CONCURRENCY: int = 8
+    NOVA_RPM: int = 0
+    NOVA_TPM: int = 0
+    OPENAI_MAX_CONCURRENCY: int = 8
+    OPENAI_RPM: int = 0
+    OPENAI_TPM: int = 0
+
+    # Provider routing: try the currently faster provider first (after enough samples)
+    TEXT_LATENCY_ROUTING: bool = True
+    TEXT_ROUTING_MIN_SAMPLES: int = 10
+    TEXT_STATS_WINDOW: int = 50
+    # Hedging: start the other provider once the first is slower than this latency percentile.
+    # Only used when both providers can be cancelled (not Nova, whose calls run to completion)
+    TEXT_HEDGING: bool = False
+    TEXT_HEDGE_PERCENTILE: float = 0.95
+    TEXT_HEDGE_MIN_DELAY: float = 2.0
+
+    # Keep-alive connection pool of each shared LLM client (per process)
+    TEXT_CLIENT_MAX_CONNECTIONS: int = 20
+    TEXT_CLIENT_MAX_KEEPALIVE: int = 10
+    TEXT_CLIENT_KEEPALIVE_EXPIRY: float = 30.0
+
     # IMAGE GENERATION CONFIG
     # Runware Image configs
     RUNWARE_API_KEY: Optional[str] = None
     RUNWARE_IMAGE_MODEL: str = "runware:101@1" 
     RUNWARE_API_BASE_URL: str = "https://api.runware.ai/v1"
+    # Max in-flight requests on the shared Runware connection (per process)
+    RUNWARE_MAX_CONCURRENCY: int = 4
+    RUNWARE_RPM: int = 0
+
+    # Content-addressed image URL cache (Redis): prompt + model + size -> URL
+    IMAGE_CACHE_ENABLED: bool = True
+    IMAGE_CACHE_TTL_SECONDS: int = 24 * 3600
+    IMAGE_CACHE_MAX_ENTRIES: int = 10000
 
     # Fixed style for consistent image generation
     # This style description will be appended to all image prompts
     IMAGE_STYLE: str = "Children's storybook illustration style, no text, no words in the image."
+
+    # STORY WORKFLOW CONFIG
+    # Graph topology: "sequential" (illustrators after text) or "pipelined" (illustrators start with the outline, alongside writers).
+    # Pipelining needs the run's ChapterPrefetch (set by process_story_generation); without it the run is sequential
+    STORY_GRAPH_TOPOLOGY: str = "sequential"
+    # Chapters per book; writers and illustrators fan out one task per chapter
+    STORY_CHAPTER_COUNT: int = 4
+    # Max chapters written / illustrated at the same time (per process)
+    WRITER_MAX_CONCURRENCY: int = 4
+    ILLUSTRATOR_MAX_CONCURRENCY: int = 4
+    # Planner outline cache (Redis), keyed by normalized theme, language and prompt version
+    PLANNER_CACHE_ENABLED: bool = True
+    PLANNER_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    PLANNER_CACHE_MAX_ENTRIES: int = 5000
+    # Near-duplicate match on theme shingles (Jaccard similarity)
+    PLANNER_CACHE_FUZZY: bool = False
+    PLANNER_CACHE_FUZZY_THRESHOLD: float = 0.8
+    # Classify obvious intents (greetings, questions, first message, edits) without the router LLM
+    ROUTER_FAST_PATH: bool = True
+    # Start the planner together with the router LLM call; discarded if the router picks chat
+    SPECULATIVE_PLANNER: bool = False
+    # Stream the planner's outline and start each chapter's tasks as soon as it is planned
+    PLANNER_STREAMING: bool = False
+    # Stream chapter tokens to the client as chapter_delta events (plain prose instead of JSON output)
+    WRITER_STREAMING: bool = False
+    # "parallel" (one writer call per chapter) or "batched" (one call writes a group of chapters)
+    WRITER_MODE: str = "parallel"
+    # Chapters per batched writer call (at least 1); bounds the output tokens of one call
+    WRITER_BATCH_SIZE: int = 4
+
+    # WebSocket event fan-out: "local" (single worker) or "redis" (pub/sub across workers / replicas)
+    WS_BROADCAST_BACKEND: str = "local"
+    # Per-socket outbound queue; lagging sockets lose streamed deltas first, then get closed
+    WS_SEND_QUEUE_SIZE: int = 256
+    WS_SEND_TIMEOUT_SECONDS: float = 10.0
+    # Per-session event log (Redis Stream) replayed to sockets reconnecting with ?last_event_id=
+    EVENT_LOG_ENABLED: bool = True
+    EVENT_LOG_MAX_LEN: int = 1000
+    EVENT_LOG_TTL_SECONDS: int = 24 * 3600
+    # Session state encoding: "json" | "orjson" | "msgpack", compressed ("zstd" | "zlib" | "none") above the threshold
+    SESSION_CODEC: str = "orjson"
+    SESSION_COMPRESSION: str = "zstd"
+    SESSION_COMPRESS_MIN_BYTES: int = 1024
+    # Keep a session's running pipeline this long after its last socket closes (reconnects resume it)
+    SESSION_CANCEL_GRACE_SECONDS: float = 10.0
+
+    # Story workflow checkpointer: bounded, per process; checkpoints are scratch state of one run
+    CHECKPOINT_MAX_BYTES: int = 64 * 1024 * 1024
+    CHECKPOINT_MAX_THREADS: int = 1000
+    CHECKPOINT_TTL_SECONDS: int = 3600
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -13,6 +13,7 @@ class RedisClient:
     
     def __init__(self):
         self._client: Optional[aioredis.Redis] = None
+        self._binary_client: Optional[aioredis.Redis] = None
     
     async def connect(self):
         """Initialize Redis connection"""
@@ -31,6 +32,9 @@ class RedisClient:
         if self._client:
             await self._client.close()
             self._client = None
+        if self._binary_client:
+            await self._binary_client.close()
+            self._binary_client = None
     
     @property
     def client(self) -> aioredis.Redis:
@@ -38,6 +42,18 @@ class RedisClient:
         if self._client is None:
             raise RuntimeError("Redis client not initialized. Call connect() first.")
         return self._client
+    
+    @property
+    def binary_client(self) -> aioredis.Redis:
+        """Get Redis client that returns raw bytes (for binary-encoded values)"""
+        if self._binary_client is None:
+            if self._client is None:
+                raise RuntimeError("Redis client not initialized. Call connect() first.")
+            self._binary_client = aioredis.from_url(
+                getattr(settings, 'REDIS_URL', 'redis://localhost:6379/0'),
+                decode_responses=False,
+            )
+        return self._binary_client
 
 
 @lru_cache()
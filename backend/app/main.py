@@ -2,12 +2,17 @@
 FastAPI main application entry point
 """
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from app.core.config import settings
 from app.core.redis import get_redis
+from app.core.metrics import metrics
+from app.agents.workflow import warmup_story_graph
+from app.services.ai_services import close_text_generator, close_image_generator
 from app.api import router as api_router
+from app.api.websocket import manager
 
 
 @asynccontextmanager
@@ -19,11 +24,17 @@ async def lifespan(app: FastAPI):
     redis_client = get_redis()
     await redis_client.connect()
     print("Redis connected")
+    warmup_story_graph()
+    print("Story graph compiled")
     
     yield
     
     # Shutdown
     print(f"Shutting down {settings.APP_NAME}...")
+    await close_text_generator()
+    await close_image_generator()
+    print("AI service connections closed")
+    await manager.close()
     await redis_client.disconnect()
     print("Redis disconnected")
 
@@ -65,3 +76,8 @@ async def health_check():
         "service": settings.APP_NAME,
     }
 
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus metrics endpoint"""
+    return metrics.render()
@@ -1,56 +1,182 @@
 """
 Image generation service using Runware SDK
 """
+import asyncio
+import hashlib
 import logging
+from functools import lru_cache
+from typing import Dict, Optional
+
 from runware import Runware, IImageInference
 
 from app.core.config import settings
+from app.services.ai_services.limiter import ProviderLimiter
+from app.services.cache import RedisLRUCache
 
 logger = logging.getLogger(__name__)
 
 
+class _SharedRequest:
+    """One provider call shared by identical requests in flight, with its waiter count"""
+
+    def __init__(self, task: "asyncio.Task[str]"):
+        self.task = task
+        self.waiters = 0
+
+
 class ImageGenerator:
-    """Image generator class using Runware SDK"""
+    """Image generator class using Runware SDK.
 
-    def __init__(self):
+    One instance is shared by the whole process: the websocket connection is
+    opened lazily, health-checked before each request, re-established when it
+    drops, and requests are admitted by a ProviderLimiter (RUNWARE_MAX_CONCURRENCY,
+    RUNWARE_RPM).
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None):
         self.runware = Runware(api_key=settings.RUNWARE_API_KEY)
         self.model = settings.RUNWARE_IMAGE_MODEL
+        self.width = 1024
+        self.height = 1024
+        self.max_concurrency = max_concurrency
         self._connected = False
+        self._connect_lock = asyncio.Lock()
+        self._limiter: Optional[ProviderLimiter] = None
+        self._cache: Optional[RedisLRUCache] = None
+        self._inflight: Dict[str, _SharedRequest] = {}
+
+    @property
+    def limiter(self) -> ProviderLimiter:
+        if self._limiter is None:
+            self._limiter = ProviderLimiter(
+                "runware",
+                self.max_concurrency or settings.RUNWARE_MAX_CONCURRENCY,
+                rpm=settings.RUNWARE_RPM,
+            )
+        return self._limiter
+
+    @property
+    def cache(self) -> RedisLRUCache:
+        if self._cache is None:
+            self._cache = RedisLRUCache("image", settings.IMAGE_CACHE_MAX_ENTRIES, settings.IMAGE_CACHE_TTL_SECONDS)
+        return self._cache
+
+    def is_healthy(self) -> bool:
+        """Check that the Runware websocket is open"""
+        try:
+            return self._connected and self.runware.connected()
+        except Exception:
+            return False
 
     async def connect(self):
-        if not self._connected:
+        if self.is_healthy():
+            return
+        async with self._connect_lock:
+            if self.is_healthy():
+                return
+            if self._connected:
+                logger.warning("Runware connection lost, reconnecting")
+                await self._reset()
             await self.runware.connect()
             self._connected = True
 
+    async def _reset(self):
+        """Drop the current connection so the next request reconnects"""
+        self._connected = False
+        try:
+            await self.runware.disconnect()
+        except Exception as e:
+            logger.debug(f"Error disconnecting Runware: {e}")
+
+    async def close(self):
+        """Close the Runware connection"""
+        if self._connected:
+            await self._reset()
+
     def _build_prompt(self, prompt: str) -> str:
         """Build image generation prompt with fixed style"""
         return f"{prompt}, {settings.IMAGE_STYLE}"
 
+    def cache_key(self, prompt: str) -> str:
+        """Content address of a request: hash of final prompt, model and size"""
+        content = f"{self._build_prompt(prompt)}\n{self.model}\n{self.width}x{self.height}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
     async def generate(self, prompt: str) -> str:
-        """Generate image and return URL"""
-        await self.connect()
+        """Generate image and return URL, reusing cached results for identical requests"""
+        if not settings.IMAGE_CACHE_ENABLED:
+            return await self._generate(prompt)
+        
+        key = self.cache_key(prompt)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        # Identical requests already in flight share one provider call
+        shared = self._inflight.get(key)
+        if shared is None:
+            shared = self._inflight[key] = _SharedRequest(asyncio.create_task(self._generate_and_cache(key, prompt)))
+            shared.task.add_done_callback(lambda _: self._forget(key, shared))
+        shared.waiters += 1
+        try:
+            return await asyncio.shield(shared.task)
+        finally:
+            shared.waiters -= 1
+            if not shared.waiters and not shared.task.done():
+                # Last interested caller left (e.g. its session was cancelled): stop the
+                # call, and forget it now so a new caller starts a fresh one
+                self._forget(key, shared)
+                shared.task.cancel()
+
+    def _forget(self, key: str, shared: _SharedRequest):
+        if self._inflight.get(key) is shared:
+            del self._inflight[key]
+
+    async def _generate_and_cache(self, key: str, prompt: str) -> str:
+        url = await self._generate(prompt)
+        await self.cache.set(key, url)
+        return url
 
+    async def _generate(self, prompt: str) -> str:
         request = IImageInference(
             positivePrompt=self._build_prompt(prompt),
             model=self.model,
-            width=1024,
-            height=1024,
+            width=self.width,
+            height=self.height,
             numberResults=1,
         )
 
-        try:
-            results = await self.runware.imageInference(requestImage=request)
-            if not results:
-                raise RuntimeError("Runware returned empty result")
-            return results[0].imageURL
-        except Exception as e:
-            logger.exception("Runware image generation failed")
-            raise RuntimeError("Image generation failed") from e
+        async with self.limiter.slot():
+            for attempt in range(2):
+                try:
+                    await self.connect()
+                    results = await self.runware.imageInference(requestImage=request)
+                    if not results:
+                        raise RuntimeError("Runware returned empty result")
+                    return results[0].imageURL
+                except Exception as e:
+                    if attempt == 0 and not self.is_healthy():
+                        logger.warning(f"Runware request failed on a dropped connection, retrying: {e}")
+                        continue
+                    logger.exception("Runware image generation failed")
+                    raise RuntimeError("Image generation failed") from e
+
+
+@lru_cache()
+def _shared_image_generator() -> ImageGenerator:
+    return ImageGenerator()
 
 
 def get_image_generator() -> ImageGenerator:
-    """Create Runware image generator"""
+    """Get shared Runware image generator"""
     if not settings.RUNWARE_API_KEY:
         raise ValueError("Runware API key required")
-    
-    return ImageGenerator()
+
+    return _shared_image_generator()
+
+
+async def close_image_generator():
+    """Close the shared Runware connection, if one was created"""
+    if _shared_image_generator.cache_info().currsize:
+        await _shared_image_generator().close()
+        _shared_image_generator.cache_clear()
@@ -0,0 +1,186 @@
+"""
+Admission control for provider calls
+
+Each provider client owns a ProviderLimiter that caps in-flight calls, paces
+requests/tokens per minute with token buckets, and hands free slots to
+waiting sessions round-robin so one large book can't starve other sessions.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Optional, TypeVar
+
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Session the current task works for; set once per websocket message and
+# inherited by every graph task spawned from it
+current_session: contextvars.ContextVar[str] = contextvars.ContextVar("current_session", default="-")
+
+_queue_depth = metrics.gauge("ai_limiter_queue_depth", "Provider calls waiting for a slot")
+_in_flight = metrics.gauge("ai_limiter_in_flight", "Provider calls currently running")
+_wait_seconds = metrics.histogram("ai_limiter_wait_seconds", "Time spent waiting for admission")
+_admitted = metrics.counter("ai_limiter_admitted_total", "Provider calls admitted")
+
+
+def estimate_tokens(prompt: str, max_tokens: Optional[int] = None) -> int:
+    """Rough token cost of a call: ~4 chars per prompt token plus the output budget"""
+    return len(prompt) // 4 + (max_tokens or 0)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute
+
+    Acquire takes tokens immediately (the level may go negative) and sleeps
+    until the debt is repaid, so callers are paced in arrival order without a lock.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount and return how long the caller must wait"""
+        self._refill()
+        self.level -= min(amount, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+
+class FairSemaphore:
+    """Semaphore that grants slots round-robin across keys (sessions)"""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.in_use = 0
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    async def acquire(self, key: str):
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was handed over as we were cancelled, pass it on
+                self.release()
+            else:
+                self._discard(key, future)
+            raise
+
+    def _discard(self, key: str, future: asyncio.Future):
+        queue = self._waiters.get(key)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            if not queue:
+                del self._waiters[key]
+
+    def release(self):
+        while self._waiters:
+            key, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            if queue:
+                self._waiters.move_to_end(key)
+            else:
+                del self._waiters[key]
+            if not future.done():
+                # Hand the slot over directly; in_use stays the same
+                future.set_result(None)
+                return
+        self.in_use -= 1
+
+
+class ProviderLimiter:
+    """Concurrency cap, rpm / tpm pacing and fair queuing for one provider
+
+    rpm / tpm of 0 disable the corresponding bucket.
+    """
+
+    def __init__(self, provider: str, max_concurrency: int, rpm: int = 0, tpm: int = 0):
+        self.provider = provider
+        self.semaphore = FairSemaphore(max_concurrency)
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+
+    def _pacing_delay(self, tokens: int) -> float:
+        delay = 0.0
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None and tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        return delay
+
+    async def _admit(self, tokens: int, session_id: Optional[str]):
+        """Wait for a slot and the rate limits; the caller must _release the slot"""
+        session_id = session_id or current_session.get()
+        started = time.monotonic()
+        _queue_depth.inc(provider=self.provider)
+        try:
+            await self.semaphore.acquire(session_id)
+        finally:
+            _queue_depth.dec(provider=self.provider)
+        try:
+            delay = self._pacing_delay(tokens)
+            if delay > 0:
+                logger.debug(f"{self.provider} rate limit, pacing call by {delay:.2f}s")
+                await asyncio.sleep(delay)
+        except BaseException:
+            self.semaphore.release()
+            raise
+        waited = time.monotonic() - started
+        _wait_seconds.observe(waited, provider=self.provider)
+        _admitted.inc(provider=self.provider)
+        _in_flight.inc(provider=self.provider)
+
+    def _release(self):
+        _in_flight.dec(provider=self.provider)
+        self.semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0, session_id: Optional[str] = None) -> AsyncIterator[None]:
+        """Wait for admission, then hold a slot for the duration of the call"""
+        await self._admit(tokens, session_id)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def run_in_thread(self, call: Callable[[], T], tokens: int = 0, session_id: Optional[str] = None) -> T:
+        """Run a blocking provider call in a worker thread under a slot
+
+        Cancelling the caller can't stop the thread, so the slot is held until
+        the thread returns, not until the caller stops waiting.
+        """
+        await self._admit(tokens, session_id)
+        try:
+            future = asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, call)
+        except BaseException:
+            self._release()
+            raise
+
+        def finished(future: asyncio.Future):
+            if not future.cancelled():
+                future.exception()  # retrieved here when the caller left early
+            self._release()
+
+        future.add_done_callback(finished)
+        return await asyncio.shield(future)
@@ -2,22 +2,37 @@
 Text generation service with fallback
 Primary: Nova, Fallback: GPT-4o-mini
 """
-from typing import Optional, Dict, Any, Callable
+from typing import Optional, Dict, Any, Callable, AsyncIterator, Deque, Tuple
 from abc import ABC, abstractmethod
+from collections import deque
+from functools import lru_cache
+import asyncio
 import json
+import threading
+import time
+import httpx
+from botocore.config import Config as BotoConfig
 from langchain_aws import ChatBedrockConverse
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
 import logging
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.ai_services.limiter import ProviderLimiter, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+_hedges = metrics.counter("text_hedged_requests_total", "Hedged requests started on the second provider")
+_hedge_wins = metrics.counter("text_hedge_wins_total", "Hedged requests won by the second provider")
+
 
 class TextGenerator(ABC):
     """Base text generator class"""
 
+    # Whether cancelling a call also stops the provider request
+    cancellable = True
+
     @abstractmethod
     async def generate(
         self,
@@ -30,6 +45,19 @@ class TextGenerator(ABC):
         """Generate text from prompt"""
         pass
 
+    async def generate_stream(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        """Stream text from prompt as it is generated (default: one chunk)"""
+        yield await self.generate(prompt, temperature, max_tokens)
+
+    async def aclose(self):
+        """Release pooled connections held by the client"""
+        pass
+
     def _extract_content(self, response: BaseMessage) -> str:
         """Extract text content from LangChain message response"""
         if isinstance(response.content, str):
@@ -49,7 +77,16 @@ class TextGenerator(ABC):
 
 
 class NovaGenerator(TextGenerator):
-    """Amazon Nova generator - uses prompt engineering for JSON output"""
+    """Amazon Nova generator - uses prompt engineering for JSON output
+
+    ChatBedrockConverse has no native async: its calls run boto3 in a worker
+    thread. Cancelling generate() doesn't stop a Bedrock request that has
+    started; it runs to completion and is billed, and keeps its limiter slot
+    until then. A cancelled stream stops at the next chunk and closes the
+    response instead of reading it to the end.
+    """
+
+    cancellable = False
 
     def __init__(self):
         self.client = ChatBedrockConverse(
@@ -57,6 +94,13 @@ class NovaGenerator(TextGenerator):
             region_name=settings.AWS_REGION,
             aws_access_key_id=settings.AWS_ACCESS_KEY,
             aws_secret_access_key=settings.AWS_SECRET_KEY,
+            config=BotoConfig(
+                max_pool_connections=settings.TEXT_CLIENT_MAX_CONNECTIONS,
+                tcp_keepalive=True,
+            ),
+        )
+        self.limiter = ProviderLimiter(
+            "nova", settings.NOVA_MAX_CONCURRENCY, rpm=settings.NOVA_RPM, tpm=settings.NOVA_TPM
         )
 
     async def generate(
@@ -85,17 +129,80 @@ CRITICAL: Your response will be parsed as raw JSON. Any non-JSON text will cause
         else:
             messages = [HumanMessage(content=prompt)]
         
-        response = await self.client.ainvoke(messages, **kwargs)
+        response = await self.limiter.run_in_thread(
+            lambda: self.client.invoke(messages, **kwargs), estimate_tokens(prompt, max_tokens)
+        )
         return self._extract_content(response)
 
+    async def generate_stream(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        kwargs = {"temperature": temperature}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def pump():
+            stream = self.client.stream([HumanMessage(content=prompt)], **kwargs)
+            try:
+                for chunk in stream:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            finally:
+                stream.close()
+
+        def pumped(worker: asyncio.Future):
+            if not worker.cancelled():
+                worker.exception()  # retrieved here when the caller left early
+            chunks.put_nowait(None)
+
+        # The slot is held until the pump thread returns
+        worker = asyncio.ensure_future(self.limiter.run_in_thread(pump, estimate_tokens(prompt, max_tokens)))
+        worker.add_done_callback(pumped)
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                text = self._extract_content(chunk)
+                if text:
+                    yield text
+            await worker
+        finally:
+            stop.set()
+            worker.cancel()
+
+    async def aclose(self):
+        bedrock_client = getattr(self.client, "client", None)
+        if bedrock_client is not None:
+            bedrock_client.close()
+
 
 class OpenAIGenerator(TextGenerator):
     """OpenAI GPT-4o-mini generator"""
 
     def __init__(self):
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.TEXT_CLIENT_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.TEXT_CLIENT_MAX_KEEPALIVE,
+                keepalive_expiry=settings.TEXT_CLIENT_KEEPALIVE_EXPIRY,
+            ),
+        )
         self.client = ChatOpenAI(
             model=settings.OPENAI_MODEL,
             api_key=settings.OPENAI_API_KEY,
+            http_async_client=self.http_client,
+        )
+        self.limiter = ProviderLimiter(
+            "openai", settings.OPENAI_MAX_CONCURRENCY, rpm=settings.OPENAI_RPM, tpm=settings.OPENAI_TPM
         )
 
     async def generate(
@@ -113,16 +220,113 @@ class OpenAIGenerator(TextGenerator):
             kwargs["response_format"] = response_format
         
         messages = [HumanMessage(content=prompt)]
-        response = await self.client.ainvoke(messages, **kwargs)
+        async with self.limiter.slot(estimate_tokens(prompt, max_tokens)):
+            response = await self.client.ainvoke(messages, **kwargs)
         return self._extract_content(response)
 
+    async def generate_stream(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        kwargs = {"temperature": temperature}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+
+        async with self.limiter.slot(estimate_tokens(prompt, max_tokens)):
+            async for chunk in self.client.astream([HumanMessage(content=prompt)], **kwargs):
+                text = self._extract_content(chunk)
+                if text:
+                    yield text
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+class ProviderStats:
+    """Rolling latency and error stats of one provider"""
+
+    def __init__(self, window: int = 50):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+
+    @property
+    def samples(self) -> int:
+        return len(self.outcomes)
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def expected_latency(self) -> Optional[float]:
+        """Median latency inflated by the error rate (a failed call costs a retry)"""
+        median = self.percentile(0.5)
+        if median is None:
+            return None
+        return median / max(1.0 - self.error_rate, 0.05)
+
 
 class FallbackGenerator(TextGenerator):
-    """Generator with automatic fallback, JSON validation, and retry"""
+    """Generator with automatic fallback, JSON validation, and retry
+
+    Tracks rolling per-provider stats to try the currently faster provider
+    first (TEXT_LATENCY_ROUTING) and, with TEXT_HEDGING, starts the other
+    provider when the first is slower than its TEXT_HEDGE_PERCENTILE latency.
+    The loser of a hedge race is cancelled, so hedging only runs when both
+    providers are cancellable; otherwise every hedge would pay for two calls.
+
+    generate() returns the first valid result of either provider; JSON calls
+    get "{}" only when both failed.
+    """
 
     def __init__(self, primary: TextGenerator, fallback: TextGenerator):
         self.primary = primary
         self.fallback = fallback
+        self.stats: Dict[TextGenerator, ProviderStats] = {}
+
+    def _stats(self, generator: TextGenerator) -> ProviderStats:
+        if generator not in self.stats:
+            self.stats[generator] = ProviderStats(settings.TEXT_STATS_WINDOW)
+        return self.stats[generator]
+
+    def _ordered(self) -> Tuple[TextGenerator, TextGenerator]:
+        """Primary first unless the fallback is currently clearly faster"""
+        if settings.TEXT_LATENCY_ROUTING:
+            primary = self._stats(self.primary)
+            fallback = self._stats(self.fallback)
+            min_samples = settings.TEXT_ROUTING_MIN_SAMPLES
+            if primary.samples >= min_samples and fallback.samples >= min_samples:
+                primary_latency = primary.expected_latency()
+                fallback_latency = fallback.expected_latency()
+                # A provider with only errors has no latency; treat it as slowest
+                if primary_latency is None or (
+                    fallback_latency is not None and fallback_latency * 1.2 < primary_latency
+                ):
+                    return self.fallback, self.primary
+        return self.primary, self.fallback
+
+    def _hedge_delay(self, generator: TextGenerator) -> float:
+        stats = self._stats(generator)
+        delay = stats.percentile(settings.TEXT_HEDGE_PERCENTILE)
+        if delay is None or stats.samples < settings.TEXT_ROUTING_MIN_SAMPLES:
+            return settings.TEXT_HEDGE_MIN_DELAY
+        return max(delay, settings.TEXT_HEDGE_MIN_DELAY)
+
+    async def aclose(self):
+        await self.primary.aclose()
+        await self.fallback.aclose()
 
     async def generate(
         self,
@@ -133,12 +337,70 @@ class FallbackGenerator(TextGenerator):
         validate_json: Optional[Callable[[str], None]] = None,
         max_retries: int = 3
     ) -> str:
-        result = await self._try_generator(self.primary, prompt, temperature, max_tokens, response_format, validate_json, 1)
-        if result:
-            return result
-        
-        result = await self._try_generator(self.fallback, prompt, temperature, max_tokens, response_format, validate_json, max_retries)
-        return "{}" if response_format else (result or "")
+        first, second = self._ordered()
+        args = (prompt, temperature, max_tokens, response_format, validate_json)
+        if settings.TEXT_HEDGING and first.cancellable and second.cancellable:
+            result = await self._hedged(first, second, args, max_retries)
+        else:
+            result = await self._try_generator(first, *args, 1)
+            if not result:
+                result = await self._try_generator(second, *args, max_retries)
+        return result or ("{}" if response_format else "")
+
+    async def _hedged(
+        self,
+        first: TextGenerator,
+        second: TextGenerator,
+        args: tuple,
+        max_retries: int
+    ) -> Optional[str]:
+        """Race the second provider against a slow first one; first valid result wins"""
+        first_task = asyncio.create_task(self._try_generator(first, *args, 1))
+        pending = {first_task}
+        second_task = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self._hedge_delay(first))
+            if not done:
+                logger.info(f"{first.__class__.__name__} slower than p{int(settings.TEXT_HEDGE_PERCENTILE * 100)}, hedging")
+                _hedges.inc(provider=second.__class__.__name__)
+            elif first_task.result():
+                return first_task.result()
+            
+            second_task = asyncio.create_task(self._try_generator(second, *args, max_retries))
+            pending = {second_task} if done else {first_task, second_task}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result():
+                        if second_task is task and first_task in pending:
+                            _hedge_wins.inc(provider=second.__class__.__name__)
+                        return task.result()
+            return None
+        finally:
+            for task in (first_task, second_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def generate_stream(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        """Stream from primary; switch to fallback only if nothing was streamed yet"""
+        for generator in self._ordered():
+            streamed = False
+            try:
+                async for text in generator.generate_stream(prompt, temperature, max_tokens):
+                    streamed = True
+                    yield text
+                if streamed:
+                    return
+            except Exception as e:
+                if streamed:
+                    raise
+                logger.warning(f"{generator.__class__.__name__} stream failed: {e}")
+        raise RuntimeError("All text generators failed to stream")
 
     async def _try_generator(
         self,
@@ -153,9 +415,20 @@ class FallbackGenerator(TextGenerator):
         for attempt in range(max_attempts):
             try:
                 logger.info(f"Trying {generator.__class__.__name__} (attempt {attempt + 1}/{max_attempts})")
-                result = await generator.generate(prompt, temperature, max_tokens, response_format, validate_json=None)
+                stats = self._stats(generator)
+                started = time.monotonic()
+                try:
+                    result = await generator.generate(prompt, temperature, max_tokens, response_format, validate_json=None)
+                except asyncio.CancelledError:
+                    # Lost a hedge race: the elapsed time says nothing about its latency
+                    raise
+                except Exception:
+                    stats.record(time.monotonic() - started, False)
+                    raise
+                ok = bool(result and result.strip())
+                stats.record(time.monotonic() - started, ok)
                 
-                if not result or not result.strip():
+                if not ok:
                     continue
                 
                 if validate_json:
@@ -171,11 +444,23 @@ class FallbackGenerator(TextGenerator):
         return None
 
 
+@lru_cache()
+def _shared_text_generator() -> TextGenerator:
+    return FallbackGenerator(NovaGenerator(), OpenAIGenerator())
+
+
 def get_text_generator() -> TextGenerator:
-    """Create text generator with Nova primary and OpenAI fallback"""
+    """Get shared text generator with Nova primary and OpenAI fallback"""
     if not settings.AWS_ACCESS_KEY or not settings.AWS_SECRET_KEY:
         raise ValueError("AWS credentials required for Nova")
     if not settings.OPENAI_API_KEY:
         raise ValueError("OpenAI API key required for fallback")
     
-    return FallbackGenerator(NovaGenerator(), OpenAIGenerator())
+    return _shared_text_generator()
+
+
+async def close_text_generator():
+    """Close pooled provider connections, if the generator was created"""
+    if _shared_text_generator.cache_info().currsize:
+        await _shared_text_generator().aclose()
+        _shared_text_generator.cache_clear()
@@ -0,0 +1,8 @@
+"""
+Response caches shared across sessions
+"""
+from app.services.cache.redis_lru import RedisLRUCache
+
+__all__ = [
+    "RedisLRUCache",
+]
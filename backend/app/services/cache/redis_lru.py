@@ -0,0 +1,96 @@
+"""
+Redis-backed cache with TTL and LRU eviction
+"""
+import logging
+import time
+from typing import Dict, Optional
+
+from app.core.metrics import metrics
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+_requests = metrics.counter("cache_requests_total", "Cache lookups by result")
+_evictions = metrics.counter("cache_evictions_total", "Entries evicted to stay under the size bound")
+
+
+class RedisLRUCache:
+    """String cache in Redis, bounded by entry count and TTL
+
+    Entries live under cache:{namespace}:entry:{key} with a TTL; a sorted set
+    scored by last access time tracks recency, and the least recently used
+    entries are evicted once max_entries is exceeded. An optional label per
+    entry (e.g. the normalized input) supports near-duplicate lookups.
+
+    Cache failures never break callers: errors are logged and treated as misses.
+    """
+
+    def __init__(self, namespace: str, max_entries: int, ttl_seconds: int):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._index_key = f"cache:{namespace}:lru"
+        self._labels_key = f"cache:{namespace}:labels"
+
+    def _entry_key(self, key: str) -> str:
+        return f"cache:{self.namespace}:entry:{key}"
+
+    @property
+    def _redis(self):
+        return get_redis().client
+
+    def record(self, result: str):
+        _requests.inc(cache=self.namespace, result=result)
+
+    async def get(self, key: str, record: bool = True) -> Optional[str]:
+        """Get a value and mark it as recently used"""
+        try:
+            value = await self._redis.get(self._entry_key(key))
+            async with self._redis.pipeline(transaction=False) as pipe:
+                if value is None:
+                    # Expired by TTL, drop it from the index too
+                    pipe.zrem(self._index_key, key)
+                    pipe.hdel(self._labels_key, key)
+                else:
+                    pipe.zadd(self._index_key, {key: time.time()})
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Cache {self.namespace} get failed: {e}")
+            value = None
+        if record:
+            self.record("hit" if value is not None else "miss")
+        return value
+
+    async def set(self, key: str, value: str, label: Optional[str] = None):
+        """Store a value, evicting least recently used entries over max_entries"""
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.set(self._entry_key(key), value, ex=self.ttl_seconds)
+                pipe.zadd(self._index_key, {key: time.time()})
+                pipe.expire(self._index_key, self.ttl_seconds)
+                if label is not None:
+                    pipe.hset(self._labels_key, key, label)
+                    pipe.expire(self._labels_key, self.ttl_seconds)
+                pipe.zcard(self._index_key)
+                size = (await pipe.execute())[-1]
+            if size > self.max_entries:
+                await self._evict(size - self.max_entries)
+        except Exception as e:
+            logger.warning(f"Cache {self.namespace} set failed: {e}")
+
+    async def _evict(self, count: int):
+        evicted = [key for key, _ in await self._redis.zpopmin(self._index_key, count)]
+        if evicted:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.delete(*(self._entry_key(key) for key in evicted))
+                pipe.hdel(self._labels_key, *evicted)
+                await pipe.execute()
+            _evictions.inc(len(evicted), cache=self.namespace)
+
+    async def labels(self) -> Dict[str, str]:
+        """Labels of cached entries, keyed by cache key"""
+        try:
+            return await self._redis.hgetall(self._labels_key)
+        except Exception as e:
+            logger.warning(f"Cache {self.namespace} labels failed: {e}")
+            return {}
@@ -1,7 +1,8 @@
 """
 Utility functions for the application
 """
-from app.utils.json_utils import extract_json
+from app.utils.json_utils import extract_json, parse_partial_json
+from app.utils.json_stream import JsonStreamParser
 
-__all__ = ["extract_json"]
+__all__ = ["extract_json", "parse_partial_json", "JsonStreamParser"]
 
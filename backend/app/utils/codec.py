@@ -0,0 +1,100 @@
+"""
+Binary codecs for values stored in Redis
+
+An encoded value starts with a 3-byte header: version, format and
+compression. JSON text never starts with the version byte, so values
+written before the header existed are still read as plain JSON.
+"""
+import json
+import zlib
+from typing import Any
+
+from app.core.config import settings
+
+VERSION = 0x01
+
+FORMAT_JSON = b"j"
+FORMAT_MSGPACK = b"m"
+
+COMPRESSION_NONE = b"n"
+COMPRESSION_ZSTD = b"z"
+COMPRESSION_ZLIB = b"d"
+
+
+def _require(module: str):
+    try:
+        return __import__(module)
+    except ImportError as e:
+        raise RuntimeError(f"{module} is not installed; install it or choose another codec setting") from e
+
+
+class Codec:
+    """Serializes values with json / orjson / msgpack, compressing large ones
+
+    format is "json", "orjson" or "msgpack"; compression is "zstd", "zlib"
+    or "none" and applies only to payloads of at least compress_min_bytes.
+    json and orjson write the same bytes, so either can read the other.
+    """
+
+    def __init__(self, format: str = "json", compression: str = "none", compress_min_bytes: int = 1024):
+        if format not in ("json", "orjson", "msgpack"):
+            raise ValueError(f"Unsupported codec format: {format}")
+        if compression not in ("zstd", "zlib", "none"):
+            raise ValueError(f"Unsupported codec compression: {compression}")
+        self.format = format
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+        self._orjson = _require("orjson") if format == "orjson" else None
+        self._msgpack = _require("msgpack") if format == "msgpack" else None
+        if compression == "zstd":
+            zstandard = _require("zstandard")
+            self._compressor = zstandard.ZstdCompressor(level=3)
+
+    def _dumps(self, value: Any) -> bytes:
+        if self._msgpack is not None:
+            return self._msgpack.packb(value, use_bin_type=True)
+        if self._orjson is not None:
+            return self._orjson.dumps(value)
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def encode(self, value: Any) -> bytes:
+        payload = self._dumps(value)
+        compression = COMPRESSION_NONE
+        if self.compression != "none" and len(payload) >= self.compress_min_bytes:
+            if self.compression == "zstd":
+                packed, compression = self._compressor.compress(payload), COMPRESSION_ZSTD
+            else:
+                packed, compression = zlib.compress(payload), COMPRESSION_ZLIB
+            # Keep the raw payload if compressing didn't pay off
+            if len(packed) < len(payload):
+                payload = packed
+            else:
+                compression = COMPRESSION_NONE
+        fmt = FORMAT_MSGPACK if self._msgpack is not None else FORMAT_JSON
+        return bytes((VERSION,)) + fmt + compression + payload
+
+    def decode(self, data: bytes) -> Any:
+        if not data or data[0] != VERSION:
+            # Written before the header existed: plain JSON text
+            return json.loads(data)
+        fmt, compression, payload = data[1:2], data[2:3], data[3:]
+        if compression == COMPRESSION_ZSTD:
+            payload = _require("zstandard").ZstdDecompressor().decompress(payload)
+        elif compression == COMPRESSION_ZLIB:
+            payload = zlib.decompress(payload)
+        elif compression != COMPRESSION_NONE:
+            raise ValueError(f"Unknown codec compression: {compression!r}")
+        if fmt == FORMAT_MSGPACK:
+            return _require("msgpack").unpackb(payload, raw=False)
+        if fmt == FORMAT_JSON:
+            return self._orjson.loads(payload) if self._orjson is not None else json.loads(payload)
+        raise ValueError(f"Unknown codec format: {fmt!r}")
+
+
+def create_codec() -> Codec:
+    """Create the session state codec from settings"""
+    return Codec(
+        format=settings.SESSION_CODEC,
+        compression=settings.SESSION_COMPRESSION,
+        compress_min_bytes=settings.SESSION_COMPRESS_MIN_BYTES,
+    )
@@ -0,0 +1,97 @@
+"""
+Incremental JSON parser for streamed LLM output
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.utils.json_utils import parse_partial_json
+
+_STRUCTURAL = re.compile(r'[{}\[\]":,\\]')
+
+
+class _Frame:
+    __slots__ = ("opener", "path", "start", "key")
+
+    def __init__(self, opener: str, path: Tuple[str, ...], start: int):
+        self.opener = opener
+        self.path = path
+        self.start = start
+        # Last key read in an object; names the path of its value
+        self.key: Optional[str] = None
+
+
+class JsonStreamParser:
+    """Emits items of one array as soon as each item is complete
+
+    feed() takes text chunks as they arrive and returns the objects of the
+    array at item_path (e.g. ("story_outline", "chapters")) that closed in
+    that chunk. Text around the top-level object (fences, prose) is ignored.
+    Each character is scanned once over the whole stream.
+    """
+
+    def __init__(self, item_path: Sequence[str]):
+        self.item_path = tuple(item_path)
+        self.text = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._string_start = 0
+        self._skip_to = -1
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.text += chunk
+        if self.done:
+            return []
+        text = self.text
+        items = []
+        if not self._stack:
+            start = text.find("{", self._pos)
+            if start == -1:
+                self._pos = len(text)
+                return items
+            self._stack.append(_Frame("{", (), start))
+            self._pos = start + 1
+        for match in _STRUCTURAL.finditer(text, self._pos):
+            i = match.start()
+            if i < self._skip_to:
+                continue
+            ch = text[i]
+            if self._in_string:
+                if ch == "\\":
+                    self._skip_to = i + 2
+                elif ch == '"':
+                    self._in_string = False
+                    frame = self._stack[-1]
+                    if frame.opener == "{" and frame.key is None:
+                        frame.key = json.loads(text[self._string_start:i + 1])
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                parent = self._stack[-1]
+                path = parent.path + ((parent.key or ""),) if parent.opener == "{" else parent.path + ("[]",)
+                self._stack.append(_Frame(ch, path, i))
+            elif ch in "}]":
+                frame = self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                    self._pos = i + 1
+                    return items
+                parent = self._stack[-1]
+                if frame.opener == "{" and parent.opener == "[" and parent.path == self.item_path:
+                    items.append(json.loads(text[frame.start:i + 1]))
+            elif ch == ",":
+                if self._stack[-1].opener == "{":
+                    self._stack[-1].key = None
+        self._pos = len(text)
+        return items
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The object parsed so far, with unfinished parts closed or dropped"""
+        try:
+            return parse_partial_json(self.text)
+        except json.JSONDecodeError:
+            return {}
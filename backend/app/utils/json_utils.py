@@ -2,18 +2,153 @@
 JSON utility functions for extracting and parsing JSON from text
 """
 import json
+import logging
 import re
-from typing import Dict, Any
-
-
-def extract_json(text: str) -> Dict[str, Any]:
-    """ Extract JSON from text, handling markdown code blocks """
-    text = text.strip()
-    json_match = re.search(r'```(?:json)?\s*(\{.*\})\s*```', text, re.DOTALL)
-    if json_match:
-        return json.loads(json_match.group(1))
-    json_match = re.search(r'\{.*\}', text, re.DOTALL)
-    if json_match:
-        return json.loads(json_match.group(0))
-    return {}
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Characters that change scanner state; everything else is skipped in C
+_STRUCTURAL = re.compile(r'[{}\[\]":,\\]')
+_CLOSERS = {"{": "}", "[": "]"}
+_decoder = json.JSONDecoder()
+
+
+@dataclass
+class _Frame:
+    """Open object / array: opener, where its current element starts, whether a ':' was seen"""
+    opener: str
+    element_start: int
+    after_colon: bool = False
+
+
+@dataclass
+class _Truncated:
+    """Scanner state when the text ended inside the object"""
+    stack: List[_Frame]
+    in_string: bool
+    string_is_key: bool
+    escaped: bool
+    # First complete object nested directly in the unterminated one
+    child: Optional[Tuple[int, int]]
+
+
+def _scan(text: str, start: int):
+    """Find the end of the object opening at start, tracking strings and nesting
 
+    Returns (end, None) for a balanced object or (None, _Truncated) if the
+    text ends first. Runs in one pass over the structural characters.
+    """
+    stack: List[_Frame] = []
+    in_string = string_is_key = False
+    skip_to = -1
+    child = None
+    for match in _STRUCTURAL.finditer(text, start):
+        i = match.start()
+        if i < skip_to:
+            continue
+        ch = text[i]
+        if in_string:
+            if ch == "\\":
+                skip_to = i + 2
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+            frame = stack[-1]
+            string_is_key = frame.opener == "{" and not frame.after_colon
+        elif ch in "{[":
+            stack.append(_Frame(ch, i + 1))
+        elif ch in "}]":
+            frame = stack.pop()
+            if not stack:
+                return i + 1, None
+            if child is None and len(stack) == 1 and frame.opener == "{":
+                child = (frame.element_start - 1, i + 1)
+        elif ch == ":":
+            stack[-1].after_colon = True
+        elif ch == ",":
+            stack[-1].element_start = i + 1
+            stack[-1].after_colon = False
+    escaped = skip_to > len(text)
+    return None, _Truncated(stack, in_string, string_is_key, escaped, child)
+
+
+def _repair(text: str, start: int, state: _Truncated) -> Optional[Dict[str, Any]]:
+    """Close a JSON object cut off mid-way (e.g. by max_tokens)
+
+    An unterminated value string is closed and kept; any other partial
+    element (key, literal, dangling ':') is dropped. Open arrays and
+    objects are then closed innermost first.
+    """
+    candidates = []
+    if state.in_string:
+        if not state.string_is_key:
+            candidates.append(text[start:len(text) - state.escaped] + '"')
+    else:
+        candidates.append(text[start:])
+    candidates.append(text[start:state.stack[-1].element_start])
+    closers = "".join(_CLOSERS[frame.opener] for frame in reversed(state.stack))
+    for candidate in candidates:
+        try:
+            result = json.loads(candidate.rstrip().rstrip(",") + closers)
+        except json.JSONDecodeError:
+            continue
+        return result
+    return None
+
+
+def parse_partial_json(text: str) -> Dict[str, Any]:
+    """Parse an object that is still being generated, closing what is unfinished"""
+    start = text.find("{")
+    if start == -1:
+        return {}
+    end, truncated = _scan(text, start)
+    if truncated is None:
+        return json.loads(text[start:end])
+    return _repair(text, start, truncated) or {}
+
+
+def extract_json(text: str, repair: bool = True) -> Dict[str, Any]:
+    """ Extract the first JSON object from text
+
+    Handles markdown code fences, prose before or after the object (braces
+    included) and, with repair, output truncated before the object closed.
+    Returns {} if the text has no object; raises json.JSONDecodeError if
+    it has one that can't be parsed.
+    """
+    error: Optional[json.JSONDecodeError] = None
+    start = text.find("{")
+    if start != -1:
+        # Fast path: the first brace opens a well-formed object, whatever follows it
+        try:
+            return _decoder.raw_decode(text, start)[0]
+        except json.JSONDecodeError as e:
+            error = e
+    # Find each balanced candidate first and parse only that slice; a failed
+    # parse of the whole text would cost a line / column count per brace
+    while start != -1:
+        end, truncated = _scan(text, start)
+        if truncated is not None:
+            result = _repair(text, start, truncated) if repair else None
+            if result is not None:
+                logger.warning(f"Repaired truncated JSON ({len(truncated.stack)} unclosed)")
+            elif truncated.child is not None:
+                # The unterminated "{" was prose; try the object inside it
+                try:
+                    result = json.loads(text[slice(*truncated.child)])
+                except json.JSONDecodeError:
+                    pass
+            if result is not None:
+                return result
+            raise error or json.JSONDecodeError("Unterminated JSON object", text, start)
+        try:
+            return json.loads(text[start:end])
+        except json.JSONDecodeError:
+            # Braces in prose ahead of the object; keep looking after them
+            start = text.find("{", end)
+    if error is not None:
+        raise error
+    return {}
@@ -0,0 +1,107 @@
+"""
+Benchmark - extract_json against the previous regex implementation
+
+The corpus mirrors the shapes the agents get back from providers: router
+intents, planner outlines, writer chapters and finalizer output, plain,
+fenced, preceded or followed by prose (with braces), and cut off by
+max_tokens. Each sample is parsed by both implementations; failures count
+responses that raised.
+
+Usage (from backend/):
+    python -m benchmarks.extract_json [--runs 200]
+"""
+import argparse
+import json
+import logging
+import re
+import time
+from typing import Any, Dict
+
+from app.utils.json_utils import extract_json
+
+
+def legacy_extract_json(text: str) -> Dict[str, Any]:
+    """extract_json before the brace-balanced scanner"""
+    text = text.strip()
+    json_match = re.search(r'```(?:json)?\s*(\{.*\})\s*```', text, re.DOTALL)
+    if json_match:
+        return json.loads(json_match.group(1))
+    json_match = re.search(r'\{.*\}', text, re.DOTALL)
+    if json_match:
+        return json.loads(json_match.group(0))
+    return {}
+
+
+def _outline(chapters: int) -> dict:
+    return {
+        "needs_info": False,
+        "language": "en",
+        "story_outline": {
+            "style": "adventure",
+            "characters": ["Luna the rabbit", "Old Owl"],
+            "setting": "A moonlit forest",
+            "plot_summary": "Luna sets out to find the lost star. " * 4,
+            "chapters": [
+                {
+                    "chapter_id": i,
+                    "title": f"Chapter {i}: The {{glowing}} path",
+                    "summary": "Luna follows the trail of light deeper into the woods. " * 3,
+                    "image_description": "A small white rabbit on a glowing forest path at night, watercolor",
+                }
+                for i in range(1, chapters + 1)
+            ],
+        },
+    }
+
+
+def _chapter(chapter_id: int) -> dict:
+    return {"chapter_id": chapter_id, "title": "The Lost Star", "content": "Luna hopped softly over the moss. \"Hello?\" she called. " * 40}
+
+
+def _corpus() -> Dict[str, str]:
+    outline = json.dumps(_outline(12), ensure_ascii=False, indent=2)
+    chapter = json.dumps(_chapter(3), ensure_ascii=False)
+    final = json.dumps({"chapters": [_chapter(i) for i in range(1, 5)]}, ensure_ascii=False)
+    return {
+        "router intent": '{"intent": "story_generate"}',
+        "planner outline": outline,
+        "planner fenced": f"```json\n{outline}\n```",
+        "writer chapter": chapter,
+        "writer + prose": f"Here is the chapter:\n{chapter}\nFeel free to replace {{name}} with your child's name.",
+        "finalizer text": final,
+        "finalizer truncated": final[: len(final) * 2 // 3],
+        "unbalanced braces": "{" * 5000 + '"intent": "chat"}',
+        # Each prose brace pair is a candidate that fails to parse; cost must stay linear
+        "prose braces x1k": "Fill in {name} and {place}. " * 500 + chapter,
+        "prose braces x10k": "Fill in {name} and {place}. " * 5000 + chapter,
+    }
+
+
+def _time(parse, text: str, runs: int):
+    failed = 0
+    started = time.perf_counter()
+    for _ in range(runs):
+        try:
+            parse(text)
+        except Exception:
+            failed += 1
+    return (time.perf_counter() - started) * 1e6 / runs, failed
+
+
+def main(runs: int):
+    # Repairs log a warning per call
+    logging.getLogger("app.utils.json_utils").setLevel(logging.ERROR)
+    print(f"{'sample':<22}{'bytes':>8}{'legacy us':>12}{'fails':>7}{'scanner us':>12}{'fails':>7}")
+    for name, text in _corpus().items():
+        legacy_us, legacy_failed = _time(legacy_extract_json, text, runs)
+        scanner_us, scanner_failed = _time(extract_json, text, runs)
+        print(
+            f"{name:<22}{len(text):>8}{legacy_us:>12.1f}{legacy_failed:>7}"
+            f"{scanner_us:>12.1f}{scanner_failed:>7}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200)
+    main(parser.parse_args().runs)
@@ -0,0 +1,180 @@
+"""
+Benchmark - supersteps and checkpoint writes per story run
+
+Compares the legacy graph (self-looping check_*_completion nodes) with the
+barrier-joined graph. Agents are replaced by instant stubs, so the numbers
+only reflect graph overhead.
+
+Both barrier topologies compile to the same graph: the pipelined one starts
+illustrators from the planner node through the run's ChapterPrefetch, outside
+the graph, so it takes as many supersteps (6) as the sequential one.
+
+Usage (from backend/):
+    python -m benchmarks.graph_supersteps [--runs 50]
+"""
+import argparse
+import asyncio
+import time
+from contextlib import ExitStack
+from functools import partial
+from typing import Literal
+from unittest.mock import patch
+
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import StateGraph, END
+
+from app.agents.state import StoryState
+from app.agents.workflow import graph as story_graph
+from app.agents.workflow.prefetch import ChapterPrefetch, current_prefetch
+
+
+class CountingSaver(InMemorySaver):
+    """InMemorySaver that counts checkpoint and pending-write calls"""
+
+    def __init__(self):
+        super().__init__()
+        self.checkpoint_count = 0
+        self.write_count = 0
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        self.checkpoint_count += 1
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        self.write_count += 1
+        return super().put_writes(config, writes, task_id, task_path)
+
+
+async def _planner(state, on_chapter=None):
+    return {
+        "needs_info": False,
+        "language": "en",
+        "story_outline": {
+            "chapters": [
+                {"chapter_id": i, "title": f"Chapter {i}", "summary": "", "image_description": ""}
+                for i in range(1, 5)
+            ]
+        },
+    }
+
+
+async def _writer(state, chapter_id):
+    return {"chapters": [{"chapter_id": chapter_id, "content": "text"}], "completed_writers": [chapter_id]}
+
+
+async def _illustrator(state, chapter_id):
+    return {"chapters": [{"chapter_id": chapter_id, "image": "url"}], "completed_image_gens": [chapter_id]}
+
+
+async def _finalizer_text(state):
+    return {"finalized_text": {"chapters": state.get("chapters", [])}}
+
+
+async def _finalizer_image(state):
+    return {"finalized_images": {"chapters": state.get("chapters", [])}}
+
+
+def _legacy_graph(checkpointer):
+    """Replica of the sequential graph before the barrier join"""
+
+    def should_continue(state) -> Literal["fanout", "end"]:
+        return "end" if state.get("needs_info", False) else "fanout"
+
+    def check_writers(state) -> Literal["finalize_text", "wait"]:
+        done = len(set(state.get("completed_writers", []))) == 4
+        return "finalize_text" if done and not state.get("finalized_text") else "wait"
+
+    def check_illustrators(state) -> Literal["finalize_images", "wait"]:
+        done = len(set(state.get("completed_image_gens", []))) == 4
+        return "finalize_images" if done and not state.get("finalized_images") else "wait"
+
+    workflow = StateGraph(StoryState)
+    workflow.add_node("planner", _planner)
+    for i in range(1, 5):
+        workflow.add_node(f"writer_{i}", partial(_writer, chapter_id=i))
+        workflow.add_node(f"illustrator_{i}", partial(_illustrator, chapter_id=i))
+    workflow.add_node("finalizer_text", _finalizer_text)
+    workflow.add_node("finalizer_image", _finalizer_image)
+    workflow.add_node("fanout_writers", lambda s: s)
+    workflow.add_node("fanout_illustrators", lambda s: s)
+    workflow.add_node("check_writers_completion", lambda s: s)
+    workflow.add_node("check_illustrators_completion", lambda s: s)
+
+    workflow.set_entry_point("planner")
+    workflow.add_conditional_edges("planner", should_continue, {"end": END, "fanout": "fanout_writers"})
+    for i in range(1, 5):
+        workflow.add_edge("fanout_writers", f"writer_{i}")
+        workflow.add_edge(f"writer_{i}", "check_writers_completion")
+    workflow.add_conditional_edges(
+        "check_writers_completion", check_writers,
+        {"finalize_text": "finalizer_text", "wait": "check_writers_completion"},
+    )
+    workflow.add_edge("finalizer_text", "fanout_illustrators")
+    for i in range(1, 5):
+        workflow.add_edge("fanout_illustrators", f"illustrator_{i}")
+        workflow.add_edge(f"illustrator_{i}", "check_illustrators_completion")
+    workflow.add_conditional_edges(
+        "check_illustrators_completion", check_illustrators,
+        {"finalize_images": "finalizer_image", "wait": "check_illustrators_completion"},
+    )
+    workflow.add_edge("finalizer_image", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def _stub_agents():
+    """Route the real graph's agent calls to the stubs above"""
+    stack = ExitStack()
+    stack.enter_context(patch.object(story_graph, "planner_agent", _planner))
+    stack.enter_context(patch.object(story_graph, "writer_agent", _writer))
+    stack.enter_context(patch.object(story_graph, "illustrator_agent", _illustrator))
+    stack.enter_context(patch.object(story_graph, "finalizer_text_agent", _finalizer_text))
+    stack.enter_context(patch.object(story_graph, "finalizer_image_agent", _finalizer_image))
+    return stack
+
+
+def _barrier_graph(checkpointer, topology):
+    with patch.object(story_graph, "create_checkpointer", return_value=checkpointer):
+        return story_graph.create_story_graph(topology)
+
+
+async def _measure(name, build, runs):
+    saver = CountingSaver()
+    graph = build(saver)
+    events = 0
+    started = time.perf_counter()
+    for run in range(runs):
+        state = {"theme": "dragon", "session_id": "bench", "chapters": [],
+                 "completed_writers": [], "completed_image_gens": []}
+        config = story_graph.create_thread_config(f"bench-{run}")
+        # A ChapterPrefetch per run, as process_story_generation sets it
+        prefetch = ChapterPrefetch()
+        token = current_prefetch.set(prefetch)
+        try:
+            async for event in graph.astream(state, config):
+                events += len(event)
+        finally:
+            prefetch.cancel()
+            current_prefetch.reset(token)
+        await saver.adelete_thread(config["configurable"]["thread_id"])
+    elapsed_ms = (time.perf_counter() - started) * 1000 / runs
+
+    # one checkpoint is written per superstep plus one for the input
+    supersteps = saver.checkpoint_count / runs - 1
+    print(
+        f"{name:<22}{supersteps:>11.1f}{saver.checkpoint_count / runs:>13.1f}"
+        f"{saver.write_count / runs:>9.1f}{events / runs:>9.1f}{elapsed_ms:>10.2f}"
+    )
+
+
+async def main(runs: int):
+    print(f"{'graph':<22}{'supersteps':>11}{'checkpoints':>13}{'writes':>9}{'events':>9}{'ms/run':>10}")
+    await _measure("legacy (check nodes)", _legacy_graph, runs)
+    with _stub_agents():
+        await _measure("barrier sequential", lambda s: _barrier_graph(s, "sequential"), runs)
+        await _measure("barrier pipelined", lambda s: _barrier_graph(s, "pipelined"), runs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=50)
+    asyncio.run(main(parser.parse_args().runs))
@@ -0,0 +1,123 @@
+"""
+Benchmark - parallel writer calls against batched writer calls
+
+Runs the writer stage for one story with the text generator replaced by
+a simulated provider: each call waits a fixed request overhead (queueing,
+prefill, time to first token), then streams output at a fixed rate.
+Tokens are counted the way the rate limiter estimates them (~4 chars per
+prompt token) plus the output tokens actually streamed, so the numbers
+show the shared story context the batched prompt stops repeating.
+
+Usage (from backend/):
+    python -m benchmarks.writer_modes [--chapters 4] [--overhead 0.8] [--tokens-per-second 60] [--concurrency 4]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from contextlib import ExitStack
+from typing import Dict, List
+from unittest.mock import patch
+
+from app.agents.workflow import graph as story_graph
+from app.agents.workflow import writer as story_writer
+from app.core.config import settings
+from app.services.ai_services.limiter import estimate_tokens
+
+# ~300 words per chapter
+CHAPTER_TEXT = "Luna hopped softly over the moss, looking for the lost star. " * 28
+
+
+class SimulatedProvider:
+    """Streaming text generator with per-request overhead and a fixed output rate"""
+
+    def __init__(self, overhead: float, tokens_per_second: float):
+        self.overhead = overhead
+        self.token_delay = 1 / tokens_per_second
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    async def generate_stream(self, prompt: str, temperature: float = 0.7, max_tokens=None):
+        self.calls += 1
+        self.prompt_tokens += estimate_tokens(prompt)
+        if '"chapters"' in prompt:
+            ids = [int(line.split()[1].rstrip(":")) for line in prompt.splitlines() if line.startswith("Chapter ") and line.endswith(":")]
+            text = json.dumps({"chapters": [{"chapter_id": i, "content": CHAPTER_TEXT} for i in ids]})
+        else:
+            text = CHAPTER_TEXT
+        await asyncio.sleep(self.overhead)
+        for i in range(0, len(text), 4):
+            self.output_tokens += 1
+            await asyncio.sleep(self.token_delay)
+            yield text[i:i + 4]
+
+
+def _state(chapters: int) -> dict:
+    return {
+        "session_id": "bench",
+        "language": "en",
+        "intent": "story_generate",
+        "story_outline": {
+            "style": "adventure",
+            "characters": ["Luna the rabbit", "Old Owl"],
+            "setting": "A moonlit forest",
+            "plot_summary": "Luna sets out to find the lost star. " * 4,
+            "chapters": [
+                {"chapter_id": i, "title": f"Chapter {i}", "summary": "Luna follows the trail of light deeper into the woods. " * 3}
+                for i in range(1, chapters + 1)
+            ],
+        },
+        "chapters": [],
+    }
+
+
+async def _run(chapters: int, provider: SimulatedProvider) -> Dict[str, float]:
+    state = _state(chapters)
+    started = time.perf_counter()
+    finished: List[float] = []
+
+    async def chapter(chapter_id: int):
+        await story_graph._run_writer({**state, "chapter_id": chapter_id})
+        finished.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(chapter(i) for i in range(1, chapters + 1)))
+    return {"first": min(finished), "wall": max(finished)}
+
+
+def measure(mode: str, batch_size: int, args) -> None:
+    provider = SimulatedProvider(args.overhead, args.tokens_per_second)
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(settings, "WRITER_MODE", mode))
+        # Parallel writers stream prose; the simulated provider only streams
+        stack.enter_context(patch.object(settings, "WRITER_STREAMING", True))
+        stack.enter_context(patch.object(settings, "WRITER_BATCH_SIZE", batch_size))
+        stack.enter_context(patch.object(settings, "WRITER_MAX_CONCURRENCY", args.concurrency))
+        stack.enter_context(patch.object(story_writer, "get_text_generator", return_value=provider))
+        # Fresh loop per mode, so the writer semaphore picks up the concurrency
+        timings = asyncio.run(_run(args.chapters, provider))
+    name = mode if mode == "parallel" else f"batched ({batch_size}/call)"
+    total = provider.prompt_tokens + provider.output_tokens
+    print(
+        f"{name:<20}{provider.calls:>7}{provider.prompt_tokens:>10}{provider.output_tokens:>10}{total:>9}"
+        f"{timings['first']:>11.2f}{timings['wall']:>9.2f}"
+    )
+
+
+def main(args):
+    logging.getLogger("app.agents.workflow.writer").setLevel(logging.ERROR)
+    print(f"{'mode':<20}{'calls':>7}{'prompt':>10}{'output':>10}{'total':>9}{'first s':>11}{'wall s':>9}")
+    measure("parallel", 0, args)
+    measure("batched", args.chapters, args)
+    if args.chapters > 2:
+        measure("batched", 2, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chapters", type=int, default=4)
+    parser.add_argument("--overhead", type=float, default=0.8, help="seconds before the first token of each call")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--concurrency", type=int, default=4, help="WRITER_MAX_CONCURRENCY")
+    main(parser.parse_args())
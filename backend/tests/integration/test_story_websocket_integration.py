@@ -4,6 +4,7 @@ Tests WebSocket communication, state management, and agent integration
 """
 import pytest
 import asyncio
+import fakeredis
 import json
 import uuid
 from typing import Dict, Any, List, Optional
@@ -20,9 +21,13 @@ from app.api.story import (
     create_initial_state,
     process_chat_request,
     process_story_generation,
+    refresh_memory_summary,
+    _session_lock,
 )
 from app.api.websocket import (
     ConnectionManager,
+    ConnectionWriter,
+    SessionTasks,
     create_ws_message,
     manager,
 )
@@ -259,6 +264,7 @@ class TestWebSocketConnectionManager:
         
         message = {"type": "test", "data": "test"}
         await conn_manager.send_to_session(message, session_id)
+        await conn_manager.flush(session_id)
         
         mock_websocket.send_json.assert_called_once_with(message)
     
@@ -277,11 +283,113 @@ class TestWebSocketConnectionManager:
         
         message = {"type": "test"}
         await conn_manager.send_to_session(message, "session-1")
+        await conn_manager.flush("session-1")
         
         assert ws1.send_json.call_count == 1
         assert ws2.send_json.call_count == 1
 
 
+def _delta(chapter_id: int, index: int, text: str) -> dict:
+    return create_ws_message("chapter_delta", "session-1", {"chapter_id": chapter_id, "index": index, "delta": text})
+
+
+def _blocked_websocket(release: asyncio.Event) -> AsyncMock:
+    ws = AsyncMock(spec=WebSocket)
+    ws.accept = AsyncMock()
+    ws.close = AsyncMock()
+
+    async def send_json(message):
+        await release.wait()
+
+    ws.send_json = AsyncMock(side_effect=send_json)
+    return ws
+
+
+@pytest.mark.asyncio
+class TestConnectionWriter:
+    """Test per-socket outbound queues"""
+
+    async def test_slow_tab_does_not_stall_others(self):
+        """Test a blocked socket doesn't delay delivery to another tab"""
+        conn_manager = ConnectionManager()
+        release = asyncio.Event()
+        slow = _blocked_websocket(release)
+        fast = AsyncMock(spec=WebSocket)
+        await conn_manager.connect(slow, "slow", "session-1")
+        await conn_manager.connect(fast, "fast", "session-1")
+
+        await asyncio.wait_for(conn_manager.send_to_session({"type": "test"}, "session-1"), 0.1)
+        await conn_manager.writers["fast"].flush()
+
+        fast.send_json.assert_called_once_with({"type": "test"})
+        release.set()
+        await conn_manager.flush("session-1")
+
+    async def test_queued_deltas_are_merged(self):
+        """Test deltas of one chapter waiting in the queue go out as one event"""
+        release = asyncio.Event()
+        ws = _blocked_websocket(release)
+        writer = ConnectionWriter(ws, "conn-1", on_slow=lambda: None, max_queue=10)
+        writer.put({"type": "agent_started"})
+        await asyncio.sleep(0)
+        for i, text in enumerate(["Once ", "upon ", "a time"]):
+            writer.put(_delta(1, i, text))
+
+        assert len(writer.queue) == 1
+        assert writer.queue[0]["data"]["delta"] == "Once upon a time"
+        release.set()
+        await writer.flush()
+        writer.close()
+
+    async def test_lagging_socket_drops_deltas_first(self):
+        """Test a full queue sheds deltas and mutes those chapters, keeping other events"""
+        release = asyncio.Event()
+        ws = _blocked_websocket(release)
+        writer = ConnectionWriter(ws, "conn-1", on_slow=lambda: None, max_queue=4)
+        writer.put({"type": "agent_started"})
+        await asyncio.sleep(0)
+        writer.put(_delta(1, 0, "a"))
+        writer.put(_delta(2, 0, "b"))
+        writer.put({"type": "agent_completed"})
+        writer.put(_delta(1, 1, "c"))
+        writer.put({"type": "finalizer_text"})
+        writer.put(_delta(2, 1, "d"))
+
+        assert [m["type"] for m in writer.queue] == ["agent_completed", "finalizer_text"]
+        release.set()
+        await writer.flush()
+        writer.close()
+
+    async def test_socket_too_far_behind_is_closed(self):
+        """Test a socket whose queue stays full is disconnected"""
+        conn_manager = ConnectionManager()
+        release = asyncio.Event()
+        ws = _blocked_websocket(release)
+        await conn_manager.connect(ws, "conn-1", "session-1")
+        conn_manager.writers["conn-1"].max_queue = 2
+
+        for _ in range(4):
+            await conn_manager.send_to_session({"type": "agent_completed"}, "session-1")
+        await asyncio.sleep(0)
+
+        assert "conn-1" not in conn_manager.active_connections
+        assert "session-1" not in conn_manager.session_connections
+        ws.close.assert_called_once()
+
+    async def test_send_timeout_closes_socket(self):
+        """Test a send that never completes closes the socket"""
+        slow_calls = []
+        ws = _blocked_websocket(asyncio.Event())
+        writer = ConnectionWriter(ws, "conn-1", on_slow=lambda: slow_calls.append(1), send_timeout=0.01)
+
+        writer.put({"type": "test"})
+        await asyncio.sleep(0.05)
+
+        assert writer.closed
+        assert slow_calls == [1]
+        ws.close.assert_called_once()
+
+
 @pytest.mark.asyncio
 class TestWebSocketMessageFormat:
     """Test WebSocket message format"""
@@ -691,3 +799,299 @@ class TestEndToEndFlow:
         state3 = await load_state_from_redis(test_session_id)
         assert state3.get("story_outline") is not None or state3.get("intent") == "regenerate"
 
+
+
+@pytest.fixture
+def fake_session_redis():
+    """Point session load/save at an in-memory Redis"""
+    redis = MagicMock()
+    server = fakeredis.FakeServer()
+    redis.client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    redis.binary_client = fakeredis.FakeAsyncRedis(server=server)
+    with patch("app.api.session_store.get_redis", return_value=redis):
+        yield redis.client
+
+
+@pytest.mark.asyncio
+class TestBackgroundMemorySummary:
+    """Test memory summary update runs off the critical path"""
+
+    @patch('app.api.story.router_agent')
+    @patch('app.api.story.process_story_generation')
+    @patch('app.api.story.update_memory_summary')
+    async def test_pipeline_does_not_wait_for_summary(
+        self, mock_update, mock_story, mock_router, fake_session_redis
+    ):
+        """Test the pipeline starts while the summary is still being generated"""
+        release = asyncio.Event()
+
+        async def slow_update(theme, summary):
+            await release.wait()
+            return "A brave rabbit story"
+
+        mock_update.side_effect = slow_update
+        mock_router.return_value = {"intent": "story_generate", "memory_summary": ""}
+
+        await handle_websocket_message("s1", "Create a story about a brave rabbit")
+
+        summary_task = mock_story.call_args.kwargs["summary_task"]
+        assert not summary_task.done()
+        release.set()
+        assert await summary_task == "A brave rabbit story"
+        assert (await load_state_from_redis("s1"))["memory_summary"] == "A brave rabbit story"
+
+    @patch('app.api.story.update_memory_summary')
+    async def test_summary_survives_full_state_save(self, mock_update, fake_session_redis):
+        """Test a concurrent full-state save doesn't clobber the new summary"""
+        mock_update.return_value = "New summary"
+        await save_state_to_redis("s1", {"memory_summary": "Old", "theme": "rabbit"})
+
+        summary_task = asyncio.create_task(refresh_memory_summary("s1", "rabbit", "Old"))
+        await save_state_to_redis("s1", {"memory_summary": "Old", "theme": "rabbit", "finalized_text": {"chapters": []}})
+        await summary_task
+
+        saved = await load_state_from_redis("s1")
+        assert saved["memory_summary"] == "New summary"
+        assert saved["finalized_text"] == {"chapters": []}
+
+    @patch('app.api.story.update_memory_summary')
+    async def test_final_save_keeps_summary_written_while_it_waited(self, mock_update, fake_session_redis):
+        """Test a run's final save queued behind the summary write doesn't restore the old summary"""
+        mock_update.return_value = "New summary"
+        await save_state_to_redis("s1", {"memory_summary": "Old", "theme": "rabbit"})
+
+        lock = _session_lock("s1")
+        await lock.acquire()
+        summary_task = asyncio.create_task(refresh_memory_summary("s1", "rabbit", "Old"))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        final_save = asyncio.create_task(save_state_to_redis(
+            "s1", {"memory_summary": "Old", "theme": "rabbit", "finalized_text": {"chapters": []}}, summary_task
+        ))
+        await asyncio.sleep(0)
+        lock.release()
+        await asyncio.gather(final_save, summary_task)
+
+        saved = await load_state_from_redis("s1")
+        assert saved["memory_summary"] == "New summary"
+        assert saved["finalized_text"] == {"chapters": []}
+
+    @patch('app.api.story.update_memory_summary')
+    async def test_unchanged_summary_skips_write(self, mock_update, fake_session_redis):
+        """Test no write happens when the summary did not change"""
+        mock_update.return_value = "Old"
+        await save_state_to_redis("s1", {"memory_summary": "Old"})
+
+        with patch("app.api.story.session_store.update_fields") as mock_write:
+            await refresh_memory_summary("s1", "hello", "Old")
+
+        mock_write.assert_not_called()
+
+
+@pytest.mark.asyncio
+class TestSpeculativePlannerIntegration:
+    """Test the planner runs alongside the router when enabled"""
+
+    @patch('app.api.story.settings')
+    @patch('app.api.story.router_agent')
+    @patch('app.api.story.process_story_generation')
+    @patch('app.agents.workflow.speculation.planner_agent')
+    async def test_confirmed_speculation_passes_plan(
+        self, mock_planner, mock_story, mock_router, mock_settings, fake_session_redis
+    ):
+        """Test a confirmed regenerate hands the running planner to the pipeline"""
+        mock_settings.SPECULATIVE_PLANNER = True
+        mock_planner.return_value = {"needs_info": False}
+        mock_router.return_value = {"intent": "regenerate", "memory_summary": "A rabbit story"}
+        await save_state_to_redis("s1", {"memory_summary": "A rabbit story", "story_outline": {"chapters": []}})
+
+        with patch('app.api.story.refresh_memory_summary', AsyncMock()):
+            await handle_websocket_message("s1", "The rabbit should be brave")
+
+        planner_task = mock_story.call_args.kwargs["planner_task"]
+        assert await planner_task == {"needs_info": False}
+        assert mock_planner.call_args[0][0]["intent"] == "regenerate"
+
+    @patch('app.api.story.settings')
+    @patch('app.api.story.router_agent')
+    @patch('app.api.story.process_chat_request')
+    @patch('app.agents.workflow.speculation.planner_agent')
+    async def test_chat_cancels_speculation(
+        self, mock_planner, mock_chat, mock_router, mock_settings, fake_session_redis
+    ):
+        """Test the speculative planner is cancelled when the router picks chat"""
+        mock_settings.SPECULATIVE_PLANNER = True
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def slow_planner(state):
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def router(state):
+            await started.wait()
+            return {"intent": "chat", "memory_summary": "A rabbit story"}
+
+        mock_planner.side_effect = slow_planner
+        mock_router.side_effect = router
+        await save_state_to_redis("s1", {"memory_summary": "A rabbit story", "story_outline": {"chapters": []}})
+
+        await handle_websocket_message("s1", "The rabbit should be brave")
+
+        await asyncio.wait_for(cancelled.wait(), 1)
+        mock_chat.assert_called_once()
+
+    @patch('app.api.story.settings')
+    @patch('app.api.story.router_agent')
+    @patch('app.api.story.process_chat_request')
+    @patch('app.agents.workflow.speculation.planner_agent')
+    async def test_no_speculation_for_small_talk(
+        self, mock_planner, mock_chat, mock_router, mock_settings, fake_session_redis
+    ):
+        """Test greetings never start the planner"""
+        mock_settings.SPECULATIVE_PLANNER = True
+        mock_router.return_value = {"intent": "chat", "memory_summary": ""}
+
+        await handle_websocket_message("s1", "Hello there!")
+
+        mock_planner.assert_not_called()
+
+
+@pytest.fixture
+def planner_cache_llm():
+    """Real router and planner with a fake planner LLM and an in-memory cache"""
+    from app.agents.workflow.planner import _planner_cache, planner_agent
+
+    cache_redis = MagicMock()
+    cache_redis.client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    outline = {
+        "style": "adventure",
+        "characters": ["Luna the rabbit"],
+        "setting": "A moonlit forest",
+        "plot_summary": "Luna finds the lost star",
+        "chapters": [
+            {"chapter_id": i, "title": f"T{i}", "summary": f"S{i}", "image_description": "A white rabbit"}
+            for i in range(1, 5)
+        ],
+    }
+    generator = MagicMock()
+    generator.generate = AsyncMock(return_value=json.dumps({"needs_info": False, "language": "en", "story_outline": outline}))
+
+    async def pipeline(session_id, state, **kwargs):
+        await planner_agent(state)
+
+    _planner_cache.cache_clear()
+    with patch("app.services.cache.redis_lru.get_redis", return_value=cache_redis), \
+         patch("app.agents.workflow.planner.get_text_generator", return_value=generator), \
+         patch("app.api.story.process_story_generation", side_effect=pipeline), \
+         patch("app.api.story.update_memory_summary", AsyncMock(return_value="")), \
+         patch("app.api.story.manager.send_to_session", AsyncMock()):
+        yield generator
+    _planner_cache.cache_clear()
+
+
+@pytest.mark.asyncio
+class TestPlannerCacheIntegration:
+    """Test the planner cache is used in the real message flow"""
+
+    async def test_first_story_of_new_sessions_shares_outline(self, planner_cache_llm, fake_session_redis):
+        """Test the router's summary of the theme doesn't bypass the cache"""
+        await handle_websocket_message("s1", "A story about a dragon")
+        await handle_websocket_message("s2", "a story about a Dragon!")
+
+        assert planner_cache_llm.generate.call_count == 1
+
+    async def test_session_with_history_bypasses_cache(self, planner_cache_llm, fake_session_redis):
+        """Test a session whose earlier turns shape the prompt plans afresh"""
+        await handle_websocket_message("s1", "A story about a dragon")
+        await save_state_to_redis("s2", {"memory_summary": "Likes stories about pirates"})
+        await handle_websocket_message("s2", "Write a new story about a dragon")
+
+        assert planner_cache_llm.generate.call_count == 2
+
+
+@pytest.mark.asyncio
+class TestSessionTasks:
+    """Test per-session pipeline tasks and cancellation"""
+
+    @patch('app.api.websocket.manager')
+    async def test_newer_message_supersedes_running_pipeline(self, mock_manager):
+        """Test a new pipeline cancels and waits out the running one"""
+        mock_manager.send_to_session = AsyncMock()
+        mock_manager.broadcast.publish_control = AsyncMock()
+        mock_manager.events.reset = AsyncMock()
+        tasks = SessionTasks()
+        unwound = asyncio.Event()
+
+        async def long_pipeline():
+            try:
+                await asyncio.sleep(10)
+            finally:
+                unwound.set()
+
+        first = await tasks.start("s1", long_pipeline())
+        await asyncio.sleep(0)
+        second = await tasks.start("s1", asyncio.sleep(0, result="done"))
+
+        assert first.cancelled() and unwound.is_set()
+        assert await second == "done"
+        sent = mock_manager.send_to_session.call_args[0][0]
+        assert sent["type"] == "pipeline_completed"
+        assert sent["data"] == {"status": "cancelled", "reason": "superseded"}
+
+    async def test_cancel(self):
+        """Test cancel stops the running pipeline and reports whether one ran"""
+        tasks = SessionTasks()
+        task = await tasks.start("s1", asyncio.sleep(10))
+        await asyncio.sleep(0)
+
+        assert await tasks.cancel("s1") is True
+        assert task.cancelled()
+        assert await tasks.cancel("s1") is False
+        assert not tasks.running("s1")
+
+    @patch('app.api.websocket.manager')
+    async def test_abandoned_session_cancelled_after_grace(self, mock_manager):
+        """Test a pipeline is cancelled only if no socket came back"""
+        mock_manager.broadcast.publish_control = AsyncMock()
+        mock_manager.events.reset = AsyncMock()
+        mock_manager.is_connected = AsyncMock(return_value=True)
+        tasks = SessionTasks()
+        task = await tasks.start("s1", asyncio.sleep(10))
+
+        await tasks.cancel_if_abandoned("s1", grace=0)
+        assert not task.done()
+
+        mock_manager.is_connected.return_value = False
+        await tasks.cancel_if_abandoned("s1", grace=0)
+        assert task.cancelled()
+
+    @patch('app.api.story.manager')
+    @patch('app.api.story.router_agent')
+    @patch('app.api.story.load_state_from_redis')
+    async def test_cancellation_reaches_provider_call(self, mock_load, mock_router, mock_manager):
+        """Test cancelling a message task cancels the in-flight LLM call"""
+        mock_load.return_value = {}
+        mock_manager.send_to_session = AsyncMock()
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def slow_router(state):
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        mock_router.side_effect = slow_router
+        tasks = SessionTasks()
+        await tasks.start("s1", handle_websocket_message("s1", "A brave rabbit"))
+        await started.wait()
+        await tasks.cancel("s1")
+
+        assert cancelled.is_set()
+        error_calls = [c for c in mock_manager.send_to_session.call_args_list if c[0][0]["type"] == "error"]
+        assert error_calls == []
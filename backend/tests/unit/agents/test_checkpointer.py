@@ -0,0 +1,100 @@
+"""
+Tests for story workflow checkpointers
+"""
+import operator
+import pytest
+from typing import TypedDict, Annotated, List
+from unittest.mock import patch
+
+from langgraph.graph import StateGraph, END
+
+from app.agents.workflow.checkpointer import (
+    BoundedMemorySaver,
+    create_checkpointer,
+)
+
+
+class _State(TypedDict):
+    text: str
+    items: Annotated[List[str], operator.add]
+
+
+def _build_graph(checkpointer):
+    workflow = StateGraph(_State)
+    workflow.add_node("first", lambda s: {"items": ["a" * 200]})
+    workflow.add_node("second", lambda s: {"text": "done"})
+    workflow.set_entry_point("first")
+    workflow.add_edge("first", "second")
+    workflow.add_edge("second", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def _config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+@pytest.mark.asyncio
+class TestBoundedMemorySaver:
+    """Test bounded in-memory checkpointer"""
+
+    async def test_tracks_and_releases_bytes(self):
+        """Test that byte accounting returns to zero after delete"""
+        saver = BoundedMemorySaver(max_bytes=10 * 1024 * 1024)
+        graph = _build_graph(saver)
+
+        await graph.ainvoke({"text": "", "items": []}, _config("t1"))
+        assert saver.total_bytes > 0
+        assert (await graph.aget_state(_config("t1"))).values["text"] == "done"
+
+        await saver.adelete_thread("t1")
+        assert saver.total_bytes == 0
+        assert "t1" not in saver.storage
+
+    async def test_lru_eviction_by_byte_budget(self):
+        """Test that least recently used threads are evicted over budget"""
+        saver = BoundedMemorySaver(max_bytes=10 * 1024 * 1024)
+        graph = _build_graph(saver)
+        await graph.ainvoke({"text": "", "items": []}, _config("t1"))
+        saver.max_bytes = saver.total_bytes + 1
+
+        await graph.ainvoke({"text": "", "items": []}, _config("t2"))
+
+        assert "t1" not in saver.storage
+        assert "t2" in saver.storage
+        assert saver.evictions == 1
+        assert list(saver._usage) == ["t2"]
+
+    async def test_max_threads(self):
+        """Test that thread count cap evicts oldest threads"""
+        saver = BoundedMemorySaver(max_bytes=10 * 1024 * 1024, max_threads=2)
+        graph = _build_graph(saver)
+
+        for thread_id in ("t1", "t2", "t3"):
+            await graph.ainvoke({"text": "", "items": []}, _config(thread_id))
+
+        assert list(saver._usage) == ["t2", "t3"]
+
+    async def test_ttl_expiry(self):
+        """Test that expired threads are dropped on access"""
+        saver = BoundedMemorySaver(max_bytes=10 * 1024 * 1024, ttl_seconds=60)
+        graph = _build_graph(saver)
+        await graph.ainvoke({"text": "", "items": []}, _config("t1"))
+
+        with patch("app.agents.workflow.checkpointer.time.monotonic", return_value=10**9):
+            assert await saver.aget_tuple(_config("t1")) is None
+        assert saver.total_bytes == 0
+
+
+class TestCreateCheckpointer:
+    """Test checkpointer factory"""
+
+    @patch("app.agents.workflow.checkpointer.settings")
+    def test_memory_backend(self, mock_settings):
+        mock_settings.CHECKPOINT_MAX_BYTES = 1024
+        mock_settings.CHECKPOINT_TTL_SECONDS = 60
+        mock_settings.CHECKPOINT_MAX_THREADS = 10
+
+        saver = create_checkpointer()
+
+        assert isinstance(saver, BoundedMemorySaver)
+        assert saver.max_bytes == 1024
@@ -0,0 +1,72 @@
+"""
+Tests for regenerate outline diff
+"""
+from app.agents.workflow.diff import build_previous_story, reusable_text, reusable_image
+
+
+def _outline(summaries, images):
+    return {
+        "chapters": [
+            {"chapter_id": i, "title": f"Chapter {i}", "summary": summary, "image_description": image}
+            for i, (summary, image) in enumerate(zip(summaries, images), 1)
+        ]
+    }
+
+
+def _saved_state():
+    return {
+        "language": "en",
+        "story_outline": _outline(["s1", "s2", "s3", "s4"], ["i1", "i2", "i3", "i4"]),
+        "finalized_text": {"chapters": [
+            {"chapter_id": i, "title": f"Chapter {i}", "content": f"text {i}"} for i in range(1, 5)
+        ]},
+        "finalized_images": {"chapters": [
+            {"chapter_id": i, "image": f"https://img/{i}.png"} for i in range(1, 5)
+        ]},
+    }
+
+
+def _regenerate_state(summaries, images, language="en"):
+    return {
+        "language": language,
+        "story_outline": _outline(summaries, images),
+        "previous_story": build_previous_story(_saved_state()),
+    }
+
+
+class TestOutlineDiff:
+    """Test which chapters a regenerate can reuse"""
+
+    def test_only_changed_chapter_is_redone(self):
+        state = _regenerate_state(["s1", "s2", "s3 renamed", "s4"], ["i1", "i2", "i3", "i4 renamed"])
+
+        assert [i for i in range(1, 5) if reusable_text(state, i) is None] == [3]
+        assert [i for i in range(1, 5) if reusable_image(state, i) is None] == [4]
+        assert reusable_text(state, 1) == {"chapter_id": 1, "title": "Chapter 1", "content": "text 1"}
+        assert reusable_image(state, 3) == {"chapter_id": 3, "image": "https://img/3.png"}
+
+    def test_language_change_redoes_all_text(self):
+        state = _regenerate_state(["s1", "s2", "s3", "s4"], ["i1", "i2", "i3", "i4"], language="zh")
+
+        assert all(reusable_text(state, i) is None for i in range(1, 5))
+        assert all(reusable_image(state, i) is not None for i in range(1, 5))
+
+    def test_new_chapter_is_generated(self):
+        state = _regenerate_state(["s1", "s2", "s3", "s4", "s5"], ["i1", "i2", "i3", "i4", "i5"])
+
+        assert reusable_text(state, 5) is None
+        assert reusable_image(state, 5) is None
+
+    def test_no_previous_story(self):
+        assert build_previous_story({"story_outline": _outline(["s1"], ["i1"])}) is None
+        assert reusable_text({"story_outline": _outline(["s1"], ["i1"])}, 1) is None
+
+    def test_json_round_trip_keys(self):
+        """Test chapter lookups survive string keys from JSON"""
+        state = _regenerate_state(["s1", "s2", "s3", "s4"], ["i1", "i2", "i3", "i4"])
+        previous = state["previous_story"]
+        previous["text"] = {str(k): v for k, v in previous["text"].items()}
+        previous["images"] = {str(k): v for k, v in previous["images"].items()}
+
+        assert reusable_text(state, 2)["content"] == "text 2"
+        assert reusable_image(state, 2)["image"] == "https://img/2.png"
@@ -256,3 +256,14 @@ class TestFinalizerOutputFormat:
         assert isinstance(result["finalized_images"], dict)
         assert "chapters" in result["finalized_images"]
 
+    async def test_finalizer_image_follows_outline_chapters(self):
+        """Test image finalizer returns one entry per outline chapter"""
+        outline = create_base_state()["story_outline"]
+        outline["chapters"] = [{"chapter_id": i, "title": f"Chapter {i}"} for i in range(1, 9)]
+        state = create_base_state(story_outline=outline, chapters=[{"chapter_id": 7, "image": "url_7"}])
+
+        result = await finalizer_image_agent(state)
+
+        chapters = result["finalized_images"]["chapters"]
+        assert [ch["chapter_id"] for ch in chapters] == list(range(1, 9))
+        assert chapters[6]["image"] == "url_7"
@@ -0,0 +1,373 @@
+"""
+Tests for Story Graph construction and sharing
+"""
+import asyncio
+import logging
+import pytest
+from unittest.mock import patch
+
+from app.agents.workflow.graph import (
+    create_story_graph,
+    get_story_graph,
+    create_thread_config,
+    warmup_story_graph,
+)
+from app.agents.workflow.prefetch import ChapterPrefetch, current_prefetch
+
+
+class TestStoryGraphSingleton:
+    """Test compiled graph is shared across requests"""
+
+    def test_get_story_graph_singleton(self):
+        """Test that get_story_graph compiles once"""
+        graph1 = get_story_graph()
+        graph2 = get_story_graph()
+
+        assert graph1 is graph2
+
+    def test_warmup_returns_shared_graph(self):
+        """Test that warm-up compiles the same shared graph"""
+        assert warmup_story_graph() is get_story_graph()
+
+    def test_thread_config_isolated_per_run(self):
+        """Test that each run gets its own checkpoint thread"""
+        config1 = create_thread_config("session-1")
+        config2 = create_thread_config("session-1")
+
+        thread1 = config1["configurable"]["thread_id"]
+        thread2 = config2["configurable"]["thread_id"]
+        assert thread1.startswith("session-1:")
+        assert thread1 != thread2
+
+
+def _outline(chapter_count: int = 4) -> dict:
+    return {
+        "style": "adventure",
+        "characters": ["Dragon"],
+        "setting": "Kingdom",
+        "plot_summary": "A dragon story",
+        "chapters": [
+            {"chapter_id": i, "title": f"Chapter {i}", "summary": f"Summary {i}", "image_description": f"Image {i}"}
+            for i in range(1, chapter_count + 1)
+        ],
+    }
+
+
+def _initial_state() -> dict:
+    return {
+        "theme": "dragon",
+        "memory_summary": None,
+        "intent": "story_generate",
+        "language": "en",
+        "story_outline": None,
+        "needs_info": False,
+        "missing_fields": None,
+        "suggestions": None,
+        "chapters": [],
+        "completed_writers": [],
+        "completed_image_gens": [],
+        "finalized_text": None,
+        "finalized_images": None,
+        "session_id": "test-session",
+    }
+
+
+async def _with_prefetch(run):
+    """Await a graph run with a ChapterPrefetch set, as process_story_generation does"""
+    prefetch = ChapterPrefetch()
+    token = current_prefetch.set(prefetch)
+    try:
+        return await run
+    finally:
+        prefetch.cancel()
+        current_prefetch.reset(token)
+
+
+class _AgentLog(list):
+    chapter_count = 4
+    running = 0
+    max_running = 0
+
+
+@pytest.fixture
+def fake_agents():
+    """Replace graph agents with fast stubs that record execution order"""
+    log = _AgentLog()
+
+    async def planner(state, on_chapter=None):
+        log.append("planner")
+        return {"needs_info": False, "language": "en", "story_outline": _outline(log.chapter_count)}
+
+    async def writer(state, chapter_id):
+        log.append(f"writer_{chapter_id}")
+        return {"chapters": [{"chapter_id": chapter_id, "title": "T", "content": "text"}], "completed_writers": [chapter_id]}
+
+    async def illustrator(state, chapter_id):
+        log.running += 1
+        log.max_running = max(log.max_running, log.running)
+        await asyncio.sleep(0.01)
+        log.running -= 1
+        log.append(f"illustrator_{chapter_id}")
+        return {"chapters": [{"chapter_id": chapter_id, "image": "url"}], "completed_image_gens": [chapter_id]}
+
+    async def finalizer_text(state):
+        log.append("finalizer_text")
+        return {"finalized_text": {"chapters": [{"chapter_id": 1}]}}
+
+    async def finalizer_image(state):
+        log.append("finalizer_image")
+        return {"finalized_images": {"chapters": [{"chapter_id": 1}]}}
+
+    with patch("app.agents.workflow.graph.planner_agent", planner), \
+         patch("app.agents.workflow.graph.writer_agent", writer), \
+         patch("app.agents.workflow.graph.illustrator_agent", illustrator), \
+         patch("app.agents.workflow.graph.finalizer_text_agent", finalizer_text), \
+         patch("app.agents.workflow.graph.finalizer_image_agent", finalizer_image):
+        yield log
+
+
+@pytest.mark.asyncio
+class TestStoryGraphTopology:
+    """Test sequential and pipelined graph topologies"""
+
+    async def test_sequential_runs_illustrators_after_text(self, fake_agents):
+        """Test illustrators start only after text finalization"""
+        graph = create_story_graph("sequential")
+        final_state = await graph.ainvoke(_initial_state(), create_thread_config("s"))
+
+        first_illustrator = min(fake_agents.index(f"illustrator_{i}") for i in range(1, 5))
+        assert fake_agents.index("finalizer_text") < first_illustrator
+        assert fake_agents.count("finalizer_image") == 1
+        assert final_state["finalized_images"] is not None
+
+    async def test_pipelined_runs_illustrators_with_writers(self, fake_agents):
+        """Test illustrators started by the planner are adopted by the fan-out, not run twice"""
+        graph = create_story_graph("pipelined")
+        final_state = await _with_prefetch(graph.ainvoke(_initial_state(), create_thread_config("s")))
+
+        assert fake_agents.index("finalizer_text") < fake_agents.index("finalizer_image")
+        assert sorted(final_state["completed_image_gens"]) == [1, 2, 3, 4]
+        for i in range(1, 5):
+            assert fake_agents.count(f"illustrator_{i}") == 1
+        assert fake_agents.count("finalizer_image") == 1
+        assert final_state["finalized_text"] is not None
+        assert final_state["finalized_images"] is not None
+
+    async def test_pipelined_without_prefetch_warns(self, fake_agents, caplog):
+        """Test a pipelined run without a ChapterPrefetch says it runs sequentially"""
+        graph = create_story_graph("pipelined")
+        with caplog.at_level(logging.WARNING, logger="app.agents.workflow.graph"):
+            final_state = await graph.ainvoke(_initial_state(), create_thread_config("s"))
+
+        assert "runs sequentially" in caplog.text
+        assert final_state["finalized_images"] is not None
+
+    async def test_sequential_without_prefetch_is_quiet(self, fake_agents, caplog):
+        """Test the sequential graph doesn't need a ChapterPrefetch"""
+        with caplog.at_level(logging.WARNING, logger="app.agents.workflow.graph"):
+            await create_story_graph("sequential").ainvoke(_initial_state(), create_thread_config("s"))
+
+        assert "ChapterPrefetch" not in caplog.text
+
+    async def test_pipelined_text_not_held_by_illustrators(self, fake_agents):
+        """Test finalizer_text is emitted while slow illustrators are still running"""
+        async def slow_illustrator(state, chapter_id):
+            await asyncio.sleep(0.3)
+            fake_agents.append(f"illustrator_{chapter_id}")
+            return {"chapters": [{"chapter_id": chapter_id, "image": "url"}], "completed_image_gens": [chapter_id]}
+
+        graph = create_story_graph("pipelined")
+        seen = {}
+        started = asyncio.get_running_loop().time()
+        with patch("app.agents.workflow.graph.illustrator_agent", slow_illustrator):
+            async def run():
+                async for event in graph.astream(_initial_state(), create_thread_config("s")):
+                    for node in event:
+                        seen.setdefault(node, asyncio.get_running_loop().time() - started)
+            await _with_prefetch(run())
+
+        assert seen["finalizer_text"] < 0.2
+        assert not any(e.startswith("illustrator_") for e in fake_agents[:fake_agents.index("finalizer_text")])
+        # Illustrators ran alongside the text path, not after it
+        assert seen["finalizer_image"] < 0.5
+
+    async def test_unknown_topology(self):
+        """Test invalid topology is rejected"""
+        with pytest.raises(ValueError, match="Unsupported story graph topology"):
+            create_story_graph("circular")
+
+    async def test_barrier_fires_once_with_uneven_branches(self, fake_agents):
+        """Test finalizers run once even when branches finish in different steps"""
+        with patch("app.agents.workflow.graph.writer_agent") as writer:
+            async def slow_writer(state, chapter_id):
+                for _ in range(chapter_id):
+                    await asyncio.sleep(0)
+                fake_agents.append(f"writer_{chapter_id}")
+                return {"chapters": [{"chapter_id": chapter_id}], "completed_writers": [chapter_id]}
+            writer.side_effect = slow_writer
+            graph = create_story_graph("pipelined")
+            await graph.ainvoke(_initial_state(), create_thread_config("s"))
+
+        assert fake_agents.count("finalizer_text") == 1
+        assert fake_agents.count("finalizer_image") == 1
+
+    async def test_needs_info_ends_after_planner(self, fake_agents):
+        """Test planner asking for more info stops the run"""
+        with patch("app.agents.workflow.graph.planner_agent", return_value={"needs_info": True}):
+            graph = create_story_graph("sequential")
+            steps = [step async for step in graph.astream(_initial_state(), create_thread_config("s"))]
+
+        assert [list(step) for step in steps] == [["planner"]]
+        assert fake_agents == []
+
+    async def test_no_polling_nodes(self):
+        """Test graph has no self-looping completion check nodes"""
+        for topology in ("sequential", "pipelined"):
+            nodes = set(create_story_graph(topology).nodes) - {"__start__"}
+            assert nodes == {"planner", "writer", "illustrator", "finalizer_text", "finalizer_image"}
+
+    async def test_fanout_follows_chapter_count(self, fake_agents):
+        """Test one writer and illustrator task per planned chapter"""
+        fake_agents.chapter_count = 12
+        graph = create_story_graph("pipelined")
+        final_state = await graph.ainvoke(_initial_state(), create_thread_config("s"))
+
+        assert sorted(final_state["completed_writers"]) == list(range(1, 13))
+        assert sorted(final_state["completed_image_gens"]) == list(range(1, 13))
+        assert fake_agents.count("finalizer_text") == 1
+        assert fake_agents.count("finalizer_image") == 1
+
+    @patch("app.agents.workflow.concurrency.settings")
+    async def test_stage_concurrency_is_bounded(self, mock_settings, fake_agents):
+        """Test illustrators never exceed ILLUSTRATOR_MAX_CONCURRENCY"""
+        mock_settings.WRITER_MAX_CONCURRENCY = 4
+        mock_settings.ILLUSTRATOR_MAX_CONCURRENCY = 3
+        fake_agents.chapter_count = 8
+        graph = create_story_graph("sequential")
+        final_state = await graph.ainvoke(_initial_state(), create_thread_config("s"))
+
+        assert fake_agents.max_running == 3
+        assert len(set(final_state["completed_image_gens"])) == 8
+
+    async def test_regenerate_reuses_unchanged_chapters(self, fake_agents):
+        """Test only chapters with a changed outline are regenerated"""
+        from app.agents.workflow.diff import build_previous_story
+
+        old_outline = _outline()
+        new_outline = _outline()
+        new_outline["chapters"][2]["summary"] = "Renamed hero"
+        previous = build_previous_story({
+            "language": "en",
+            "story_outline": old_outline,
+            "finalized_text": {"chapters": [{"chapter_id": i, "title": "T", "content": f"old {i}"} for i in range(1, 5)]},
+            "finalized_images": {"chapters": [{"chapter_id": i, "image": f"old-{i}.png"} for i in range(1, 5)]},
+        })
+        state = {**_initial_state(), "intent": "regenerate", "previous_story": previous}
+
+        with patch("app.agents.workflow.graph.planner_agent", return_value={"needs_info": False, "language": "en", "story_outline": new_outline}):
+            final_state = await create_story_graph("pipelined").ainvoke(state, create_thread_config("s"))
+
+        assert [e for e in fake_agents if e.startswith("writer_")] == ["writer_3"]
+        assert not [e for e in fake_agents if e.startswith("illustrator_")]
+        assert sorted(final_state["completed_writers"]) == [1, 2, 3, 4]
+        assert sorted(set(final_state["reused_chapters"])) == [1, 2, 3, 4]
+        assert fake_agents.count("finalizer_image") == 1
+
+
+def _streaming_planner(log, final_outline=None):
+    """Planner stub that reports chapters one by one before returning"""
+    async def planner(state, on_chapter=None):
+        plan = {"needs_info": False, "language": "en", "story_outline": _outline()}
+        for chapter in plan["story_outline"]["chapters"]:
+            if on_chapter is not None:
+                on_chapter(plan, chapter)
+            await asyncio.sleep(0.005)
+        log.append("planner")
+        if final_outline is not None:
+            plan = {**plan, "story_outline": final_outline}
+        return plan
+    return planner
+
+
+@pytest.mark.asyncio
+class TestChapterPrefetch:
+    """Test chapter tasks start from the streaming planner"""
+
+    async def _run(self, topology):
+        return await _with_prefetch(create_story_graph(topology).ainvoke(_initial_state(), create_thread_config("s")))
+
+    async def test_writers_start_before_planner_returns(self, fake_agents):
+        """Test prefetched writers and illustrators are adopted, not run twice"""
+        with patch("app.agents.workflow.graph.planner_agent", _streaming_planner(fake_agents)):
+            final_state = await self._run("pipelined")
+
+        assert fake_agents.index("writer_1") < fake_agents.index("planner")
+        assert fake_agents.index("illustrator_1") < fake_agents.index("planner")
+        for i in range(1, 5):
+            assert fake_agents.count(f"writer_{i}") == 1
+            assert fake_agents.count(f"illustrator_{i}") == 1
+        assert sorted(final_state["completed_writers"]) == [1, 2, 3, 4]
+
+    async def test_sequential_prefetches_writers_only(self, fake_agents):
+        """Test illustrators still wait for finalized text in the sequential graph"""
+        with patch("app.agents.workflow.graph.planner_agent", _streaming_planner(fake_agents)):
+            await self._run("sequential")
+
+        assert fake_agents.index("writer_1") < fake_agents.index("planner")
+        first_illustrator = min(fake_agents.index(f"illustrator_{i}") for i in range(1, 5))
+        assert fake_agents.index("finalizer_text") < first_illustrator
+
+    async def test_changed_chapter_is_rerun(self, fake_agents):
+        """Test a prefetched chapter whose final outline differs runs again"""
+        final_outline = _outline()
+        final_outline["chapters"][1]["summary"] = "Changed"
+        with patch("app.agents.workflow.graph.planner_agent", _streaming_planner(fake_agents, final_outline)):
+            await self._run("sequential")
+
+        assert fake_agents.count("writer_2") == 2
+        assert fake_agents.count("writer_1") == 1
+
+
+@pytest.mark.asyncio
+class TestBatchedWriterMode:
+    """Test WRITER_MODE=batched writes chapter groups in shared calls"""
+
+    async def _run(self, batch_size, log):
+        calls = []
+
+        async def batched_writer(state, chapter_id, group):
+            calls.append(tuple(group))
+            log.append(f"writer_{chapter_id}")
+            return {"chapters": [{"chapter_id": chapter_id, "title": "T", "content": "text"}], "completed_writers": [chapter_id]}
+
+        with patch("app.agents.workflow.graph.settings.WRITER_MODE", "batched"), \
+             patch("app.agents.workflow.graph.settings.WRITER_BATCH_SIZE", batch_size), \
+             patch("app.agents.workflow.graph.batched_writer_agent", batched_writer):
+            final_state = await create_story_graph("pipelined").ainvoke(_initial_state(), create_thread_config("s"))
+        return calls, final_state
+
+    async def test_all_chapters_in_one_group(self, fake_agents):
+        """Test every chapter joins the same group when they fit in WRITER_BATCH_SIZE"""
+        calls, final_state = await self._run(4, fake_agents)
+
+        assert set(calls) == {(1, 2, 3, 4)}
+        assert sorted(final_state["completed_writers"]) == [1, 2, 3, 4]
+        assert fake_agents.count("finalizer_text") == 1
+
+    async def test_zero_batch_size_is_bounded(self, fake_agents):
+        """Test WRITER_BATCH_SIZE=0 doesn't put every chapter in one call"""
+        calls, _ = await self._run(0, fake_agents)
+
+        assert set(calls) == {(1,), (2,), (3,), (4,)}
+
+    async def test_group_size(self, fake_agents):
+        """Test WRITER_BATCH_SIZE splits chapters into groups in order"""
+        calls, _ = await self._run(2, fake_agents)
+
+        assert set(calls) == {(1, 2), (3, 4)}
+
+    async def test_rejects_unknown_mode(self):
+        """Test an unknown WRITER_MODE fails at graph build time"""
+        with patch("app.agents.workflow.graph.settings.WRITER_MODE", "serial"):
+            with pytest.raises(ValueError):
+                create_story_graph("pipelined")
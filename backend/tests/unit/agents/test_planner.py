@@ -1,9 +1,13 @@
 """
 Comprehensive tests for Planner Agent
 """
+import json
 import pytest
+import fakeredis
+from unittest.mock import patch, MagicMock, AsyncMock
+
 from app.agents.state import StoryState
-from app.agents.workflow.planner import planner_agent
+from app.agents.workflow.planner import planner_agent, _fill_defaults, normalize_theme, _planner_cache
 
 
 def create_base_state(**kwargs) -> StoryState:
@@ -212,3 +216,142 @@ class TestPlannerOutputFormat:
             
             assert result["language"] == expected_lang
 
+
+class TestPlannerChapterCount:
+    """Test outline is padded or trimmed to the configured chapter count"""
+
+    def test_fill_defaults_pads_to_chapter_count(self):
+        data = {"story_outline": {"chapters": [{"chapter_id": 1, "title": "One", "summary": "", "image_description": ""}]}}
+        result = _fill_defaults(data, chapter_count=8)
+
+        chapters = result["story_outline"]["chapters"]
+        assert [ch["chapter_id"] for ch in chapters] == list(range(1, 9))
+        assert chapters[0]["title"] == "One"
+
+    def test_fill_defaults_trims_to_chapter_count(self):
+        data = {"story_outline": {"chapters": [{"chapter_id": i} for i in range(1, 7)]}}
+        result = _fill_defaults(data, chapter_count=4)
+
+        assert len(result["story_outline"]["chapters"]) == 4
+
+
+@pytest.fixture
+def planner_llm():
+    """Planner with a fake LLM and an in-memory Redis cache"""
+    redis = MagicMock()
+    redis.client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    outline = {
+        "style": "adventure",
+        "characters": ["Cat"],
+        "setting": "A garden",
+        "plot_summary": "A cat explores",
+        "chapters": [{"chapter_id": i, "title": f"T{i}", "summary": f"S{i}", "image_description": "cat"} for i in range(1, 5)],
+    }
+    generator = MagicMock()
+    generator.generate = AsyncMock(return_value=json.dumps({"needs_info": False, "language": "en", "story_outline": outline}))
+    _planner_cache.cache_clear()
+    with patch("app.services.cache.redis_lru.get_redis", return_value=redis), \
+         patch("app.agents.workflow.planner.get_text_generator", return_value=generator):
+        yield generator
+    _planner_cache.cache_clear()
+
+
+@pytest.mark.asyncio
+class TestPlannerCache:
+    """Test planner outlines are cached by normalized theme"""
+
+    async def test_repeated_theme_skips_llm(self, planner_llm):
+        first = await planner_agent(create_base_state(theme="A story about a dragon!"))
+        second = await planner_agent(create_base_state(theme="a story about a Dragon"))
+
+        assert planner_llm.generate.call_count == 1
+        assert second == first
+
+    async def test_regenerate_bypasses_cache(self, planner_llm):
+        await planner_agent(create_base_state(theme="dragon"))
+        await planner_agent(create_base_state(theme="dragon", intent="regenerate"))
+
+        assert planner_llm.generate.call_count == 2
+
+    async def test_session_summary_bypasses_cache(self, planner_llm):
+        await planner_agent(create_base_state(theme="dragon", memory_summary="dragon"))
+        await planner_agent(create_base_state(theme="dragon", session_summary="Likes pirates"))
+
+        assert planner_llm.generate.call_count == 2
+
+    async def test_needs_info_not_cached(self, planner_llm):
+        planner_llm.generate.return_value = json.dumps({"needs_info": True, "language": "en"})
+        await planner_agent(create_base_state(theme="asdf"))
+        await planner_agent(create_base_state(theme="asdf"))
+
+        assert planner_llm.generate.call_count == 2
+
+    async def test_padded_outline_not_cached(self, planner_llm):
+        """Test outlines completed with defaults (e.g. truncated responses) are not shared"""
+        response = json.loads(planner_llm.generate.return_value)
+        del response["story_outline"]["chapters"][3]
+        partial = json.dumps(response)
+        no_setting = json.dumps({**response, "story_outline": {**response["story_outline"], "setting": ""}})
+        for text in (partial, partial[:-40], no_setting):
+            planner_llm.generate.return_value = text
+            await planner_agent(create_base_state(theme="dragon"))
+
+        assert planner_llm.generate.call_count == 3
+        assert await _planner_cache().labels() == {}
+
+    @patch("app.agents.workflow.planner.settings")
+    async def test_fuzzy_match(self, mock_settings, planner_llm):
+        mock_settings.PLANNER_CACHE_ENABLED = True
+        mock_settings.PLANNER_CACHE_FUZZY = True
+        mock_settings.PLANNER_CACHE_FUZZY_THRESHOLD = 0.6
+        mock_settings.PLANNER_STREAMING = False
+        mock_settings.PLANNER_CACHE_MAX_ENTRIES = 100
+        mock_settings.PLANNER_CACHE_TTL_SECONDS = 60
+        mock_settings.STORY_CHAPTER_COUNT = 4
+
+        await planner_agent(create_base_state(theme="a brave little dragon"))
+        await planner_agent(create_base_state(theme="brave little dragons"))
+        await planner_agent(create_base_state(theme="a sleepy cat"))
+
+        assert planner_llm.generate.call_count == 2
+
+    def test_normalize_theme(self):
+        assert normalize_theme("  A Story about the Dragon!! ") == "dragon"
+        assert normalize_theme("小猫。") == "小猫"
+        assert normalize_theme("Ｄｒａｇｏｎ") == "dragon"
+
+
+@pytest.mark.asyncio
+class TestPlannerStreaming:
+    """Test the streaming planner reports chapters before the outline is done"""
+
+    @patch("app.agents.workflow.planner.settings")
+    @patch("app.agents.workflow.planner.get_text_generator")
+    async def test_chapters_reported_while_streaming(self, mock_get_generator, mock_settings):
+        mock_settings.PLANNER_CACHE_ENABLED = False
+        mock_settings.PLANNER_STREAMING = True
+        mock_settings.STORY_CHAPTER_COUNT = 4
+        outline = {
+            "style": "adventure", "characters": ["Cat"], "setting": "Garden", "plot_summary": "A cat story",
+            "chapters": [{"chapter_id": i, "title": f"T{i}", "summary": "S", "image_description": "cat"} for i in range(1, 5)],
+        }
+        text = json.dumps({"needs_info": False, "language": "en", "story_outline": outline})
+        streamed = []
+
+        async def generate_stream(prompt, temperature, max_tokens):
+            for i in range(0, len(text), 16):
+                streamed.append(i)
+                yield text[i:i + 16]
+
+        mock_get_generator.return_value.generate_stream = generate_stream
+        reported = []
+
+        def on_chapter(plan, chapter):
+            reported.append((chapter["chapter_id"], len(streamed), plan["story_outline"]["setting"]))
+
+        result = await planner_agent(create_base_state(theme="a cat"), on_chapter=on_chapter)
+
+        assert [chapter_id for chapter_id, _, _ in reported] == [1, 2, 3, 4]
+        assert reported[0][1] < len(streamed)
+        assert reported[0][2] == "Garden"
+        assert result["story_outline"]["chapters"] == outline["chapters"]
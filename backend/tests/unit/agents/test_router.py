@@ -2,8 +2,10 @@
 Comprehensive tests for Router Agent
 """
 import pytest
+from unittest.mock import patch, AsyncMock
 from app.agents.state import StoryState
-from app.agents.conversation.router import router_agent
+from app.agents.conversation.router import router_agent, classify_locally, update_memory_summary
+from app.core.metrics import metrics
 
 
 def create_base_state(**kwargs) -> StoryState:
@@ -224,3 +226,114 @@ class TestRouterOutputFormat:
             
             assert isinstance(result["memory_summary"], str)
 
+
+
+class TestRouterPreClassifier:
+    """Test local intent classification without an LLM call"""
+
+    @pytest.mark.parametrize("user_input,summary,expected", [
+        ("你好，今天天气真好！", "", "chat"),
+        ("What's your favorite color?", "", "chat"),
+        ("主角是谁？", "A rabbit story", "chat"),
+        ("A story about a magical forest", "", "story_generate"),
+        ("a brave little dragon", "", "story_generate"),
+        ("Can you write a story about a cat?", "", "story_generate"),
+        ("create a new story about space", "A rabbit story", "story_generate"),
+        ("把这个故事的主角改成小狗", "A rabbit story", "regenerate"),
+        ("Change the ending please", "A rabbit story", "regenerate"),
+        ("please continue the story", "A rabbit story", "regenerate"),
+        ("rewrite the last chapter", "A rabbit story", "regenerate"),
+        ("继续写吧", "A rabbit story", "regenerate"),
+        ("I can't change my mind", "A rabbit story", None),
+        ("Let's continue tomorrow", "A rabbit story", None),
+        ("The owl could come instead", "A rabbit story", None),
+        ("换一个话题吧", "A rabbit story", None),
+        ("这个故事讲什么？", "A rabbit story", None),
+        ("The rabbit should be brave", "A rabbit story", None),
+    ])
+    def test_classify_locally(self, user_input, summary, expected):
+        assert classify_locally(user_input, summary) == expected
+
+    @pytest.mark.asyncio
+    @patch("app.agents.conversation.router.get_text_generator")
+    async def test_local_hit_skips_llm(self, mock_get_generator):
+        """Test obvious inputs never reach the text generator"""
+        local_before = metrics.counter("router_classifications_total", "").value(tier="local", intent="story_generate")
+
+        result = await router_agent(create_base_state(theme="A story about a magical forest"))
+
+        assert result == {"intent": "story_generate", "memory_summary": "A story about a magical forest"}
+        mock_get_generator.assert_not_called()
+        assert metrics.counter("router_classifications_total", "").value(tier="local", intent="story_generate") == local_before + 1
+
+    @pytest.mark.asyncio
+    @patch("app.agents.conversation.router.get_text_generator")
+    async def test_chat_keeps_summary(self, mock_get_generator):
+        """Test local chat decisions leave the summary untouched"""
+        result = await router_agent(create_base_state(theme="主角是谁？", memory_summary="A rabbit story"))
+
+        assert result == {"intent": "chat", "memory_summary": "A rabbit story"}
+        mock_get_generator.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("app.agents.conversation.router.get_text_generator")
+    async def test_ambiguous_input_falls_through(self, mock_get_generator):
+        """Test ambiguous inputs are classified by the LLM"""
+        generator = AsyncMock()
+        generator.generate.return_value = '{"intent": "regenerate"}'
+        mock_get_generator.return_value = generator
+
+        result = await router_agent(create_base_state(theme="The rabbit should be brave", memory_summary="A rabbit story"))
+
+        assert result == {"intent": "regenerate", "memory_summary": "A rabbit story"}
+        generator.generate.assert_awaited_once()
+        assert 0.0 < metrics.gauge("router_local_hit_ratio", "").value() < 1.0
+
+    @pytest.mark.asyncio
+    @patch("app.agents.conversation.router.settings")
+    @patch("app.agents.conversation.router.get_text_generator")
+    async def test_fast_path_disabled(self, mock_get_generator, mock_settings):
+        """Test every input goes to the LLM when the fast path is off"""
+        mock_settings.ROUTER_FAST_PATH = False
+        generator = AsyncMock()
+        generator.generate.return_value = '{"intent": "chat", "memory_summary": ""}'
+        mock_get_generator.return_value = generator
+
+        result = await router_agent(create_base_state(theme="Hello there"))
+
+        assert result["intent"] == "chat"
+        generator.generate.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+class TestRouterSummaryUpdate:
+    """Test memory summary maintenance split from intent classification"""
+
+    @patch("app.agents.conversation.router.get_text_generator")
+    async def test_intent_prompt_has_small_budget(self, mock_get_generator):
+        """Test intent classification no longer asks for the summary"""
+        generator = AsyncMock()
+        generator.generate.return_value = '{"intent": "chat"}'
+        mock_get_generator.return_value = generator
+
+        await router_agent(create_base_state(theme="The rabbit should be brave", memory_summary="A rabbit story"))
+
+        kwargs = generator.generate.call_args.kwargs
+        assert kwargs["max_tokens"] <= 100
+        assert "memory_summary" not in kwargs["prompt"]
+
+    @patch("app.agents.conversation.router.get_text_generator")
+    async def test_update_memory_summary(self, mock_get_generator):
+        """Test summary update returns the new summary"""
+        generator = AsyncMock()
+        generator.generate.return_value = '{"memory_summary": "A brave rabbit story"}'
+        mock_get_generator.return_value = generator
+
+        assert await update_memory_summary("The rabbit should be brave", "A rabbit story") == "A brave rabbit story"
+
+    @patch("app.agents.conversation.router.get_text_generator")
+    async def test_update_memory_summary_error_keeps_current(self, mock_get_generator):
+        """Test failures keep the current summary"""
+        mock_get_generator.side_effect = Exception("provider down")
+
+        assert await update_memory_summary("The rabbit should be brave", "A rabbit story") == "A rabbit story"
@@ -0,0 +1,65 @@
+"""
+Tests for the speculative planner
+"""
+import asyncio
+import pytest
+from unittest.mock import patch
+
+from app.agents.workflow.speculation import SpeculativePlanner
+from app.agents.workflow.graph import create_story_graph, create_thread_config
+from app.core.metrics import metrics
+
+
+def _speculations(result: str) -> float:
+    return metrics.counter("speculative_planner_total", "").value(result=result)
+
+
+@pytest.mark.asyncio
+class TestSpeculativePlanner:
+    """Test speculative planner hit / miss handling"""
+
+    @patch("app.agents.workflow.speculation.planner_agent")
+    async def test_hit_keeps_planner_run(self, mock_planner):
+        """Test a confirmed guess returns the running planner task"""
+        mock_planner.return_value = {"needs_info": False, "story_outline": {"chapters": []}}
+        hits = _speculations("hit")
+
+        speculation = SpeculativePlanner({"theme": "dragon", "intent": "story_generate"})
+        task = speculation.resolve("story_generate")
+
+        assert await task == {"needs_info": False, "story_outline": {"chapters": []}}
+        assert _speculations("hit") == hits + 1
+        mock_planner.assert_awaited_once()
+
+    @patch("app.agents.workflow.speculation.planner_agent")
+    async def test_miss_cancels_planner(self, mock_planner):
+        """Test a wrong guess cancels the planner run"""
+        started = asyncio.Event()
+
+        async def slow_planner(state):
+            started.set()
+            await asyncio.sleep(10)
+
+        mock_planner.side_effect = slow_planner
+        misses = _speculations("miss")
+
+        speculation = SpeculativePlanner({"theme": "dragon", "intent": "regenerate"})
+        await started.wait()
+
+        assert speculation.resolve("chat") is None
+        with pytest.raises(asyncio.CancelledError):
+            await speculation.task
+        assert _speculations("miss") == misses + 1
+
+    async def test_graph_uses_speculative_plan(self):
+        """Test the planner node returns a speculative plan without planning again"""
+        plan = {"needs_info": True, "missing_fields": ["characters"]}
+        with patch("app.agents.workflow.graph.planner_agent") as mock_planner:
+            graph = create_story_graph("sequential")
+            final_state = await graph.ainvoke(
+                {"theme": "dragon", "speculative_plan": plan, "chapters": []},
+                create_thread_config("s"),
+            )
+
+        mock_planner.assert_not_called()
+        assert final_state["missing_fields"] == ["characters"]
@@ -1,9 +1,14 @@
 """
 Comprehensive tests for Writer Agent
 """
+import asyncio
+import json
 import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
 from app.agents.state import StoryState
-from app.agents.workflow.writer import writer_agent
+from app.agents.workflow import writer as writer_module
+from app.agents.workflow.writer import writer_agent, batched_writer_agent, current_chapter_stream
+from app.api.websocket import DeltaEmitter
 
 
 def create_base_state(**kwargs) -> StoryState:
@@ -201,3 +206,190 @@ class TestWriterOutputFormat:
         assert 2 in result["completed_writers"]
         assert isinstance(result["completed_writers"], list)
 
+
+
+class _StreamingGenerator:
+    """Text generator stub that streams fixed tokens"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.prompts = []
+
+    async def generate_stream(self, prompt, temperature=0.7, max_tokens=None):
+        self.prompts.append(prompt)
+        for token in self.tokens:
+            yield token
+
+
+@pytest.mark.asyncio
+class TestWriterStreaming:
+    """Test Writer forwards tokens as chapter_delta events"""
+
+    @patch('app.agents.workflow.writer.settings')
+    @patch('app.agents.workflow.writer.get_text_generator')
+    async def test_streams_chapter_deltas(self, mock_get_generator, mock_settings):
+        """Test that deltas add up to the final chapter content"""
+        mock_settings.WRITER_STREAMING = True
+        tokens = ["Once ", "upon ", "a ", "time, ", "a brave dragon ", "learned to fly."]
+        generator = _StreamingGenerator(tokens)
+        mock_get_generator.return_value = generator
+
+        token = current_chapter_stream.set(DeltaEmitter)
+        try:
+            with patch('app.api.websocket.manager.send_to_session', new_callable=AsyncMock) as mock_send:
+                result = await writer_agent(create_base_state(), chapter_id=2)
+        finally:
+            current_chapter_stream.reset(token)
+
+        assert result["chapters"][0]["content"] == "".join(tokens).strip()
+        assert result["completed_writers"] == [2]
+        assert "Return JSON" not in generator.prompts[0]
+
+        deltas = [call[0][0] for call in mock_send.call_args_list]
+        assert all(d["type"] == "chapter_delta" for d in deltas)
+        assert all(d["data"]["chapter_id"] == 2 for d in deltas)
+        assert [d["data"]["index"] for d in deltas] == list(range(len(deltas)))
+        assert "".join(d["data"]["delta"] for d in deltas) == "".join(tokens)
+
+    @patch('app.agents.workflow.writer.settings')
+    @patch('app.agents.workflow.writer.get_text_generator')
+    async def test_no_stream_outside_a_run(self, mock_get_generator, mock_settings):
+        """Test tokens aren't sent anywhere when no chapter stream is set"""
+        mock_settings.WRITER_STREAMING = True
+        mock_get_generator.return_value = _StreamingGenerator(["A calm ", "story."])
+
+        with patch('app.api.websocket.manager.send_to_session', new_callable=AsyncMock) as mock_send:
+            result = await writer_agent(create_base_state(), chapter_id=1)
+
+        assert result["chapters"][0]["content"] == "A calm story."
+        mock_send.assert_not_called()
+
+    @patch('app.agents.workflow.writer.settings')
+    @patch('app.agents.workflow.writer.get_text_generator')
+    async def test_failed_stream_keeps_streamed_text(self, mock_get_generator, mock_settings):
+        """Test a stream failing midway keeps the text the client already received"""
+        mock_settings.WRITER_STREAMING = True
+
+        class FailingGenerator:
+            async def generate_stream(self, prompt, temperature=0.7, max_tokens=None):
+                yield "Once upon "
+                yield "a time"
+                raise RuntimeError("connection reset")
+
+        mock_get_generator.return_value = FailingGenerator()
+
+        token = current_chapter_stream.set(DeltaEmitter)
+        try:
+            with patch('app.api.websocket.manager.send_to_session', new_callable=AsyncMock) as mock_send:
+                result = await writer_agent(create_base_state(), chapter_id=1)
+        finally:
+            current_chapter_stream.reset(token)
+
+        streamed = "".join(call[0][0]["data"]["delta"] for call in mock_send.call_args_list)
+        assert streamed == "Once upon a time"
+        assert result["chapters"][0]["content"] == streamed
+        assert result["completed_writers"] == [1]
+
+    @patch('app.agents.workflow.writer.settings')
+    @patch('app.agents.workflow.writer.get_text_generator')
+    async def test_non_streaming_mode_uses_json(self, mock_get_generator, mock_settings):
+        """Test that non-streaming mode keeps the JSON contract"""
+        mock_settings.WRITER_STREAMING = False
+        generator = MagicMock()
+        generator.generate = AsyncMock(return_value='{"content": "A calm story."}')
+        mock_get_generator.return_value = generator
+
+        result = await writer_agent(create_base_state(), chapter_id=1)
+
+        assert result["chapters"][0]["content"] == "A calm story."
+        assert "Return JSON" in generator.generate.call_args[1]["prompt"]
+
+
+def _chunks(text, size=7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.asyncio
+class TestBatchedWriter:
+    """Test one writer call produces every chapter of its group"""
+
+    @patch('app.agents.workflow.writer.get_text_generator')
+    async def test_one_call_writes_the_group(self, mock_get_generator):
+        """Test four chapters share a single LLM call and each gets its own text"""
+        response = json.dumps({"chapters": [{"chapter_id": i, "content": f"Story {i}."} for i in range(1, 5)]})
+        generator = _StreamingGenerator(_chunks(response))
+        mock_get_generator.return_value = generator
+        state = create_base_state()
+
+        results = await asyncio.gather(*(batched_writer_agent(state, i, [1, 2, 3, 4]) for i in range(1, 5)))
+
+        assert len(generator.prompts) == 1
+        assert generator.prompts[0].count("Title: Chapter") == 4
+        assert generator.prompts[0].count("STORY CONTEXT") == 1
+        for i, result in enumerate(results, start=1):
+            assert result["completed_writers"] == [i]
+            assert result["chapters"][0]["content"] == f"Story {i}."
+            assert result["chapters"][0]["title"] == f"Chapter {i}"
+
+    @patch('app.agents.workflow.writer.get_text_generator')
+    async def test_chapter_returns_before_call_ends(self, mock_get_generator):
+        """Test a chapter is handed back as soon as its section is complete"""
+        release = asyncio.Event()
+
+        class _Generator:
+            async def generate_stream(self, prompt, temperature=0.7, max_tokens=None):
+                yield '{"chapters": [{"chapter_id": 1, "content": "First."},'
+                await release.wait()
+                yield '{"chapter_id": 2, "content": "Second."}]}'
+
+        mock_get_generator.return_value = _Generator()
+        state = create_base_state()
+        second = asyncio.create_task(batched_writer_agent(state, 2, [1, 2]))
+        first = await asyncio.wait_for(batched_writer_agent(state, 1, [1, 2]), 1)
+
+        assert first["chapters"][0]["content"] == "First."
+        assert not second.done()
+        release.set()
+        assert (await second)["chapters"][0]["content"] == "Second."
+
+    @patch('app.agents.workflow.writer.get_text_generator')
+    async def test_batch_forgotten_after_a_writer_is_cancelled(self, mock_get_generator):
+        """Test the shared call is dropped from the registry when it ends, even if one writer left early"""
+        release = asyncio.Event()
+
+        class _Generator:
+            async def generate_stream(self, prompt, temperature=0.7, max_tokens=None):
+                await release.wait()
+                yield '{"chapters": [{"chapter_id": 1, "content": "First."}, {"chapter_id": 2, "content": "Second."}]}'
+
+        mock_get_generator.return_value = _Generator()
+        state = create_base_state()
+        first = asyncio.create_task(batched_writer_agent(state, 1, [1, 2]))
+        second = asyncio.create_task(batched_writer_agent(state, 2, [1, 2]))
+        await asyncio.sleep(0.01)
+        (key,) = [key for key in writer_module._batches if key[0] == state["session_id"]]
+        assert state["story_outline"]["plot_summary"] not in repr(key)
+
+        second.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert (await first)["chapters"][0]["content"] == "First."
+        await asyncio.sleep(0)
+        assert key not in writer_module._batches
+
+    @patch('app.agents.workflow.writer.get_text_generator')
+    async def test_missing_chapter_falls_back_to_defaults(self, mock_get_generator):
+        """Test a chapter the response skipped still completes with default content"""
+        response = json.dumps({"chapters": [{"chapter_id": 1, "content": "Only one."}]})
+        mock_get_generator.return_value = _StreamingGenerator(_chunks(response))
+        state = create_base_state()
+
+        first, second = await asyncio.gather(
+            batched_writer_agent(state, 1, [1, 2]), batched_writer_agent(state, 2, [1, 2])
+        )
+
+        assert first["chapters"][0]["content"] == "Only one."
+        assert second["completed_writers"] == [2]
+        assert second["chapters"][0]["content"]
+
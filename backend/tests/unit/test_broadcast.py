@@ -0,0 +1,119 @@
+"""
+Tests for WebSocket broadcast backends
+"""
+import asyncio
+import fakeredis
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.websockets import WebSocket
+
+from app.api.broadcast import LocalBroadcast, RedisBroadcast, create_broadcast
+from app.api.websocket import ConnectionManager
+
+
+def _websocket():
+    ws = AsyncMock(spec=WebSocket)
+    ws.accept = AsyncMock()
+    ws.send_json = AsyncMock()
+    return ws
+
+
+@pytest.fixture
+def fake_redis():
+    """Shared in-memory Redis server for all 'workers' in a test"""
+    server = fakeredis.FakeServer()
+    redis = MagicMock()
+    redis.client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    with patch("app.api.broadcast.get_redis", return_value=redis):
+        yield redis.client
+
+
+async def _eventually(condition, timeout: float = 1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+class TestRedisBroadcast:
+    """Test events fan out across workers through Redis pub/sub"""
+
+    async def test_event_reaches_socket_on_other_worker(self, fake_redis):
+        """Test a pipeline on one worker reaches a socket held by another"""
+        worker_a = ConnectionManager(RedisBroadcast())
+        worker_b = ConnectionManager(RedisBroadcast())
+        for worker in (worker_a, worker_b):
+            worker.broadcast.bind(worker._deliver_local, worker._on_control)
+        ws = _websocket()
+        await worker_b.connect(ws, "conn-1", "session-1")
+
+        await worker_a.send_to_session({"type": "test"}, "session-1")
+
+        await _eventually(lambda: ws.send_json.called)
+        ws.send_json.assert_called_once_with({"type": "test"})
+        await worker_a.close()
+        await worker_b.close()
+
+    async def test_presence_is_cluster_wide(self, fake_redis):
+        """Test a session counts as connected while any worker holds its socket"""
+        worker_a = ConnectionManager(RedisBroadcast())
+        worker_b = ConnectionManager(RedisBroadcast())
+        for worker in (worker_a, worker_b):
+            worker.broadcast.bind(worker._deliver_local, worker._on_control)
+        await worker_b.connect(_websocket(), "conn-1", "session-1")
+
+        assert await worker_a.is_connected("session-1")
+
+        worker_b.disconnect("conn-1", "session-1")
+        await asyncio.sleep(0.01)
+        assert not await worker_a.is_connected("session-1")
+        await worker_a.close()
+        await worker_b.close()
+
+    async def test_control_skips_own_worker(self, fake_redis):
+        """Test control messages reach other workers but not the sender"""
+        worker_a = ConnectionManager(RedisBroadcast())
+        worker_b = ConnectionManager(RedisBroadcast())
+        handled = {"a": [], "b": []}
+        for name, worker in (("a", worker_a), ("b", worker_b)):
+            worker.broadcast.bind(worker._deliver_local, worker._on_control)
+            worker.control_handler = AsyncMock(side_effect=handled[name].append)
+        await worker_b.connect(_websocket(), "conn-1", "session-1")
+        await worker_a.connect(_websocket(), "conn-2", "session-2")
+
+        await worker_a.broadcast.publish_control({"action": "cancel", "session_id": "session-1"})
+
+        await _eventually(lambda: handled["b"])
+        assert handled["b"][0]["session_id"] == "session-1"
+        assert handled["a"] == []
+        await worker_a.close()
+        await worker_b.close()
+
+    async def test_publish_falls_back_to_local(self, fake_redis):
+        """Test local sockets still get events when Redis is down"""
+        worker = ConnectionManager(RedisBroadcast())
+        worker.broadcast.bind(worker._deliver_local, worker._on_control)
+        ws = _websocket()
+        await worker.connect(ws, "conn-1", "session-1")
+
+        with patch.object(fake_redis, "publish", AsyncMock(side_effect=ConnectionError("down"))):
+            await worker.send_to_session({"type": "test"}, "session-1")
+        await worker.flush("session-1")
+
+        ws.send_json.assert_called_once_with({"type": "test"})
+        await worker.close()
+
+
+class TestCreateBroadcast:
+    """Test backend selection"""
+
+    @patch("app.api.broadcast.settings")
+    def test_backends(self, mock_settings):
+        mock_settings.WS_BROADCAST_BACKEND = "local"
+        assert type(create_broadcast()) is LocalBroadcast
+        mock_settings.WS_BROADCAST_BACKEND = "redis"
+        assert isinstance(create_broadcast(), RedisBroadcast)
+        mock_settings.WS_BROADCAST_BACKEND = "kafka"
+        with pytest.raises(ValueError, match="Unsupported broadcast backend"):
+            create_broadcast()
@@ -0,0 +1,60 @@
+"""
+Tests for Redis LRU cache
+"""
+import pytest
+import fakeredis
+from unittest.mock import patch, MagicMock
+
+from app.services.cache import RedisLRUCache
+
+
+@pytest.fixture
+def fake_redis():
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    redis = MagicMock()
+    redis.client = client
+    with patch("app.services.cache.redis_lru.get_redis", return_value=redis):
+        yield client
+
+
+@pytest.mark.asyncio
+class TestRedisLRUCache:
+    """Test TTL, LRU eviction and labels"""
+
+    async def test_get_set(self, fake_redis):
+        cache = RedisLRUCache("test", max_entries=10, ttl_seconds=60)
+
+        assert await cache.get("k") is None
+        await cache.set("k", "value")
+
+        assert await cache.get("k") == "value"
+        assert 0 < await fake_redis.ttl("cache:test:entry:k") <= 60
+
+    async def test_evicts_least_recently_used(self, fake_redis):
+        cache = RedisLRUCache("test", max_entries=2, ttl_seconds=60)
+        await cache.set("a", "1", label="a")
+        await cache.set("b", "2", label="b")
+        await cache.get("a")  # a is now more recent than b
+        await cache.set("c", "3", label="c")
+
+        assert await cache.get("b") is None
+        assert await cache.get("a") == "1"
+        assert await cache.get("c") == "3"
+        assert set(await cache.labels()) == {"a", "c"}
+
+    async def test_expired_entry_leaves_index(self, fake_redis):
+        cache = RedisLRUCache("test", max_entries=10, ttl_seconds=60)
+        await cache.set("k", "value", label="k")
+        await fake_redis.delete("cache:test:entry:k")
+
+        assert await cache.get("k") is None
+        assert await fake_redis.zcard("cache:test:lru") == 0
+        assert await cache.labels() == {}
+
+    async def test_redis_errors_are_misses(self):
+        cache = RedisLRUCache("test", max_entries=10, ttl_seconds=60)
+        redis = MagicMock()
+        type(redis).client = property(lambda self: (_ for _ in ()).throw(RuntimeError("down")))
+        with patch("app.services.cache.redis_lru.get_redis", return_value=redis):
+            await cache.set("k", "value")
+            assert await cache.get("k") is None
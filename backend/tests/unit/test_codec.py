@@ -0,0 +1,57 @@
+"""
+Tests for Redis value codecs
+"""
+import json
+import pytest
+
+from app.utils.codec import Codec
+
+
+STATE = {
+    "theme": "용감한 토끼",
+    "chapters": [{"chapter_id": i, "content": "Once upon a time " * 100} for i in range(1, 5)],
+    "needs_info": False,
+    "memory_summary": None,
+}
+
+
+class TestCodec:
+    """Test values round-trip through every format and compression"""
+
+    @pytest.mark.parametrize("format", ["json", "orjson"])
+    @pytest.mark.parametrize("compression", ["none", "zstd", "zlib"])
+    def test_round_trip(self, format, compression):
+        """Test encode / decode returns the original value"""
+        codec = Codec(format, compression)
+        assert codec.decode(codec.encode(STATE)) == STATE
+
+    def test_msgpack_round_trip(self):
+        """Test msgpack format when msgpack is installed"""
+        pytest.importorskip("msgpack")
+        codec = Codec("msgpack", "zstd")
+        assert codec.decode(codec.encode(STATE)) == STATE
+
+    def test_large_values_are_compressed(self):
+        """Test payloads above the threshold shrink, small ones are left as is"""
+        codec = Codec("orjson", "zstd", compress_min_bytes=1024)
+        plain = json.dumps(STATE, ensure_ascii=False).encode("utf-8")
+
+        assert len(codec.encode(STATE)) < len(plain) // 4
+        assert codec.encode("short")[2:3] == b"n"
+
+    def test_reads_legacy_json(self):
+        """Test values written before the header are read as JSON"""
+        legacy = json.dumps(STATE, ensure_ascii=False).encode("utf-8")
+        assert Codec("orjson", "zstd").decode(legacy) == STATE
+
+    def test_reads_other_codecs_output(self):
+        """Test a reader decodes values written with different settings"""
+        written = Codec("json", "zlib").encode(STATE)
+        assert Codec("orjson", "zstd").decode(written) == STATE
+
+    def test_unknown_settings(self):
+        """Test unsupported format and compression are rejected"""
+        with pytest.raises(ValueError, match="Unsupported codec format"):
+            Codec("pickle")
+        with pytest.raises(ValueError, match="Unsupported codec compression"):
+            Codec("json", "lz4")
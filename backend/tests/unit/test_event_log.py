@@ -0,0 +1,124 @@
+"""
+Tests for the session event log and reconnect replay
+"""
+import asyncio
+import fakeredis
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.websockets import WebSocket
+
+from app.api.event_log import EventLog
+from app.api.websocket import ConnectionManager, ConnectionWriter
+
+
+def _event(event_id: str, type: str = "agent_completed") -> dict:
+    return {"type": type, "event_id": event_id, "data": {}}
+
+
+@pytest.fixture
+def fake_redis():
+    redis = MagicMock()
+    redis.client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    with patch("app.api.event_log.get_redis", return_value=redis):
+        yield redis.client
+
+
+@pytest.mark.asyncio
+class TestEventLog:
+    """Test events are logged per session and read back after an id"""
+
+    async def test_read_after_last_seen_event(self, fake_redis):
+        """Test only events after the given id are returned"""
+        log = EventLog()
+        for event_id in ("e1", "e2", "e3"):
+            await log.append("s1", _event(event_id))
+
+        replayed = await log.read_after("s1", "e1")
+
+        assert [m["event_id"] for m in replayed] == ["e2", "e3"]
+        assert await fake_redis.ttl("events:s1") > 0
+
+    async def test_unknown_id_replays_whole_run(self, fake_redis):
+        """Test an id the log no longer has replays everything"""
+        log = EventLog()
+        await log.append("s1", _event("e1"))
+
+        assert [m["event_id"] for m in await log.read_after("s1", "gone")] == ["e1"]
+
+    async def test_deltas_are_not_logged(self, fake_redis):
+        """Test chapter deltas and connection events stay out of the log"""
+        log = EventLog()
+        await log.append("s1", _event("d1", "chapter_delta"))
+        await log.append("s1", _event("r1", "session_ready"))
+        await log.append("s1", _event("e1"))
+
+        assert [m["event_id"] for m in await log.read_after("s1", None)] == ["e1"]
+
+    async def test_reset_drops_previous_run(self, fake_redis):
+        """Test a new run starts with an empty log"""
+        log = EventLog()
+        await log.append("s1", _event("e1"))
+        await log.reset("s1")
+
+        assert await log.read_after("s1", None) == []
+
+
+@pytest.mark.asyncio
+class TestReconnectReplay:
+    """Test a reconnecting socket receives what it missed exactly once"""
+
+    async def test_replay_sends_missed_events(self, fake_redis):
+        """Test events sent while the socket was away are replayed in order"""
+        conn_manager = ConnectionManager()
+        for event_id in ("e1", "e2", "e3"):
+            await conn_manager.send_to_session(_event(event_id), "s1")
+
+        ws = AsyncMock(spec=WebSocket)
+        await conn_manager.connect(ws, "conn-1", "s1", replay_pending=True)
+        await conn_manager.replay("conn-1", "s1", "e1")
+        await conn_manager.flush("s1")
+
+        assert [c.args[0]["event_id"] for c in ws.send_json.call_args_list] == ["e2", "e3"]
+
+    async def test_replay_skips_events_already_received_live(self):
+        """Test events racing the replay are delivered once"""
+        release = asyncio.Event()
+        ws = AsyncMock(spec=WebSocket)
+        ws.send_json = AsyncMock(side_effect=lambda message: release.wait())
+        writer = ConnectionWriter(ws, "conn-1", on_slow=lambda: None, replay_pending=True)
+
+        writer.put(_event("e3"))
+        writer.replay([_event("e2"), _event("e3")])
+        writer.put(_event("e2"))
+        writer.put(_event("e4"))
+        release.set()
+        await writer.flush()
+
+        assert [c.args[0]["event_id"] for c in ws.send_json.call_args_list] == ["e2", "e3", "e4"]
+        writer.close()
+
+    async def test_no_ids_retained_without_replay(self):
+        """Test a socket that connected without last_event_id keeps no event ids"""
+        ws = AsyncMock(spec=WebSocket)
+        writer = ConnectionWriter(ws, "conn-1", on_slow=lambda: None, max_queue=10000)
+
+        for i in range(5000):
+            writer.put({"type": "chapter_delta", "event_id": f"d{i}", "data": {"chapter_id": 1, "index": i, "delta": "x"}})
+        writer.put(_event("e1"))
+        await writer.flush()
+
+        assert writer._seen is None
+        writer.close()
+
+    async def test_deltas_not_retained_while_replay_pending(self):
+        """Test only events the log can replay are remembered before the replay"""
+        ws = AsyncMock(spec=WebSocket)
+        writer = ConnectionWriter(ws, "conn-1", on_slow=lambda: None, replay_pending=True)
+
+        writer.put({"type": "chapter_delta", "event_id": "d1", "data": {"chapter_id": 1, "index": 0, "delta": "x"}})
+        writer.put(_event("e1"))
+
+        assert writer._seen == {"e1"}
+        writer.replay([])
+        assert writer._seen is None
+        writer.close()
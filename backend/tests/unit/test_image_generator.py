@@ -1,12 +1,15 @@
 """
 Unit tests for image generation service
 """
+import asyncio
 import pytest
+import fakeredis
 from unittest.mock import AsyncMock, patch, MagicMock
 
 from app.services.ai_services.image_generator import (
     ImageGenerator,
     get_image_generator,
+    _shared_image_generator,
 )
 from app.core.config import settings
 
@@ -96,3 +99,223 @@ class TestGetImageGenerator:
         generator = get_image_generator()
         
         assert isinstance(generator, ImageGenerator)
+
+
+class TestSharedRunwareConnection:
+    """Test shared, lazily-connected Runware client"""
+
+    @patch('app.services.ai_services.image_generator.settings')
+    def test_get_image_generator_singleton(self, mock_settings):
+        """Test that all callers share one generator"""
+        mock_settings.RUNWARE_API_KEY = "test_runware_key"
+        _shared_image_generator.cache_clear()
+
+        try:
+            assert get_image_generator() is get_image_generator()
+        finally:
+            _shared_image_generator.cache_clear()
+
+    @patch('app.services.ai_services.image_generator.settings')
+    def test_get_image_generator_missing_runware_key(self, mock_settings):
+        """Test that missing Runware key raises error"""
+        mock_settings.RUNWARE_API_KEY = None
+
+        with pytest.raises(ValueError, match="Runware API key required"):
+            get_image_generator()
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.image_generator.Runware')
+    async def test_connects_once_across_requests(self, mock_runware_cls):
+        """Test that the handshake is amortized across requests"""
+        runware = mock_runware_cls.return_value
+        runware.connect = AsyncMock()
+        runware.connected = MagicMock(return_value=True)
+        runware.imageInference = AsyncMock(return_value=[MagicMock(imageURL="https://img/1.png")])
+
+        generator = ImageGenerator(max_concurrency=2)
+        urls = await asyncio.gather(*(generator.generate(f"scene {i}") for i in range(4)))
+
+        assert urls == ["https://img/1.png"] * 4
+        runware.connect.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.image_generator.Runware')
+    async def test_reconnects_when_connection_dropped(self, mock_runware_cls):
+        """Test that a dropped websocket is re-established"""
+        runware = mock_runware_cls.return_value
+        runware.connect = AsyncMock()
+        runware.disconnect = AsyncMock()
+        runware.connected = MagicMock(side_effect=[False, False, True, True])
+        runware.imageInference = AsyncMock(return_value=[MagicMock(imageURL="https://img/1.png")])
+
+        generator = ImageGenerator()
+        await generator.generate("first")
+        await generator.generate("second")
+
+        assert runware.connect.call_count == 2
+        runware.disconnect.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.image_generator.Runware')
+    async def test_concurrency_limit(self, mock_runware_cls):
+        """Test that in-flight requests are capped"""
+        in_flight = 0
+        peak = 0
+
+        async def inference(requestImage):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return [MagicMock(imageURL="https://img/1.png")]
+
+        runware = mock_runware_cls.return_value
+        runware.connect = AsyncMock()
+        runware.connected = MagicMock(return_value=True)
+        runware.imageInference = inference
+
+        generator = ImageGenerator(max_concurrency=2)
+        await asyncio.gather(*(generator.generate(f"scene {i}") for i in range(6)))
+
+        assert peak == 2
+
+
+@pytest.fixture
+def fake_redis():
+    redis = MagicMock()
+    redis.client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    with patch("app.services.cache.redis_lru.get_redis", return_value=redis):
+        yield redis.client
+
+
+class TestImageCache:
+    """Test content-addressed image cache"""
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.image_generator.Runware')
+    async def test_identical_prompt_served_from_cache(self, mock_runware_cls, fake_redis):
+        runware = mock_runware_cls.return_value
+        runware.connect = AsyncMock()
+        runware.connected = MagicMock(return_value=True)
+        runware.imageInference = AsyncMock(return_value=[MagicMock(imageURL="https://img/1.png")])
+
+        generator = ImageGenerator()
+        first = await generator.generate("a cat in a garden")
+        second = await generator.generate("a cat in a garden")
+        await generator.generate("a dog in a park")
+
+        assert first == second == "https://img/1.png"
+        assert runware.imageInference.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.image_generator.Runware')
+    async def test_concurrent_identical_requests_share_call(self, mock_runware_cls, fake_redis):
+        async def inference(requestImage):
+            await asyncio.sleep(0.01)
+            return [MagicMock(imageURL="https://img/1.png")]
+
+        runware = mock_runware_cls.return_value
+        runware.connect = AsyncMock()
+        runware.connected = MagicMock(return_value=True)
+        runware.imageInference = AsyncMock(side_effect=inference)
+
+        generator = ImageGenerator()
+        urls = await asyncio.gather(*(generator.generate("same scene") for _ in range(3)))
+
+        assert urls == ["https://img/1.png"] * 3
+        assert runware.imageInference.call_count == 1
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.image_generator.Runware')
+    async def test_shared_call_survives_one_cancelled_caller(self, mock_runware_cls, fake_redis):
+        """Test a cancelled caller doesn't fail others sharing the call; the last one stops it"""
+        release = asyncio.Event()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def inference(requestImage):
+            started.set()
+            try:
+                await release.wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return [MagicMock(imageURL="https://img/1.png")]
+
+        runware = mock_runware_cls.return_value
+        runware.connect = AsyncMock()
+        runware.connected = MagicMock(return_value=True)
+        runware.imageInference = AsyncMock(side_effect=inference)
+
+        generator = ImageGenerator()
+        first = asyncio.create_task(generator.generate("shared scene for cancellation"))
+        second = asyncio.create_task(generator.generate("shared scene for cancellation"))
+        await started.wait()
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await second == "https://img/1.png"
+        assert first.cancelled()
+        assert not cancelled.is_set()
+
+        release.clear()
+        started.clear()
+        lone = asyncio.create_task(generator.generate("lone scene for cancellation"))
+        await started.wait()
+        lone.cancel()
+        await asyncio.sleep(0.01)
+        assert cancelled.is_set()
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.image_generator.Runware')
+    async def test_new_caller_after_last_waiter_left_gets_fresh_call(self, mock_runware_cls, fake_redis):
+        """Test a caller arriving while a dropped call unwinds starts its own call"""
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def inference(requestImage):
+            started.set()
+            await release.wait()
+            return [MagicMock(imageURL="https://img/1.png")]
+
+        runware = mock_runware_cls.return_value
+        runware.connect = AsyncMock()
+        runware.connected = MagicMock(return_value=True)
+        runware.imageInference = AsyncMock(side_effect=inference)
+
+        generator = ImageGenerator()
+        key = generator.cache_key("dropped scene")
+        dropped = asyncio.create_task(generator.generate("dropped scene"))
+        await started.wait()
+        old = generator._inflight[key]
+        dropped.cancel()
+        await asyncio.sleep(0)
+
+        # The dropped call is forgotten before it has finished unwinding
+        assert not old.task.done()
+        assert key not in generator._inflight
+
+        started.clear()
+        again = asyncio.create_task(generator.generate("dropped scene"))
+        await started.wait()
+        current = generator._inflight[key]
+        assert current is not old
+        release.set()
+
+        assert await again == "https://img/1.png"
+        assert old.task.cancelled()
+        assert runware.imageInference.call_count == 2
+
+    @patch('app.services.ai_services.image_generator.Runware')
+    def test_cache_key_covers_model_and_size(self, mock_runware_cls):
+        generator = ImageGenerator()
+        key = generator.cache_key("a cat")
+
+        generator.width = 512
+        assert generator.cache_key("a cat") != key
+        generator.width = 1024
+        generator.model = "other:1@1"
+        assert generator.cache_key("a cat") != key
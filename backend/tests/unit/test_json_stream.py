@@ -0,0 +1,76 @@
+"""
+Tests for the incremental JSON stream parser
+"""
+import json
+import pytest
+
+from app.utils import JsonStreamParser
+
+
+PLAN = {
+    "needs_info": False,
+    "language": "en",
+    "story_outline": {
+        "style": "adventure",
+        "characters": ["Max {the cat}"],
+        "plot_summary": "Max says \"hello\", then [waves]",
+        "chapters": [
+            {"chapter_id": i, "title": f"Chapter {i}", "summary": "A {curly}, \\ tricky, \"quoted\" summary"}
+            for i in range(1, 5)
+        ],
+    },
+}
+
+
+def _feed(text: str, size: int):
+    parser = JsonStreamParser(("story_outline", "chapters"))
+    emitted = []
+    for i in range(0, len(text), size):
+        emitted.append([chapter["chapter_id"] for chapter in parser.feed(text[i:i + size])])
+    return parser, emitted
+
+
+class TestJsonStreamParser:
+    """Test array items are emitted as soon as they close"""
+
+    @pytest.mark.parametrize("size", [1, 2, 7, 64, 10000])
+    def test_emits_each_chapter_once(self, size):
+        """Test every chapter is emitted once whatever the chunking"""
+        parser, emitted = _feed(json.dumps(PLAN, indent=2), size)
+
+        assert [chapter_id for chunk in emitted for chapter_id in chunk] == [1, 2, 3, 4]
+        assert parser.done
+        assert parser.snapshot() == PLAN
+
+    def test_chapter_emitted_before_stream_ends(self):
+        """Test the first chapter is available while later ones are still streaming"""
+        text = json.dumps(PLAN)
+        parser, emitted = _feed(text, 16)
+
+        first = next(i for i, chunk in enumerate(emitted) if chunk)
+        assert emitted[first] == [1]
+        assert first < len(emitted) - 10
+
+    def test_ignores_fences_and_prose(self):
+        """Test text around the object doesn't confuse the parser"""
+        text = f"Sure! {{not json}}\n```json\n{json.dumps(PLAN)}\n```\nEnjoy {{the}} story"
+        parser, emitted = _feed(text[text.index("```"):], 5)
+
+        assert [chapter_id for chunk in emitted for chapter_id in chunk] == [1, 2, 3, 4]
+
+    def test_other_arrays_are_not_emitted(self):
+        """Test objects in arrays at other paths are not reported"""
+        text = json.dumps({"story_outline": {"characters": [{"name": "Max"}], "chapters": [{"chapter_id": 1}]}})
+        parser, emitted = _feed(text, 3)
+
+        assert [chapter_id for chunk in emitted for chapter_id in chunk] == [1]
+
+    def test_snapshot_of_partial_stream(self):
+        """Test the plan so far can be read mid-stream"""
+        text = json.dumps(PLAN)
+        parser = JsonStreamParser(("story_outline", "chapters"))
+        parser.feed(text[: text.index('"chapter_id": 3')])
+
+        snapshot = parser.snapshot()
+        assert snapshot["story_outline"]["style"] == "adventure"
+        assert [ch.get("chapter_id") for ch in snapshot["story_outline"]["chapters"]][:2] == [1, 2]
@@ -0,0 +1,90 @@
+"""
+Tests for JSON extraction from LLM output
+"""
+import json
+import time
+import pytest
+
+from app.utils import extract_json
+
+
+OUTLINE = {
+    "style": "adventure",
+    "chapters": [{"chapter_id": 1, "title": "The {curious} dragon", "summary": "He said \"hi\""}],
+}
+
+
+class TestExtractJson:
+    """Test the brace-balanced JSON scanner"""
+
+    def test_plain_object(self):
+        """Test a bare JSON response"""
+        assert extract_json(json.dumps(OUTLINE)) == OUTLINE
+
+    def test_code_fence(self):
+        """Test JSON inside a markdown code block"""
+        assert extract_json(f"```json\n{json.dumps(OUTLINE, indent=2)}\n```") == OUTLINE
+
+    def test_trailing_prose_with_braces(self):
+        """Test text after the object doesn't leak into it"""
+        text = f"Here you go:\n{json.dumps(OUTLINE)}\nReplace {{name}} with the hero's name."
+        assert extract_json(text) == OUTLINE
+
+    def test_braces_in_prose_before_object(self):
+        """Test a brace pair in prose ahead of the object is skipped"""
+        assert extract_json('Use {this} format: {"intent": "chat"}') == {"intent": "chat"}
+
+    def test_no_object(self):
+        """Test text without an object yields an empty dict"""
+        assert extract_json("I can't help with that.") == {}
+
+    def test_invalid_object_raises(self):
+        """Test a balanced but malformed object is reported"""
+        with pytest.raises(json.JSONDecodeError):
+            extract_json('{"intent": chat}')
+
+    def test_truncated_string_is_closed(self):
+        """Test output cut off inside a value string is repaired"""
+        text = '{"chapter_id": 1, "content": "Once upon a time there was a'
+        assert extract_json(text) == {"chapter_id": 1, "content": "Once upon a time there was a"}
+
+    def test_truncated_nested_outline(self):
+        """Test open arrays and objects are closed and a partial element dropped"""
+        text = '{"style": "adventure", "chapters": [{"chapter_id": 1, "title": "A"}, {"chapter_id": 2, "tit'
+        assert extract_json(text) == {"style": "adventure", "chapters": [{"chapter_id": 1, "title": "A"}, {"chapter_id": 2}]}
+
+    def test_truncated_after_key(self):
+        """Test a dangling key or colon is dropped"""
+        assert extract_json('{"intent": "chat", "memory_summary":') == {"intent": "chat"}
+        assert extract_json('{"intent": "chat", "memory_summary"') == {"intent": "chat"}
+
+    def test_truncated_after_escape(self):
+        """Test a cut-off escape sequence doesn't break the repair"""
+        assert extract_json('{"content": "She said \\') == {"content": "She said "}
+
+    def test_repair_disabled(self):
+        """Test truncated output raises when repair is off"""
+        with pytest.raises(json.JSONDecodeError):
+            extract_json('{"content": "Once upon', repair=False)
+
+    def test_pathological_input_is_linear(self):
+        """Test unbalanced braces don't cause quadratic scanning"""
+        text = "{" * 20000 + '"a"' + "}" * 100
+        started = time.perf_counter()
+        with pytest.raises(json.JSONDecodeError):
+            extract_json(text)
+        assert time.perf_counter() - started < 1.0
+
+    def test_many_prose_braces_is_linear(self):
+        """Test each failed prose candidate costs its own length, not the text's"""
+        def best_time(repeats):
+            text = "Fill in {name} and {place}. " * repeats + json.dumps(OUTLINE)
+            timings = []
+            for _ in range(3):
+                started = time.perf_counter()
+                assert extract_json(text) == OUTLINE
+                timings.append(time.perf_counter() - started)
+            return min(timings)
+
+        # Quadratic cost would grow 64x
+        assert best_time(8000) < 24 * best_time(1000)
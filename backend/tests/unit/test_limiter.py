@@ -0,0 +1,169 @@
+"""
+Tests for provider admission control
+"""
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch
+
+from app.core.metrics import MetricsRegistry
+from app.services.ai_services.limiter import (
+    FairSemaphore,
+    ProviderLimiter,
+    TokenBucket,
+    current_session,
+    estimate_tokens,
+)
+
+
+class TestTokenBucket:
+    """Test token bucket pacing"""
+
+    @patch("app.services.ai_services.limiter.time.monotonic", return_value=100.0)
+    def test_burst_then_wait(self, mock_time):
+        """Test that a full bucket admits a burst, then paces callers"""
+        bucket = TokenBucket(rate_per_minute=60)
+
+        assert all(bucket.reserve(1) == 0 for _ in range(60))
+        assert bucket.reserve(1) == pytest.approx(1.0)
+        assert bucket.reserve(1) == pytest.approx(2.0)
+
+    def test_refill(self):
+        """Test that tokens refill over time"""
+        with patch("app.services.ai_services.limiter.time.monotonic", return_value=100.0):
+            bucket = TokenBucket(rate_per_minute=600)
+            bucket.reserve(600)
+        with patch("app.services.ai_services.limiter.time.monotonic", return_value=101.0):
+            assert bucket.reserve(10) == 0
+
+    def test_estimate_tokens(self):
+        assert estimate_tokens("x" * 400, max_tokens=100) == 200
+
+
+@pytest.mark.asyncio
+class TestFairSemaphore:
+    """Test round-robin admission across sessions"""
+
+    async def test_round_robin_across_sessions(self):
+        """Test that a session with many queued calls doesn't starve others"""
+        semaphore = FairSemaphore(1)
+        await semaphore.acquire("holder")
+        order = []
+
+        async def call(session_id: str, i: int):
+            await semaphore.acquire(session_id)
+            order.append(f"{session_id}{i}")
+            semaphore.release()
+
+        tasks = [asyncio.create_task(call("a", i)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call("b", 0)))
+        await asyncio.sleep(0)
+
+        semaphore.release()
+        await asyncio.gather(*tasks)
+
+        assert order == ["a0", "b0", "a1", "a2"]
+        assert semaphore.in_use == 0
+
+    async def test_cancelled_waiter_releases_queue(self):
+        """Test that cancelled waiters don't leak slots"""
+        semaphore = FairSemaphore(1)
+        await semaphore.acquire("a")
+        waiter = asyncio.create_task(semaphore.acquire("b"))
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        semaphore.release()
+
+        assert semaphore.waiting == 0
+        assert semaphore.in_use == 0
+
+
+@pytest.mark.asyncio
+class TestProviderLimiter:
+    """Test provider limiter slots and metrics"""
+
+    async def test_caps_in_flight_calls(self):
+        limiter = ProviderLimiter("test-cap", max_concurrency=2)
+        in_flight = 0
+        peak = 0
+
+        async def call():
+            nonlocal in_flight, peak
+            async with limiter.slot():
+                in_flight += 1
+                peak = max(peak, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+
+        await asyncio.gather(*(call() for _ in range(6)))
+
+        assert peak == 2
+
+    async def test_uses_current_session(self):
+        """Test that the session contextvar is used as fairness key"""
+        limiter = ProviderLimiter("test-session", max_concurrency=1)
+        token = current_session.set("session-1")
+        try:
+            with patch.object(limiter.semaphore, "acquire", wraps=limiter.semaphore.acquire) as acquire:
+                async with limiter.slot():
+                    pass
+            acquire.assert_called_once_with("session-1")
+        finally:
+            current_session.reset(token)
+
+    async def test_records_wait_metrics(self):
+        registry = MetricsRegistry()
+        wait_seconds = registry.histogram("wait", "wait")
+        with patch("app.services.ai_services.limiter._wait_seconds", wait_seconds):
+            limiter = ProviderLimiter("test-metrics", max_concurrency=1, rpm=60)
+            async with limiter.slot():
+                pass
+
+        assert wait_seconds.count(provider="test-metrics") == 1
+        assert "wait_count{provider=\"test-metrics\"} 1" in registry.render()
+
+    async def test_thread_call_holds_slot_after_cancel(self):
+        """Test a cancelled caller's slot is freed when its thread returns, not when it is cancelled"""
+        limiter = ProviderLimiter("test-thread", max_concurrency=1)
+        finish = threading.Event()
+
+        caller = asyncio.create_task(limiter.run_in_thread(lambda: finish.wait(1) and "done"))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+
+        assert limiter.semaphore.in_use == 1
+        next_call = asyncio.create_task(limiter.run_in_thread(lambda: "next"))
+        await asyncio.sleep(0.01)
+        assert not next_call.done()
+
+        finish.set()
+        assert await asyncio.wait_for(next_call, timeout=1) == "next"
+        await asyncio.sleep(0)
+        assert limiter.semaphore.in_use == 0
+
+
+class TestMetricsRegistry:
+    """Test metrics exposition"""
+
+    def test_render_prometheus_text(self):
+        registry = MetricsRegistry()
+        registry.counter("calls_total", "Calls").inc(provider="nova")
+        registry.gauge("depth", "Depth").set(3, provider="nova")
+
+        text = registry.render()
+
+        assert "# TYPE calls_total counter" in text
+        assert 'calls_total{provider="nova"} 1.0' in text
+        assert 'depth{provider="nova"} 3' in text
+
+    def test_same_name_returns_same_metric(self):
+        registry = MetricsRegistry()
+        assert registry.counter("x", "x") is registry.counter("x", "x")
+        with pytest.raises(ValueError):
+            registry.gauge("x", "x")
@@ -0,0 +1,150 @@
+"""
+Tests for the hash-based session store
+"""
+import json
+import fakeredis
+import pytest
+from unittest.mock import MagicMock, patch
+
+from app.api.session_store import SHARED_FIELD, SessionStore
+from app.utils.codec import Codec
+
+
+@pytest.fixture
+def fake_redis():
+    redis = MagicMock()
+    redis.binary_client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+    with patch("app.api.session_store.get_redis", return_value=redis):
+        yield redis.binary_client
+
+
+def _state(**overrides) -> dict:
+    return {
+        "theme": "dragon",
+        "story_outline": {"chapters": [{"chapter_id": 1, "summary": "x" * 500}]},
+        "finalized_text": {"chapters": [{"chapter_id": 1, "content": "y" * 2000}]},
+        **overrides,
+    }
+
+
+@pytest.mark.asyncio
+class TestSessionStore:
+    """Test session state is written field by field"""
+
+    async def test_round_trip(self, fake_redis):
+        """Test saved state loads back unchanged"""
+        store = SessionStore()
+        await store.save("s1", _state())
+
+        assert await store.load("s1") == _state()
+        assert await fake_redis.type("session:s1") == b"hash"
+        assert await fake_redis.ttl("session:s1") > 0
+
+    async def test_only_changed_fields_are_sent(self, fake_redis):
+        """Test a second save writes just the fields that changed"""
+        store = SessionStore()
+        await store.save("s1", _state())
+        full = store.bytes_written("s1")
+
+        await store.save("s1", _state(theme="unicorn"))
+
+        assert store.bytes_written("s1") - full == len(store.codec.encode("unicorn"))
+        assert (await store.load("s1"))["theme"] == "unicorn"
+
+    async def test_unchanged_state_skips_write(self, fake_redis):
+        """Test saving the same state twice sends nothing"""
+        store = SessionStore()
+        await store.save("s1", _state())
+        written = store.bytes_written("s1")
+
+        await store.save("s1", _state())
+
+        assert store.bytes_written("s1") == written
+
+    async def test_dropped_fields_are_deleted(self, fake_redis):
+        """Test fields missing from the new state are removed"""
+        store = SessionStore()
+        await store.save("s1", _state())
+        state = _state()
+        del state["finalized_text"]
+
+        await store.save("s1", state)
+
+        assert "finalized_text" not in await store.load("s1")
+
+    async def test_new_session_is_written_once(self, fake_redis):
+        """Test the first save after loading a missing session is a single full write"""
+        store = SessionStore()
+        assert await store.load("s1") == {}
+
+        with patch.object(store, "_write_partial", wraps=store._write_partial) as partial:
+            await store.save("s1", _state())
+
+        partial.assert_not_called()
+        assert store.bytes_written("s1") == sum(len(v) for v in store._encode(_state()).values())
+        assert await store.load("s1") == _state()
+
+    async def test_missed_partial_write_is_counted(self, fake_redis):
+        """Test bytes of a partial write to a vanished key count toward the total"""
+        store = SessionStore()
+        await store.save("s1", _state())
+        full = store.bytes_written("s1")
+        await fake_redis.delete("session:s1")
+
+        await store.save("s1", _state(theme="unicorn"))
+
+        encoded = store._encode(_state(theme="unicorn"))
+        assert store.bytes_written("s1") == full + len(encoded["theme"]) + sum(len(v) for v in encoded.values())
+
+    async def test_expired_key_is_rewritten_in_full(self, fake_redis):
+        """Test a partial write to a vanished key falls back to a full write"""
+        store = SessionStore()
+        await store.save("s1", _state())
+        await fake_redis.delete("session:s1")
+
+        await store.save("s1", _state(theme="unicorn"))
+
+        assert await store.load("s1") == _state(theme="unicorn")
+
+    async def test_legacy_string_session(self, fake_redis):
+        """Test sessions saved as one JSON string are read and converted"""
+        await fake_redis.set("session:s1", json.dumps(_state()))
+        store = SessionStore()
+
+        assert await store.load("s1") == _state()
+        await store.save("s1", _state(theme="unicorn"))
+
+        assert await fake_redis.type("session:s1") == b"hash"
+        assert await store.load("s1") == _state(theme="unicorn")
+
+    async def test_update_fields(self, fake_redis):
+        """Test field updates touch only existing sessions"""
+        store = SessionStore()
+        await store.save("s1", _state())
+
+        assert await store.update_fields("s1", {"memory_summary": "A dragon story"})
+        assert not await store.update_fields("missing", {"memory_summary": "A dragon story"})
+
+        assert (await store.load("s1"))["memory_summary"] == "A dragon story"
+        assert not await fake_redis.exists("session:missing")
+
+    async def test_plain_json_fields_are_readable(self, fake_redis):
+        """Test hash fields written as JSON text before the codec header load"""
+        await fake_redis.hset("session:s1", mapping={"theme": json.dumps("dragon"), "chapters": "[]"})
+
+        assert await SessionStore().load("s1") == {"theme": "dragon", "chapters": []}
+
+    async def test_duplicate_chapter_text_is_stored_once(self, fake_redis):
+        """Test text repeated in chapters and finalized_text is written once"""
+        store = SessionStore(codec=Codec("json"))
+        text = "The dragon flew over the quiet kingdom at dawn. " * 20
+        state = {
+            "chapters": [{"chapter_id": 1, "content": text}],
+            "finalized_text": {"chapters": [{"chapter_id": 1, "content": text}]},
+        }
+
+        await store.save("s1", state)
+
+        assert store.bytes_written("s1") < 2 * len(text)
+        assert await fake_redis.hexists("session:s1", SHARED_FIELD)
+        assert await store.load("s1") == state
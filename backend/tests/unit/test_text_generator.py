@@ -1,6 +1,8 @@
 """
 Unit tests for text generation service
 """
+import asyncio
+import threading
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
@@ -10,7 +12,10 @@ from app.services.ai_services.text_generator import (
     NovaGenerator,
     OpenAIGenerator,
     FallbackGenerator,
+    ProviderStats,
     get_text_generator,
+    close_text_generator,
+    _shared_text_generator,
 )
 from app.core.config import settings
 
@@ -34,16 +39,16 @@ class TestNovaGenerator:
     async def test_nova_generate_success(self, mock_chat_bedrock):
         """Test successful text generation with Nova"""
         mock_response = AIMessage(content="Generated story text")
-        mock_client = AsyncMock()
-        mock_client.ainvoke = AsyncMock(return_value=mock_response)
+        mock_client = MagicMock()
+        mock_client.invoke = MagicMock(return_value=mock_response)
         mock_chat_bedrock.return_value = mock_client
         
         generator = NovaGenerator()
         result = await generator.generate("Write a story about a rabbit")
         
         assert result == "Generated story text"
-        mock_client.ainvoke.assert_called_once()
-        call_args = mock_client.ainvoke.call_args
+        mock_client.invoke.assert_called_once()
+        call_args = mock_client.invoke.call_args
         assert isinstance(call_args[0][0], list)
 
     @pytest.mark.asyncio
@@ -51,8 +56,8 @@ class TestNovaGenerator:
     async def test_nova_generate_with_params(self, mock_chat_bedrock):
         """Test generation with temperature and max_tokens"""
         mock_response = AIMessage(content="Generated text")
-        mock_client = AsyncMock()
-        mock_client.ainvoke = AsyncMock(return_value=mock_response)
+        mock_client = MagicMock()
+        mock_client.invoke = MagicMock(return_value=mock_response)
         mock_chat_bedrock.return_value = mock_client
         
         generator = NovaGenerator()
@@ -62,7 +67,7 @@ class TestNovaGenerator:
             max_tokens=500
         )
         
-        call_args = mock_client.ainvoke.call_args
+        call_args = mock_client.invoke.call_args
         assert call_args[1]["temperature"] == 0.9
         assert call_args[1]["max_tokens"] == 500
         assert isinstance(call_args[0][0], list)
@@ -72,8 +77,8 @@ class TestNovaGenerator:
     async def test_nova_extract_content_string(self, mock_chat_bedrock):
         """Test content extraction from string response"""
         mock_response = AIMessage(content="Simple string content")
-        mock_client = AsyncMock()
-        mock_client.ainvoke = AsyncMock(return_value=mock_response)
+        mock_client = MagicMock()
+        mock_client.invoke = MagicMock(return_value=mock_response)
         mock_chat_bedrock.return_value = mock_client
         
         generator = NovaGenerator()
@@ -85,8 +90,8 @@ class TestNovaGenerator:
     async def test_nova_extract_content_list(self, mock_chat_bedrock):
         """Test content extraction from list response"""
         mock_response = AIMessage(content=["Part 1", "Part 2", {"text": "Part 3"}])
-        mock_client = AsyncMock()
-        mock_client.ainvoke = AsyncMock(return_value=mock_response)
+        mock_client = MagicMock()
+        mock_client.invoke = MagicMock(return_value=mock_response)
         mock_chat_bedrock.return_value = mock_client
         
         generator = NovaGenerator()
@@ -100,14 +105,14 @@ class TestNovaGenerator:
     async def test_nova_with_response_format(self, mock_chat_bedrock):
         """Test Nova with response_format uses system message"""
         mock_response = AIMessage(content='{"result": "test"}')
-        mock_client = AsyncMock()
-        mock_client.ainvoke = AsyncMock(return_value=mock_response)
+        mock_client = MagicMock()
+        mock_client.invoke = MagicMock(return_value=mock_response)
         mock_chat_bedrock.return_value = mock_client
         
         generator = NovaGenerator()
         await generator.generate("test", response_format={"type": "json_object"})
         
-        call_args = mock_client.ainvoke.call_args
+        call_args = mock_client.invoke.call_args
         messages = call_args[0][0]
         assert len(messages) == 2
         assert isinstance(messages[0], SystemMessage)
@@ -187,6 +192,19 @@ class TestOpenAIGenerator:
         call_args = mock_client.ainvoke.call_args
         assert call_args[1]["response_format"] == {"type": "json_object"}
 
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.text_generator.ChatOpenAI')
+    async def test_openai_keepalive_pool(self, mock_chat_openai):
+        """Test OpenAI client uses a sized keep-alive pool that aclose releases"""
+        generator = OpenAIGenerator()
+
+        kwargs = mock_chat_openai.call_args[1]
+        assert kwargs["http_async_client"] is generator.http_client
+        assert not generator.http_client.is_closed
+
+        await generator.aclose()
+        assert generator.http_client.is_closed
+
 
 class TestFallbackGenerator:
     """Test FallbackGenerator class"""
@@ -321,6 +339,130 @@ class TestFallbackGenerator:
         
         assert result == "{}"
 
+    @pytest.mark.asyncio
+    async def test_fallback_json_result_returned(self):
+        """Test a valid JSON result from the fallback is returned, not replaced by empty JSON"""
+        primary = MagicMock(spec=TextGenerator)
+        fallback = MagicMock(spec=TextGenerator)
+        primary.generate = AsyncMock(side_effect=Exception("Primary failed"))
+        fallback.generate = AsyncMock(return_value='{"needs_info": false}')
+        
+        generator = FallbackGenerator(primary, fallback)
+        result = await generator.generate("test", response_format={"type": "json_object"})
+        
+        assert result == '{"needs_info": false}'
+
+
+class TestStreaming:
+    """Test token streaming"""
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.text_generator.ChatOpenAI')
+    async def test_openai_generate_stream(self, mock_chat_openai):
+        """Test OpenAI streams chunk contents"""
+        async def astream(messages, **kwargs):
+            for text in ["Once ", "", "upon"]:
+                yield AIMessage(content=text)
+
+        mock_chat_openai.return_value.astream = astream
+
+        generator = OpenAIGenerator()
+        chunks = [c async for c in generator.generate_stream("test", max_tokens=10)]
+
+        assert chunks == ["Once ", "upon"]
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.text_generator.ChatBedrockConverse')
+    async def test_nova_generate_stream(self, mock_chat_bedrock):
+        """Test Nova streams chunk contents from its worker thread"""
+        def stream(messages, **kwargs):
+            for text in ["Once ", "", "upon"]:
+                yield AIMessage(content=text)
+
+        mock_chat_bedrock.return_value.stream = stream
+
+        generator = NovaGenerator()
+        chunks = [c async for c in generator.generate_stream("test", max_tokens=10)]
+
+        assert chunks == ["Once ", "upon"]
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.text_generator.ChatBedrockConverse')
+    async def test_nova_stream_stops_when_caller_leaves(self, mock_chat_bedrock):
+        """Test a Nova stream left by its caller stops reading and is closed"""
+        more = threading.Event()
+        closed = threading.Event()
+        pulled = []
+
+        def stream(messages, **kwargs):
+            try:
+                for text in ["Once ", "upon ", "a ", "time"]:
+                    pulled.append(text)
+                    yield AIMessage(content=text)
+                    more.wait(1)
+            finally:
+                closed.set()
+
+        mock_chat_bedrock.return_value.stream = stream
+
+        generator = NovaGenerator()
+        chunks = generator.generate_stream("test")
+        assert await chunks.__anext__() == "Once "
+        await chunks.aclose()
+        more.set()
+
+        assert await asyncio.to_thread(closed.wait, 1)
+        assert len(pulled) < 4
+
+    @pytest.mark.asyncio
+    async def test_default_stream_yields_full_text(self):
+        """Test base implementation yields generate() as one chunk"""
+        primary = MagicMock(spec=TextGenerator)
+        primary.generate = AsyncMock(return_value="whole text")
+
+        chunks = [c async for c in TextGenerator.generate_stream(primary, "test")]
+
+        assert chunks == ["whole text"]
+
+    @pytest.mark.asyncio
+    async def test_fallback_stream_before_first_token(self):
+        """Test fallback takes over when primary fails before streaming"""
+        async def failing_stream(*args, **kwargs):
+            raise RuntimeError("throttled")
+            yield
+
+        async def ok_stream(*args, **kwargs):
+            yield "Hello"
+
+        primary = MagicMock(spec=TextGenerator)
+        fallback = MagicMock(spec=TextGenerator)
+        primary.generate_stream = failing_stream
+        fallback.generate_stream = ok_stream
+
+        generator = FallbackGenerator(primary, fallback)
+        chunks = [c async for c in generator.generate_stream("test")]
+
+        assert chunks == ["Hello"]
+
+    @pytest.mark.asyncio
+    async def test_fallback_stream_fails_mid_stream(self):
+        """Test mid-stream failures are raised instead of mixing providers"""
+        async def broken_stream(*args, **kwargs):
+            yield "Hel"
+            raise RuntimeError("connection reset")
+
+        primary = MagicMock(spec=TextGenerator)
+        fallback = MagicMock(spec=TextGenerator)
+        primary.generate_stream = broken_stream
+
+        generator = FallbackGenerator(primary, fallback)
+        chunks = []
+        with pytest.raises(RuntimeError, match="connection reset"):
+            async for chunk in generator.generate_stream("test"):
+                chunks.append(chunk)
+
+        assert chunks == ["Hel"]
+
 
 class TestGetTextGenerator:
     """Test get_text_generator factory function"""
@@ -357,10 +499,164 @@ class TestGetTextGenerator:
         mock_openai_instance = MagicMock()
         mock_nova.return_value = mock_nova_instance
         mock_openai.return_value = mock_openai_instance
+        _shared_text_generator.cache_clear()
         
         generator = get_text_generator()
+        _shared_text_generator.cache_clear()
         
         assert isinstance(generator, FallbackGenerator)
         assert generator.primary == mock_nova_instance
         assert generator.fallback == mock_openai_instance
 
+    @patch('app.services.ai_services.text_generator.settings')
+    @patch('app.services.ai_services.text_generator.NovaGenerator')
+    @patch('app.services.ai_services.text_generator.OpenAIGenerator')
+    def test_get_text_generator_singleton(self, mock_openai, mock_nova, mock_settings):
+        """Test that clients are created once per process"""
+        mock_settings.AWS_ACCESS_KEY = "test_key"
+        mock_settings.AWS_SECRET_KEY = "test_secret"
+        mock_settings.OPENAI_API_KEY = "test_openai_key"
+        _shared_text_generator.cache_clear()
+
+        try:
+            assert get_text_generator() is get_text_generator()
+            assert mock_nova.call_count == 1
+            assert mock_openai.call_count == 1
+        finally:
+            _shared_text_generator.cache_clear()
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.text_generator.settings')
+    @patch('app.services.ai_services.text_generator.NovaGenerator')
+    @patch('app.services.ai_services.text_generator.OpenAIGenerator')
+    async def test_close_text_generator(self, mock_openai, mock_nova, mock_settings):
+        """Test that closing releases both provider pools"""
+        mock_settings.AWS_ACCESS_KEY = "test_key"
+        mock_settings.AWS_SECRET_KEY = "test_secret"
+        mock_settings.OPENAI_API_KEY = "test_openai_key"
+        mock_nova.return_value.aclose = AsyncMock()
+        mock_openai.return_value.aclose = AsyncMock()
+        _shared_text_generator.cache_clear()
+
+        get_text_generator()
+        await close_text_generator()
+
+        mock_nova.return_value.aclose.assert_called_once()
+        mock_openai.return_value.aclose.assert_called_once()
+        assert _shared_text_generator.cache_info().currsize == 0
+
+
+
+class TestProviderRouting:
+    """Test latency-aware routing and hedged requests"""
+
+    @pytest.mark.asyncio
+    async def test_prefers_faster_provider(self):
+        """Test the fallback is tried first once it is clearly faster"""
+        primary = MagicMock(spec=TextGenerator)
+        fallback = MagicMock(spec=TextGenerator)
+        primary.generate = AsyncMock(return_value="Primary result")
+        fallback.generate = AsyncMock(return_value="Fallback result")
+
+        generator = FallbackGenerator(primary, fallback)
+        for _ in range(10):
+            generator._stats(primary).record(3.0, True)
+            generator._stats(fallback).record(1.0, True)
+
+        assert await generator.generate("test") == "Fallback result"
+        primary.generate.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_keeps_primary_without_samples(self):
+        generator = FallbackGenerator(MagicMock(spec=TextGenerator), MagicMock(spec=TextGenerator))
+        assert generator._ordered() == (generator.primary, generator.fallback)
+
+    def test_provider_stats(self):
+        stats = ProviderStats(window=4)
+        for latency in (1.0, 2.0, 3.0, 4.0, 5.0):
+            stats.record(latency, True)
+        stats.record(9.0, False)
+
+        assert stats.samples == 4
+        assert stats.error_rate == 0.25
+        assert stats.percentile(0.5) == 4.0
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.text_generator.settings')
+    async def test_hedge_slow_primary(self, mock_settings):
+        """Test a slow primary is raced by the fallback and cancelled"""
+        mock_settings.TEXT_HEDGING = True
+        mock_settings.TEXT_LATENCY_ROUTING = False
+        mock_settings.TEXT_HEDGE_PERCENTILE = 0.95
+        mock_settings.TEXT_HEDGE_MIN_DELAY = 0.01
+        mock_settings.TEXT_ROUTING_MIN_SAMPLES = 10
+        mock_settings.TEXT_STATS_WINDOW = 50
+        cancelled = asyncio.Event()
+
+        async def slow_generate(*args, **kwargs):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        primary = MagicMock(spec=TextGenerator)
+        fallback = MagicMock(spec=TextGenerator)
+        primary.generate = slow_generate
+        fallback.generate = AsyncMock(return_value="Fallback result")
+
+        generator = FallbackGenerator(primary, fallback)
+        result = await asyncio.wait_for(generator.generate("test"), timeout=1)
+
+        assert result == "Fallback result"
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        # The cancelled call is neither an error nor a latency sample
+        assert generator._stats(primary).samples == 0
+        assert generator._stats(primary).percentile(0.5) is None
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.text_generator.settings')
+    async def test_no_hedge_for_uncancellable_provider(self, mock_settings):
+        """Test a slow provider that can't be cancelled is not raced"""
+        mock_settings.TEXT_HEDGING = True
+        mock_settings.TEXT_LATENCY_ROUTING = False
+        mock_settings.TEXT_HEDGE_PERCENTILE = 0.95
+        mock_settings.TEXT_HEDGE_MIN_DELAY = 0.01
+        mock_settings.TEXT_ROUTING_MIN_SAMPLES = 10
+        mock_settings.TEXT_STATS_WINDOW = 50
+
+        async def slow_generate(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            return "Primary result"
+
+        primary = MagicMock(spec=TextGenerator)
+        fallback = MagicMock(spec=TextGenerator)
+        primary.cancellable = False
+        primary.generate = slow_generate
+        fallback.generate = AsyncMock(return_value="Fallback result")
+
+        generator = FallbackGenerator(primary, fallback)
+
+        assert await generator.generate("test") == "Primary result"
+        fallback.generate.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch('app.services.ai_services.text_generator.settings')
+    async def test_hedge_fast_primary(self, mock_settings):
+        """Test a fast primary never starts the fallback"""
+        mock_settings.TEXT_HEDGING = True
+        mock_settings.TEXT_LATENCY_ROUTING = False
+        mock_settings.TEXT_HEDGE_PERCENTILE = 0.95
+        mock_settings.TEXT_HEDGE_MIN_DELAY = 1.0
+        mock_settings.TEXT_ROUTING_MIN_SAMPLES = 10
+        mock_settings.TEXT_STATS_WINDOW = 50
+
+        primary = MagicMock(spec=TextGenerator)
+        fallback = MagicMock(spec=TextGenerator)
+        primary.generate = AsyncMock(return_value="Primary result")
+        fallback.generate = AsyncMock(return_value="Fallback result")
+
+        generator = FallbackGenerator(primary, fallback)
+
+        assert await generator.generate("test") == "Primary result"
+        fallback.generate.assert_not_called()
@@ -11,6 +11,7 @@ import { useEffect, useRef, useState, useCallback } from 'react';
 export type WebSocketEventType = 
     | 'session_ready'
     | 'agent_started'
+    | 'chapter_delta'
     | 'chat_response'
     | 'finalizer_text'
     | 'finalizer_image'
@@ -26,6 +27,9 @@ export interface WebSocketMessage {
     data: Record<string, any>;
 }
 
+// Events the server doesn't keep for replay (its UNLOGGED_EVENTS); resuming from one replays the whole run
+const UNLOGGED_EVENTS: ReadonlySet<WebSocketEventType> = new Set(['session_ready', 'chapter_delta']);
+
 export type WebSocketStatus = 'connecting' | 'connected' | 'disconnected' | 'error';
 
 export type WebSocketEventHandler = (message: WebSocketMessage) => void;
@@ -68,13 +72,17 @@ export const useWebSocket = (options: UseWebSocketOptions) => {
     const reconnectAttemptsRef = useRef(0);
     const reconnectTimerRef = useRef<NodeJS.Timeout | null>(null);
     const isManualCloseRef = useRef(false);
+    // Last event received, sent on reconnect so the server replays what was missed
+    const lastEventIdRef = useRef<string | null>(null);
 
     /* =========================
        WebSocket URL Builder
     ========================= */
 
     const buildWebSocketUrl = useCallback((sid: string): string => {
-        return getWebSocketUrl(sid);
+        const url = getWebSocketUrl(sid);
+        const lastEventId = lastEventIdRef.current;
+        return lastEventId ? `${url}?last_event_id=${encodeURIComponent(lastEventId)}` : url;
     }, []);
 
     /* =========================
@@ -116,6 +124,9 @@ export const useWebSocket = (options: UseWebSocketOptions) => {
                 try {
                     const message: WebSocketMessage = JSON.parse(event.data);
                     console.log('Received message:', message.type, message.data);
+                    if (!UNLOGGED_EVENTS.has(message.type) && message.event_id) {
+                        lastEventIdRef.current = message.event_id;
+                    }
                     onMessage?.(message);
                 } catch (error) {
                     console.error('Error parsing WebSocket message:', error);
@@ -208,6 +219,7 @@ export const useWebSocket = (options: UseWebSocketOptions) => {
         }
 
         console.log('useWebSocket: sessionId available, connecting...', sessionId);
+        lastEventIdRef.current = null;
         connect();
 
         return () => {
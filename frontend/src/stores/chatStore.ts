@@ -40,6 +40,7 @@ export type Chapter = {
     text: string;
     image_url?: string;
     image_prompt?: string;
+    stream_index?: number; // Index of the last chapter_delta applied while the text streams in
 };
 
 export type StoryOutline = {
@@ -85,6 +86,7 @@ interface ChatState {
     setWsConnected: (connected: boolean) => void;
     setChapters: (chapters: Chapter[]) => void;
     updateChapters: (chapters: Chapter[]) => void;
+    appendChapterDelta: (chapterId: number, index: number, delta: string) => void;
     setStoryOutline: (outline: StoryOutline | null) => void;
     setNeedsInfo: (needsInfo: NeedsInfo | null) => void;
     handleWebSocketEvent: (eventType: string, data: Record<string, any>, timestamp?: number) => void;
@@ -226,6 +228,27 @@ export const useChatStore = create<ChatState>()(
                 return { chapters: updated };
             }),
 
+            appendChapterDelta: (chapterId, index, delta) => set((state) => {
+                const existing = state.chapters.find((c) => c.chapter_id === chapterId);
+                // Replayed or already merged deltas; gaps are fine, finalizer_text brings the full text
+                if (existing && index > 0 && existing.stream_index !== undefined && index <= existing.stream_index) {
+                    return {};
+                }
+                const chapter: Chapter = {
+                    chapter_id: chapterId,
+                    title: existing?.title || `Chapter ${chapterId}`,
+                    // Index 0 starts the chapter over (text left from a previous story is replaced)
+                    text: index === 0 || !existing ? delta : existing.text + delta,
+                    image_url: index === 0 ? undefined : existing?.image_url,
+                    image_prompt: existing?.image_prompt,
+                    stream_index: index,
+                };
+                const updated = existing
+                    ? state.chapters.map((c) => (c.chapter_id === chapterId ? chapter : c))
+                    : [...state.chapters, chapter].sort((a, b) => a.chapter_id - b.chapter_id);
+                return { chapters: updated };
+            }),
+
             setStoryOutline: (outline) => set({ storyOutline: outline }),
 
             setNeedsInfo: (needsInfo) => set({ needsInfo }),
@@ -295,6 +318,13 @@ export const useChatStore = create<ChatState>()(
                         }
                         break;
 
+                    case 'chapter_delta':
+                        // Streamed chapter text; words show up before finalizer_text
+                        if (typeof data.chapter_id === 'number' && typeof data.delta === 'string') {
+                            get().appendChapterDelta(data.chapter_id, data.index ?? 0, data.delta);
+                        }
+                        break;
+
                     case 'chat_response':
                         get().addMessage('assistant', data.response || '');
                         const chatMessages = get().messages;
@@ -401,6 +431,10 @@ export const useChatStore = create<ChatState>()(
                             // Already handled by needs_info event
                             break;
                         }
+                        if (data.status === 'cancelled') {
+                            get().addLog('Generation cancelled', 'warning', logTimestamp);
+                            break;
+                        }
                         if (workflowBranch === 'story-graph') {
                             get().addLog('Story generation completed', 'success', logTimestamp);
                             get().updateAgentStep('planning', 'completed');
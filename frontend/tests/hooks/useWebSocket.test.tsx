@@ -333,6 +333,33 @@ describe('useWebSocket Hook', () => {
             }, { timeout: 2000 });
         });
 
+        it('should resume from the last replayable event, not streamed deltas', async () => {
+            const { result } = renderHook(() =>
+                useWebSocket({
+                    sessionId: 'test-session',
+                    autoReconnect: true,
+                    reconnectInterval: 50,
+                })
+            );
+
+            await waitFor(() => {
+                expect(result.current.isConnected).toBe(true);
+            });
+
+            const receive = (message: Partial<WebSocketMessage>) =>
+                mockWebSocket.onmessage?.({ data: JSON.stringify(message) } as MessageEvent);
+            receive({ event_id: 'e1', type: 'agent_started', data: { agent: 'writer' } });
+            receive({ event_id: 'd1', type: 'chapter_delta', data: { chapter_id: 1, index: 0, delta: 'Once' } });
+
+            mockWebSocket.readyState = mockWebSocket.CLOSED;
+            mockWebSocket.onclose?.({ code: 1006, reason: 'Connection lost', wasClean: false } as CloseEvent);
+
+            await waitFor(() => {
+                expect((global as any).WebSocket).toHaveBeenCalledTimes(2);
+            }, { timeout: 1000 });
+            expect((global as any).WebSocket.mock.calls[1][0]).toContain('last_event_id=e1');
+        });
+
         it('should not reconnect when manually closed', async () => {
             const { result } = renderHook(() =>
                 useWebSocket({
@@ -219,6 +219,32 @@ describe('ChatStore', () => {
             expect(messages[0].storyChapters?.[1].chapter_id).toBe(2);
         });
 
+        it('should append chapter_delta events to the chapter text', () => {
+            const { handleWebSocketEvent } = useChatStore.getState();
+            handleWebSocketEvent('chapter_delta', { chapter_id: 2, index: 0, delta: 'Once ' });
+            handleWebSocketEvent('chapter_delta', { chapter_id: 1, index: 0, delta: 'The dragon ' });
+            handleWebSocketEvent('chapter_delta', { chapter_id: 2, index: 1, delta: 'upon a time' });
+            // Replayed delta is ignored
+            handleWebSocketEvent('chapter_delta', { chapter_id: 2, index: 1, delta: 'upon a time' });
+
+            const chapters = useChatStore.getState().chapters;
+            expect(chapters.map((ch) => ch.chapter_id)).toEqual([1, 2]);
+            expect(chapters[0].text).toBe('The dragon ');
+            expect(chapters[1].text).toBe('Once upon a time');
+        });
+
+        it('should restart a chapter on its first delta and keep finalized text', () => {
+            const { handleWebSocketEvent } = useChatStore.getState();
+            useChatStore.getState().setChapters([{ chapter_id: 1, title: 'Old', text: 'Old story', image_url: 'old.png' }]);
+
+            handleWebSocketEvent('chapter_delta', { chapter_id: 1, index: 0, delta: 'New ' });
+            expect(useChatStore.getState().chapters[0].text).toBe('New ');
+            expect(useChatStore.getState().chapters[0].image_url).toBeUndefined();
+
+            handleWebSocketEvent('finalizer_text', { chapters: [{ chapter_id: 1, title: 'New', content: 'New story.' }] });
+            expect(useChatStore.getState().chapters[0].text).toBe('New story.');
+        });
+
         it('should handle finalizer_image event and update chapters', () => {
             // First add text message with chapters
             const textChapters = [